@@ -30,6 +30,7 @@ import yaml
 from uaperrors import UAPError
 from connections_collector import ConnectionsCollector
 import command as command_info
+import fscache
 import misc
 import process_pool
 import pipeline_info
@@ -46,6 +47,7 @@ class AbstractStep(object):
     PING_TIMEOUT = 300
     PING_RENEW = 30
     VOLATILE_SUFFIX = '.volatile.placeholder.yaml'
+    STAGING_SUFFIX = '.uap-staging'
     UNDERSCORE_OPTIONS = [
         '_depends',
         '_volatile',
@@ -56,7 +58,28 @@ class AbstractStep(object):
         '_cluster_submit_options',
         '_cluster_pre_job_command',
         '_cluster_post_job_command',
-        '_cluster_job_quota']
+        '_cluster_job_quota',
+        '_cluster_tasks_per_job',
+        '_cluster_parallel_tasks',
+        '_parallel_exec_groups']
+
+    COMPRESSION_SUFFIXES = {
+        'gzip': '.gz',
+        'bgzf': '.gz',
+        'zstd': '.zst',
+        'plain': ''}
+    '''
+    File name suffixes of the formats of *get_compress_command()*.
+    '''
+
+    COMPRESSION_TOOLS = {
+        'gzip': 'pigz',
+        'bgzf': 'bgzip',
+        'zstd': 'zstd',
+        'plain': 'cat'}
+    '''
+    Tools which (de)compress the formats of *get_compress_command()*.
+    '''
 
     states = misc.Enum(['DEFAULT', 'EXECUTING'])
 
@@ -217,11 +240,14 @@ class AbstractStep(object):
                 self._options[key] = info['default']
 
         self._options.setdefault('_volatile', False)
+        self._options.setdefault('_parallel_exec_groups', False)
 
         for i in ['_cluster_submit_options', '_cluster_pre_job_command',
                   '_cluster_post_job_command']:
             self._options.setdefault(i, '')
         self._options.setdefault('_cluster_job_quota', 0)
+        self._options.setdefault('_cluster_tasks_per_job', 1)
+        self._options.setdefault('_cluster_parallel_tasks', 1)
         self._options.setdefault('_pattern', '(.*)')
         self._options.setdefault('_replacement', r'\1')
 
@@ -368,31 +394,53 @@ class AbstractStep(object):
         # get run_info objects
         with self.get_run(run_id) as run:
             logger.info("Run ID: %s" % run_id)
-            # for each exec_group in that run ...
-            for exec_group in run.get_exec_groups():
-                # ... create a process pool
+            exec_groups = run.get_exec_groups()
+            if not self._options['_parallel_exec_groups']:
+                # for each exec_group in that run ...
+                for exec_group in exec_groups:
+                    # ... create a process pool
+                    with process_pool.ProcessPool(run) as pool:
+                        # Clean up (use last ProcessPool for that)
+                        if exec_group == exec_groups[-1]:
+                            logger.info("Telling pipeline to clean up!")
+                            pool.clean_up_temp_paths()
+                        self.launch_exec_group(pool, exec_group)
+            elif exec_groups:
+                # exec groups which share no paths run concurrently
+                dependencies = run.get_exec_group_dependencies()
                 with process_pool.ProcessPool(run) as pool:
-                    # Clean up (use last ProcessPool for that)
-                    if exec_group == run.get_exec_groups()[-1]:
-                        logger.info("Telling pipeline to clean up!")
-                        pool.clean_up_temp_paths()
-
-                    for poc in exec_group.get_pipes_and_commands():
-                        # for each pipe or command (poc)
-                        # check if it is a pipeline ...
-                        if isinstance(poc, pipeline_info.PipelineInfo):
-                            # ... create a pipeline ...
-                            with pool.Pipeline(pool) as pipeline:
-                                for command in poc.get_commands():
-                                    pipeline.append(
-                                        command.get_command(),
-                                        stdout_path=command.get_stdout_path(),
-                                        stderr_path=command.get_stderr_path())
-                        elif isinstance(poc, command_info.CommandInfo):
-                            pool.launch(
-                                poc.get_command(),
-                                stdout_path=poc.get_stdout_path(),
-                                stderr_path=poc.get_stderr_path())
+                    logger.info("Telling pipeline to clean up!")
+                    pool.clean_up_temp_paths()
+                    for index, exec_group in enumerate(exec_groups):
+                        logger.debug("Exec group %d waits for %s." %
+                                     (index, sorted(dependencies[index])))
+                        pool.add_group(index, dependencies[index])
+                        self.launch_exec_group(pool, exec_group, index)
+
+    def launch_exec_group(self, pool, exec_group, group=None):
+        '''
+        Add the commands and pipelines of *exec_group* to the process *pool*.
+        '''
+        for poc in exec_group.get_pipes_and_commands():
+            # for each pipe or command (poc)
+            # check if it is a pipeline ...
+            if isinstance(poc, pipeline_info.PipelineInfo):
+                # ... create a pipeline ...
+                with pool.Pipeline(pool, cores=poc.get_cores(), group=group,
+                                   stdin_path=poc.get_stdin_path()) \
+                        as pipeline:
+                    for command in poc.get_launch_commands():
+                        pipeline.append(
+                            command.get_command(),
+                            stdout_path=command.get_stdout_path(),
+                            stderr_path=command.get_stderr_path())
+            elif isinstance(poc, command_info.CommandInfo):
+                pool.launch(
+                    poc.get_command(),
+                    stdout_path=poc.get_stdout_path(),
+                    stderr_path=poc.get_stderr_path(),
+                    cores=poc.get_cores(),
+                    group=group)
 
     def get_runs(self):
         '''
@@ -440,7 +488,7 @@ class AbstractStep(object):
 
     def reset_run_caches(self):
         for run in self.get_runs().values():
-            run.fsc.clear()
+            run.reset_fsc()
 
     def get_run_ids(self):
         '''
@@ -532,7 +580,7 @@ class AbstractStep(object):
 
         # create a temporary directory for the output files
         temp_directory = run.get_temp_output_directory()
-        os.makedirs(temp_directory)
+        run.create_temp_output_directory()
 
         # prepare known_paths
         known_paths = dict()
@@ -705,9 +753,45 @@ class AbstractStep(object):
                 m = "Recived signal %s during hashing!" % \
                     process_pool.ProcessPool.SIGNAL_NAMES[signum]
                 super(SignalError, self).__init__(m)
-        if caught_exception is None and to_be_moved:
-            p.notify("[INFO] %s/%s hashing %d output file(s)." %
-                     (str(self), run_id, len(to_be_moved)))
+        to_be_hashed = list()
+        # outputs in a scratch directory are copied to the output directory
+        # and hashed on the way
+        staging = run.get_scratch_directory() is not None
+        if caught_exception is None:
+            for path in to_be_moved.keys():
+                hashsum = None
+                if fscache.FSCache.hash_index is not None and not staging:
+                    # outputs written from stdout were hashed on the way
+                    stat_result = os.stat(path)
+                    hashsum = fscache.FSCache.hash_index.get_sha256(
+                        stat_result)
+                    lines = fscache.FSCache.hash_index.get_line_count(
+                        stat_result)
+                    # copies have the checksum of their source
+                    copy_source = run.get_copy_source(path)
+                    if hashsum is None and copy_source is not None:
+                        try:
+                            source_stat = os.stat(copy_source)
+                        except OSError:
+                            source_stat = None
+                        if source_stat is not None and \
+                                source_stat.st_size == stat_result.st_size:
+                            hashsum = fscache.FSCache.hash_index.get_sha256(
+                                source_stat)
+                            lines = fscache.FSCache.hash_index.get_line_count(
+                                source_stat)
+                if hashsum is None:
+                    to_be_hashed.append(path)
+                else:
+                    known_paths[to_be_moved[path]]['sha256'] = hashsum
+                    if lines is not None:
+                        known_paths[to_be_moved[path]]['lines'] = lines
+                    logger.info("sha256 (already known) %s %s" %
+                                (hashsum, path))
+        if caught_exception is None and to_be_hashed:
+            p.notify("[INFO] %s/%s %s %d output file(s)." %
+                     (str(self), run_id, 'staging' if staging else 'hashing',
+                      len(to_be_hashed)))
             if p.has_interactive_shell() \
                     and logger.getEffectiveLevel() > 20:
                 show_progress = True
@@ -719,8 +803,16 @@ class AbstractStep(object):
                 original_term_handler = signal.signal(signal.SIGTERM, stop)
                 original_int_handler = signal.signal(signal.SIGINT, stop)
                 pool = multiprocessing.Pool(self.get_cores())
-                total = len(to_be_moved)
-                file_iter = pool.imap(misc.sha_and_file, to_be_moved.keys())
+                total = len(to_be_hashed)
+                if staging:
+                    suffix = AbstractStep.STAGING_SUFFIX
+                    file_iter = pool.imap(
+                        misc.copy_sha_lines_and_file,
+                        [(path, to_be_moved[path] + suffix)
+                         for path in to_be_hashed])
+                else:
+                    file_iter = pool.imap(misc.sha_lines_and_file,
+                                          to_be_hashed)
                 file_iter = tqdm(
                     file_iter,
                     total=total,
@@ -728,9 +820,10 @@ class AbstractStep(object):
                     bar_format='{desc}:{percentage:3.0f}%|{bar:10}{r_bar}',
                     disable=not show_progress,
                     desc='files')
-                for i, (hashsum, path) in enumerate(file_iter):
-                    run.fsc.sha256sum_of(to_be_moved[path], value=hashsum)
+                for i, (hashsum, lines, path) in enumerate(file_iter):
                     known_paths[to_be_moved[path]]['sha256'] = hashsum
+                    if lines is not None:
+                        known_paths[to_be_moved[path]]['lines'] = lines
                     if not show_progress:
                         logger.info("sha256 [%d/%d] %s %s" %
                                     (i + 1, total, hashsum, path))
@@ -757,10 +850,27 @@ class AbstractStep(object):
             try:
                 for source_path, new_path in to_be_moved.items():
                     logger.debug("Moving %s to %s." % (source_path, new_path))
-                    os.rename(source_path, new_path)
+                    if staging:
+                        os.rename(new_path + AbstractStep.STAGING_SUFFIX,
+                                  new_path)
+                        os.unlink(source_path)
+                    else:
+                        os.rename(source_path, new_path)
+                    run.fsc.sha256sum_of(
+                        new_path, value=known_paths[new_path]['sha256'],
+                        lines=known_paths[new_path].get('lines'))
+                if fscache.FSCache.hash_index is not None:
+                    fscache.FSCache.hash_index.flush()
             except BaseException:
                 caught_exception = sys.exc_info()
 
+        if staging and (p.caught_signal or caught_exception):
+            for new_path in to_be_moved.values():
+                try:
+                    os.unlink(new_path + AbstractStep.STAGING_SUFFIX)
+                except OSError:
+                    pass
+
         error = None
         if p.caught_signal is not None:
             signum = p.caught_signal
@@ -794,7 +904,7 @@ class AbstractStep(object):
         else:
             # finally, remove the temporary directory if it's empty
             try:
-                os.rmdir(temp_directory)
+                run.remove_temp_output_directory()
             except OSError as e:
                 logger.info('Coult not remove temp dir "%s": %s' %
                             (temp_directory, e))
@@ -853,6 +963,136 @@ class AbstractStep(object):
         '''
         return {' '.join(path): tool for tool, path in self._tools.items()}
 
+    @staticmethod
+    def get_compression_format(path):
+        """
+        Return the compression format of *path* (gzip, bgzf, zstd or plain)
+        from its magic bytes or, while the file does not exist yet, from its
+        file name suffix.
+        """
+        if os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    header = f.read(18)
+            except IOError:
+                header = None
+            if header is not None:
+                if header[:4] == b'\x28\xb5\x2f\xfd':
+                    return 'zstd'
+                if header[:2] == b'\x1f\x8b':
+                    # BGZF blocks are gzip members with a BC extra field
+                    if len(header) >= 14 and header[3] & 4 and \
+                            header[12:14] == b'BC':
+                        return 'bgzf'
+                    return 'gzip'
+                return 'plain'
+        suffix = os.path.splitext(path)[1]
+        if suffix in ['.gz', '.gzip']:
+            return 'gzip'
+        if suffix == '.zst':
+            return 'zstd'
+        return 'plain'
+
+    def get_decompressor_format(self, format):
+        """
+        Return the format whose tool decompresses *format* among the tools
+        the step requires. gzip and BGZF files are read by pigz and bgzip
+        alike, so the tool of the other format is used if only that one is
+        required.
+        """
+        if format not in AbstractStep.COMPRESSION_TOOLS:
+            raise UAPError("Unknown compression format %s." % format)
+        candidates = [format]
+        if format == 'bgzf':
+            candidates.append('gzip')
+        elif format == 'gzip':
+            candidates.append('bgzf')
+        for candidate in candidates:
+            if AbstractStep.COMPRESSION_TOOLS[candidate] in self._tools:
+                return candidate
+        return format
+
+    def get_decompress_command(self, path=None, cores=None, format=None,
+                               blocksize=None):
+        """
+        Return a command which writes the file *path* uncompressed to stdout
+        using *cores* threads (default: the cores of the step). The format
+        is detected from *path* unless *format* is given, in which case
+        *path* may also be used only to detect the format of stdin, e.g.
+        ``format=self.get_compression_format(path)``. Without *path*, stdin
+        is read. *blocksize* is passed to pigz. Requires
+        *self.require_tool()* of the tool of the format in
+        *COMPRESSION_TOOLS*, e.g. pigz for gzip, see
+        *get_decompressor_format()*.
+        """
+        if format is None:
+            format = 'plain' if path is None \
+                else self.get_compression_format(path)
+        format = self.get_decompressor_format(format)
+        cores = str(cores or self.get_cores())
+        command = [self.get_tool(AbstractStep.COMPRESSION_TOOLS[format])]
+        if format == 'gzip':
+            command.extend(['--decompress', '--processes', cores])
+            if blocksize is not None:
+                command.extend(['--blocksize', str(blocksize)])
+            command.append('--stdout')
+        elif format == 'bgzf':
+            command.extend(['--decompress', '--threads', cores, '--stdout'])
+        elif format == 'zstd':
+            command.extend(['--decompress', '-T%s' % cores, '--stdout'])
+        if path is not None:
+            command.append(path)
+        return command
+
+    def get_compress_command(self, format='gzip', level=None, cores=None,
+                             blocksize=None, path=None):
+        """
+        Return a command which compresses the file *path*, or stdin without
+        *path*, to stdout in *format* (gzip, bgzf, zstd or plain) at *level*
+        using *cores* threads (default: the cores of the step). *blocksize*
+        is passed to pigz.
+        Requires *self.require_tool()* of the tool of the format in
+        *COMPRESSION_TOOLS*. BGZF is written by concat_gzip if the step
+        requires it but not bgzip.
+        """
+        if format not in AbstractStep.COMPRESSION_TOOLS:
+            raise UAPError("Unknown compression format %s." % format)
+        cores = str(cores or self.get_cores())
+        if format == 'bgzf' and 'bgzip' not in self._tools \
+                and 'concat_gzip' in self._tools:
+            command = [self.get_tool('concat_gzip'), '--bgzf',
+                       '--threads', cores]
+            if level is not None:
+                command.extend(['--level', str(level)])
+            command.extend(['--output', '-', path or '-'])
+            return command
+        command = [self.get_tool(AbstractStep.COMPRESSION_TOOLS[format])]
+        if format == 'gzip':
+            command.extend(['--processes', cores])
+            if blocksize is not None:
+                command.extend(['--blocksize', str(blocksize)])
+            command.append('--stdout')
+        elif format == 'bgzf':
+            command.extend(['--threads', cores, '--stdout'])
+        elif format == 'zstd':
+            command.extend(['-T%s' % cores, '--stdout'])
+        if level is not None and format == 'bgzf':
+            command.extend(['--compress-level', str(level)])
+        elif level is not None and format != 'plain':
+            command.append('-%d' % level)
+        if path is not None:
+            command.append(path)
+        return command
+
+    @staticmethod
+    def get_compression_suffix(format):
+        """
+        Return the file name suffix of *format*, e.g. '.gz' for gzip.
+        """
+        if format not in AbstractStep.COMPRESSION_SUFFIXES:
+            raise UAPError("Unknown compression format %s." % format)
+        return AbstractStep.COMPRESSION_SUFFIXES[format]
+
     @property
     def used_tools(self):
         return set(self._tools.keys())
@@ -887,7 +1127,7 @@ class AbstractStep(object):
                     try:
                         state = run.get_state(do_hash=do_hash)
                     except Exception:
-                        run.fsc.clear()
+                        run.reset_fsc()
                         retries -= 1
                         continue
                     break
@@ -1122,17 +1362,25 @@ class AbstractStep(object):
 
     def find_upstream_info_for_input_paths_as_set(self, input_paths,
                                                   key, expected=1):
-        task_ids = set()
+        task_ids = dict()
         for path in input_paths:
-            task_ids.add(self.get_pipeline().task_id_for_output_file[path])
+            task_ids.setdefault(
+                self.get_pipeline().task_id_for_output_file[path],
+                list()).append(path)
         results = set()
-        for task_id in task_ids:
+        for task_id, paths in task_ids.items():
             task = self.get_pipeline().task_for_task_id[task_id]
             step = task.step
             run_id = task.run_id
             run = step._runs[run_id]
             if run.has_public_info(key):
-                results.add(run.get_public_info(key))
+                value = run.get_public_info(key)
+                if isinstance(value, dict):
+                    # information given per output file
+                    results |= set(value[path] for path in paths
+                                   if path in value)
+                else:
+                    results.add(value)
             results |= self.find_upstream_info_for_input_paths_as_set(
                 task.input_files(), key, None)
 
@@ -1147,7 +1395,8 @@ class AbstractStep(object):
         """
         Find a piece of public information in all upstream steps. If the
         information is not found or defined in more than one upstream step,
-        this will crash.
+        this will crash. Information stored as a dictionary by output path is
+        looked up for the *input_paths*.
         """
 
         result = self.find_upstream_info_for_input_paths_as_set(
@@ -51,12 +51,14 @@ def quote(cmd_args):
 
 
 class CommandInfo(object):
-    def __init__(self, eop, command, stdout_path=None, stderr_path=None):
+    def __init__(self, eop, command, stdout_path=None, stderr_path=None,
+                 cores=None):
         # eop = exec_group or pipeline
         self._eop = eop
         self._command = list()
         self._stdout_path = stdout_path
         self._stderr_path = stderr_path
+        self._cores = cores
         self._tool = str
         self._output_files_per_connection = dict()
 
@@ -102,6 +104,12 @@ class CommandInfo(object):
     def get_stderr_path(self):
         return self._stderr_path
 
+    def get_cores(self):
+        '''
+        Returns the number of cores the command uses or None if not given.
+        '''
+        return self._cores
+
     @abs2rel_path
     def get_command(self):
         return self._command
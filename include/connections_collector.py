@@ -128,14 +128,22 @@ class ConnectionsCollector(object):
         # make the connections
         used_conns = set()
         for parent_run_id in parent.get_runs():
-            self.switch_run_id(parent_run_id)
             parent_run = parent.get_run(parent_run_id)
+            if not parent_run.has_child_run_ids():
+                self.switch_run_id(parent_run_id)
             for in_conn, out_conn, parent_con in make_connections:
                 if out_conn not in parent_run.get_out_connections():
                     continue
                 output_files = parent_run\
                     .get_output_files_abspath_for_out_connection(out_conn)
-                self.add_connection(in_conn, output_files)
+                # files may be passed on as files of other runs
+                files_by_run_id = {parent_run_id: list()} \
+                    if not output_files else dict()
+                for path in output_files:
+                    run_id = parent_run.get_child_run_id(path)
+                    files_by_run_id.setdefault(run_id, list()).append(path)
+                for run_id, files in files_by_run_id.items():
+                    self.add_connection(in_conn, files, run_id)
                 used_conns.add(parent_con)
 
         missing = must_connect - used_conns
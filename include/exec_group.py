@@ -22,16 +22,19 @@ class ExecGroup(object):
     def __exit__(self, type, value, traceback):
         pass
 
-    def add_pipeline(self):
-        pipeline = pipeline_info.PipelineInfo(self)
+    def add_pipeline(self, cores=None, stdin_path=None):
+        pipeline = pipeline_info.PipelineInfo(self, cores=cores,
+                                              stdin_path=stdin_path)
         self._pipes_and_commands.append(pipeline)
         return pipeline
 
-    def add_command(self, command, stdout_path=None, stderr_path=None):
+    def add_command(self, command, stdout_path=None, stderr_path=None,
+                    cores=None):
         try:
             command = command_info.CommandInfo(self, command,
                                                stdout_path=stdout_path,
-                                               stderr_path=stderr_path
+                                               stderr_path=stderr_path,
+                                               cores=cores
                                                )
         except TypeError as err:
             raise UAPError('During declaration of step "%s": %s' %
@@ -49,3 +52,47 @@ class ExecGroup(object):
 
     def get_run(self):
         return self._run
+
+    def get_paths(self):
+        '''
+        Returns the absolute paths the commands of this group mention in
+        their arguments or redirect their output to. A glob stands for the
+        whole working directory, as does a word with a shell expansion. Any
+        other word that is not an option or a number counts as a path
+        relative to the working directory, so groups which share a bare
+        directory name depend on each other.
+        '''
+        working_dir = self._run.get_temp_output_directory()
+        commands = list()
+        for poc in self._pipes_and_commands:
+            if isinstance(poc, pipeline_info.PipelineInfo):
+                commands.extend(poc.get_commands())
+            else:
+                commands.append(poc)
+        paths = set()
+        for poc in self._pipes_and_commands:
+            if isinstance(poc, pipeline_info.PipelineInfo) \
+                    and poc.get_stdin_path() is not None:
+                paths.add(os.path.normpath(
+                    os.path.join(working_dir, poc.get_stdin_path())))
+        for command in commands:
+            tokens = [command.get_stdout_path(), command.get_stderr_path()]
+            # the first argument is the tool
+            for arg in command.get_command()[1:]:
+                # arguments may be shell scripts, assignments or lists
+                for word in arg.split():
+                    word = word.strip('<>|&;()\'"')
+                    tokens.append(word)
+                    tokens.extend(word.split('=', 1)[-1].split(','))
+            for token in tokens:
+                if not token or token.startswith('-'):
+                    continue
+                if any(c in token for c in '*?$`~{['):
+                    token = '.'
+                try:
+                    float(token)
+                    continue
+                except ValueError:
+                    pass
+                paths.add(os.path.normpath(os.path.join(working_dir, token)))
+        return paths
@@ -1,4 +1,6 @@
+import errno
 import os
+import stat
 import yaml
 import misc
 
@@ -22,11 +24,90 @@ class FSCache:
         print(fsc.exists('/home'))
 
     You may call any method which is available in os.path.
+
+    The methods *exists*, *isfile*, *isdir*, *getsize* and *getmtime* are
+    served from a single scan of the directory containing the path, which is
+    shared by all instances. Call *FSCache.invalidate()* with a directory
+    whose content has changed.
+    '''
+
+    hash_index = None
+    '''
+    Persistent index of file checksums (see *state_index.HashIndex*).
+    '''
+
+    directories = dict()
+    '''
+    Dict of directory path -> dict of file name -> os.DirEntry, or None if
+    the directory cannot be read.
     '''
 
     def __init__(self):
         self.cache = dict()
 
+    @classmethod
+    def invalidate(cls, directory):
+        '''
+        Forget the scan of *directory*.
+        '''
+        cls.directories.pop(os.path.abspath(directory), None)
+
+    def _get_entry(self, path):
+        '''
+        Returns the os.DirEntry of *path*, None if it does not exist or False
+        if its directory cannot be scanned.
+        '''
+        directory, name = os.path.split(os.path.abspath(path))
+        if not name:
+            return False
+        if directory not in FSCache.directories:
+            try:
+                with os.scandir(directory) as it:
+                    entries = {entry.name: entry for entry in it}
+            except (FileNotFoundError, NotADirectoryError):
+                entries = dict()
+            except OSError:
+                entries = None
+            FSCache.directories[directory] = entries
+        entries = FSCache.directories[directory]
+        if entries is None:
+            return False
+        return entries.get(name)
+
+    def stat(self, path):
+        entry = self._get_entry(path)
+        if entry is False:
+            return os.stat(path)
+        if entry is None:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return entry.stat()
+
+    def exists(self, path):
+        try:
+            self.stat(path)
+        except OSError:
+            return False
+        return True
+
+    def isfile(self, path):
+        try:
+            return stat.S_ISREG(self.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def isdir(self, path):
+        try:
+            return stat.S_ISDIR(self.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def getsize(self, path):
+        return self.stat(path).st_size
+
+    def getmtime(self, path):
+        return self.stat(path).st_mtime
+
     def load_yaml_from_file(self, path):
         if 'load_yaml_from_file' not in self.cache:
             self.cache['load_yaml_from_file'] = dict()
@@ -40,24 +121,60 @@ class FSCache:
         self.cache['load_yaml_from_file'][path] = data
         return data
 
-    def sha256sum_of(self, path, value=None):
+    def sha256sum_of(self, path, value=None, lines=None):
+        '''
+        Returns the sha256 checksum of *path*. Checksums and line counts are
+        looked up in and added to *FSCache.hash_index*, if it is set. Pass
+        *value* and *lines* to store a checksum that is already known.
+        '''
         if 'sha256sums' not in self.cache:
             self.cache['sha256sums'] = dict()
 
-        if value is not None:
-            self.cache['sha256sums'][path] = value
-            return value
-
-        if path in self.cache['sha256sums']:
+        if value is None and path in self.cache['sha256sums']:
             return self.cache['sha256sums'][path]
 
-        sha = misc.sha256sum_of(path)
+        stat_result = None
+        if FSCache.hash_index is not None:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                pass
+
+        if value is not None:
+            sha = value
+        elif stat_result is not None:
+            sha = FSCache.hash_index.get_sha256(stat_result)
+            if sha is None:
+                sha, lines = misc.sha256sum_and_lines_of(path)
+            else:
+                stat_result = None
+        else:
+            sha = misc.sha256sum_of(path)
+
+        if stat_result is not None:
+            FSCache.hash_index.set_sha256(stat_result, sha, lines)
         self.cache['sha256sums'][path] = sha
         return sha
 
+    def line_count_of(self, path):
+        '''
+        Returns the number of lines of *path* if it is known from
+        *FSCache.hash_index* and None otherwise.
+        '''
+        if FSCache.hash_index is None:
+            return None
+        try:
+            return FSCache.hash_index.get_line_count(os.stat(path))
+        except OSError:
+            return None
+
     def clear(self):
         self.cache = dict()
 
+    def __reduce__(self):
+        # cached file system states are only valid for this process
+        return (FSCache, ())
+
     def __getattr__(self, name):
 
         def method(*args):
@@ -190,7 +190,17 @@ def sha256sum_of(file):
     """
     Returns hexdigits of the sha256sum of the passed file.
     """
+    return sha256sum_and_lines_of(file)[0]
+
+
+def sha256sum_and_lines_of(file):
+    """
+    Returns hexdigits of the sha256sum of the passed file and its number of
+    lines, which is None for gzipped files.
+    """
     sha256sum = hashlib.sha256()
+    lines = 0
+    is_gzipped = None
     try:
         with open(file, 'rb') as f:
             # the below exception is raised for large files
@@ -201,12 +211,45 @@ def sha256sum_of(file):
                 buf = f.read(2 * 1024 * 1024)
                 if not buf:
                     break
+                if is_gzipped is None:
+                    is_gzipped = buf[:2] == b'\x1f\x8b'
                 sha256sum.update(buf)
+                lines += buf.count(b'\n')
     except BaseException:
         raise UAPError("Error while calculating SHA256sum "
                        "of %s" % file)
 
-    return sha256sum.hexdigest()
+    return sha256sum.hexdigest(), None if is_gzipped else lines
+
+
+def copy_with_sha256sum_and_lines(source, target):
+    """
+    Copies *source* to *target* with its permissions and modification time
+    and returns hexdigits of the sha256sum of the data and its number of
+    lines, which is None for gzipped files.
+    """
+    sha256sum = hashlib.sha256()
+    lines = 0
+    is_gzipped = None
+    try:
+        with open(source, 'rb') as fin, open(target, 'wb') as fout:
+            while True:
+                buf = fin.read(8 * 1024 * 1024)
+                if not buf:
+                    break
+                if is_gzipped is None:
+                    is_gzipped = buf[:2] == b'\x1f\x8b'
+                fout.write(buf)
+                sha256sum.update(buf)
+                lines += buf.count(b'\n')
+        stat_result = os.stat(source)
+        os.chmod(target, stat_result.st_mode & 0o7777)
+        os.utime(target, ns=(stat_result.st_atime_ns,
+                             stat_result.st_mtime_ns))
+    except BaseException:
+        raise UAPError("Error while copying %s to %s" % (source, target))
+
+    return sha256sum.hexdigest(), None if is_gzipped else lines
 
 
 def sha_and_file(file):
@@ -217,6 +260,23 @@ def sha_and_file(file):
     return sha256sum_of(file), file
 
 
+def sha_lines_and_file(file):
+    '''
+    Designed to be run in multiprocessing.Pool().imap.
+    '''
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    return sha256sum_and_lines_of(file) + (file,)
+
+
+def copy_sha_lines_and_file(source_and_target):
+    '''
+    Designed to be run in multiprocessing.Pool().imap.
+    '''
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    source, target = source_and_target
+    return copy_with_sha256sum_and_lines(source, target) + (source,)
+
+
 class UAPDumper(yaml.Dumper):
     # ensures indentation of lists
     def increase_indent(self, flow=False, indentless=False):
@@ -1,10 +1,12 @@
 import base64
 import datetime
+import hashlib
 import json
 import signal
 from logging import getLogger
 from operator import itemgetter
 import os
+import pickle
 import re
 import subprocess
 import sys
@@ -18,7 +20,9 @@ with warnings.catch_warnings():
 from tqdm import tqdm
 
 import abstract_step
+import fscache
 import misc
+import state_index
 import task as task_module
 from uaperrors import UAPError
 
@@ -59,6 +63,60 @@ by name and to ignore theire version in the output hash.
 
 
 
+def get_code_hash(uap_path):
+    '''
+    Returns a hash of all python modules in the include directory of uap.
+    '''
+    checksum = hashlib.sha256()
+    include_path = os.path.join(uap_path, 'include')
+    for root, dirs, files in os.walk(include_path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(root, name)
+            checksum.update(os.path.relpath(path, include_path).encode('utf8'))
+            with open(path, 'rb') as f:
+                checksum.update(f.read())
+    return checksum.hexdigest()
+
+
+def load_snapshot(args):
+    '''
+    Returns the pipeline stored by *Pipeline.write_snapshot()* in the file
+    *args.snapshot* or None if the snapshot cannot be used.
+    '''
+    try:
+        with open(args.snapshot, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning('Could not load snapshot %s (%s: %s), building the '
+                       'pipeline instead.' %
+                       (args.snapshot, type(e).__name__, e))
+        return None
+    if snapshot['uap_version'] != args.uap_version or \
+            snapshot['code_hash'] != get_code_hash(args.uap_path):
+        logger.warning('The snapshot %s was written by a different version '
+                       'of uap, building the pipeline instead.' %
+                       args.snapshot)
+        return None
+    p = snapshot['pipeline']
+    # the run structure may have changed since, e.g. by new source files
+    for task_id in getattr(args, 'run', None) or []:
+        if task_id not in p.task_for_task_id and not any(
+                known.startswith(task_id) for known in p.task_for_task_id):
+            logger.warning('The snapshot %s does not know the task %s, '
+                           'building the pipeline instead.' %
+                           (args.snapshot, task_id))
+            return None
+    p.args = args
+    fscache.FSCache.hash_index = p.hash_index
+    os.chdir(p.config['base_working_directory'])
+    p.setup_lmod()
+    logger.info('Loaded pipeline from snapshot %s.' % args.snapshot)
+    return p
+
+
 class ConfigurationException(Exception):
     """an exception class for reporting configuration errors"""
 
@@ -201,6 +259,61 @@ def check_tool(args):
     return tool_id, tool_check_info
 
 
+def get_tool_files(info, tool_check_info):
+    '''
+    Returns the identity of all files a tool check depends on as dict of
+    path -> [inode, size, mtime in ns].
+    '''
+    paths = [tool_check_info['used_path']]
+    if isinstance(info['path'], list):
+        paths.extend(path for path in info['path'][1:]
+                     if os.path.isfile(path))
+    files = dict()
+    for path in paths:
+        stat = os.stat(path)
+        files[path] = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def read_tool_check_cache(cache_path):
+    '''
+    Returns the cached tool checks stored at *cache_path* by tool.
+    '''
+    try:
+        with open(cache_path, 'r') as f:
+            return yaml.load(f, Loader=yaml.FullLoader) or dict()
+    except IOError:
+        pass
+    except yaml.YAMLError as e:
+        logger.warning('Ignoring unreadable tool check cache %s: %s' %
+                       (cache_path, e))
+    return dict()
+
+
+def is_tool_check_cached(info, cached):
+    '''
+    Returns True if the cached result of a tool check is still valid for the
+    tool configuration *info*.
+    '''
+    if cached.get('config') != info:
+        return False
+    if not any(key in info for key in ['module_load', 'pre_command']):
+        # the environment of uap determines which executable is used
+        command = info['path']
+        if isinstance(command, list):
+            command = command[0]
+        if find_executable(command) != cached['info']['used_path']:
+            return False
+    for path, identity in cached['files'].items():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if [stat.st_ino, stat.st_size, stat.st_mtime_ns] != identity:
+            return False
+    return True
+
+
 class Pipeline(object):
     '''
     The Pipeline class represents the entire processing pipeline which is defined
@@ -409,6 +522,7 @@ class Pipeline(object):
             'lmod',
             'tools',
             'base_working_directory',
+            'scratch_path',
             'id'}
         '''
         A set of accepted keys in the config.
@@ -425,6 +539,22 @@ class Pipeline(object):
         if unused_tools:
             logger.warning('Unused tool(s): %s' % list(unused_tools))
 
+        self.state_index = state_index.StateIndex(
+            state_index.get_index_path(
+                self.config['destination_path'], '.state-index.sqlite'))
+        '''
+        Persistent index of the last computed task states.
+        '''
+
+        self.hash_index = state_index.HashIndex(
+            state_index.get_index_path(
+                self.config['destination_path'], '.hash-index.sqlite'))
+        '''
+        Persistent index of the checksums and line counts of files, which
+        steps may use while declaring runs.
+        '''
+        fscache.FSCache.hash_index = self.hash_index
+
         # collect all tasks
         for step_name in self.topological_step_order:
             step = self.get_step(step_name)
@@ -450,12 +580,87 @@ class Pipeline(object):
                 self.task_for_task_id[str(task)] = task
 
         self.tool_versions = {}
+        '''
+        This dict stores the results of the tool checks by tool name. Use
+        *get_tool_version()* to check tools that are not checked yet.
+        '''
         if not self.args.no_tool_checks:
-            self.check_tools()
+            self.check_tools(self.get_required_tools())
 
     def get_uap_path(self):
         return self._uap_path
 
+    def get_required_tools(self):
+        '''
+        Returns the set of tools used by the steps of the requested tasks and
+        by all their ancestor steps, which are part of the run structures.
+        '''
+        if not (hasattr(self.args, 'run') and self.args.run):
+            return self.used_tools
+        steps = set(task.step for task in self.get_task_with_list())
+        tools = set()
+        while steps:
+            step = steps.pop()
+            tools.update(step._tools.keys())
+            steps.update(step.get_dependencies())
+        return tools
+
+    def get_tool_version(self, tool):
+        '''
+        Returns the result of the tool check of *tool* and checks the tool
+        first if that has not happened yet, together with the other
+        unchecked tools of the steps using it, which are needed next.
+        '''
+        if tool not in self.tool_versions:
+            tools = {tool}
+            for step in self.steps.values():
+                if tool in step._tools:
+                    tools.update(step._tools.keys())
+            self.check_tools(sorted(tools))
+        return self.tool_versions[tool]
+
+    def write_snapshot(self, tasks):
+        '''
+        Writes this pipeline with all its steps, runs and tasks to a file,
+        so that run-locally can load it instead of building it again (see
+        *load_snapshot()*). The file name is made from the configuration, the
+        uap version, the source code of uap and the run structures of the
+        *tasks* to execute, which include their tool versions and the runs
+        declared from upstream outputs. Returns the path to the file.
+        '''
+        code_hash = get_code_hash(self._uap_path)
+        structures = sorted(
+            [str(task), task.get_run().get_run_structure_hash()]
+            for task in tasks)
+        key = misc.str_to_sha256(json.dumps(
+            [self.config, self.args.uap_version, code_hash, structures],
+            sort_keys=True, default=str).encode('utf8'))
+        snapshot_dir = os.path.join(
+            self.config['destination_path'], '.snapshots')
+        snapshot_path = os.path.join(snapshot_dir, key + '.pickle')
+        if os.path.exists(snapshot_path):
+            return snapshot_path
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+        # the states of the runs may have changed until the snapshot is used
+        for step in self.steps.values():
+            step.reset_run_caches()
+        args = self.args
+        self.args = None
+        try:
+            data = pickle.dumps({
+                'uap_version': args.uap_version,
+                'code_hash': code_hash,
+                'pipeline': self}, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            self.args = args
+
+        temp_path = '%s.%d' % (snapshot_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.rename(temp_path, snapshot_path)
+        return snapshot_path
+
     def get_cluster_config(self):
         return self._cluster_config
 
@@ -588,6 +793,8 @@ class Pipeline(object):
                   'default_post_job_command']:
             self.config['cluster'].setdefault(i, '')
         self.config['cluster'].setdefault('default_job_quota', 0)  # no quota
+        self.config['cluster'].setdefault('resource_margin', 1.5)
+        self.config['cluster'].setdefault('max_element_jobs', 100)
 
     def build_steps(self):
         self.steps = {}
@@ -726,14 +933,40 @@ class Pipeline(object):
         if module_path:
             os.environ['MODULEPATH'] = module_path
 
-    def check_tools(self):
+    def check_tools(self, tools=None):
         '''
         checks whether all tools references by the configuration are available
         and records their versions as determined by ``[tool] --version`` etc.
+        Pass a list of *tools* to check only these.
+
+        Results are cached in the destination path and reused as long as the
+        configuration of the tool and its executable files are unchanged.
         '''
         if 'tools' not in self.config:
             return
-        pool = multiprocessing.Pool(4)
+        cache_path = os.path.join(self.config['destination_path'],
+                                  '.tool-checks.yaml')
+        cache = read_tool_check_cache(cache_path)
+        if tools is None:
+            tools = self.config['tools'].keys()
+        tools = [tool for tool in tools if tool not in self.tool_versions]
+        tools_to_check = dict()
+        for tool_id in tools:
+            info = self.config['tools'][tool_id]
+            if tool_id in cache and is_tool_check_cached(info, cache[tool_id]):
+                self.tool_versions[tool_id] = cache[tool_id]['info']
+            else:
+                tools_to_check[tool_id] = info
+        logger.info('Reusing %d cached tool check(s).' %
+                    (len(tools) - len(tools_to_check)))
+        if len(tools_to_check) == 0:
+            return
+        if len(tools_to_check) == 1:
+            # not worth starting processes for
+            results = [check_tool(item) for item in tools_to_check.items()]
+            self._store_tool_checks(cache_path, tools_to_check, results)
+            return
+        pool = multiprocessing.Pool(min(4, len(tools_to_check)))
         if logger.getEffectiveLevel() <= 20:
             show_status = False
         elif self.has_interactive_shell():
@@ -748,21 +981,46 @@ class Pipeline(object):
         iter_tools = tqdm(
             pool.imap_unordered(
                 check_tool,
-                self.config['tools'].items()),
-            total=len(
-                self.config['tools']),
+                tools_to_check.items()),
+            total=len(tools_to_check),
             desc='tool check',
             bar_format='{desc}:{percentage:3.0f}%|{bar:10}{r_bar}',
             disable=not show_status)
         try:
-            for tool_id, tool_check_info in iter_tools:
-                self.tool_versions[tool_id] = tool_check_info
+            results = list(iter_tools)
         except BaseException:
             pool.terminate()
             iter_tools.close()
             raise
         pool.close()
         pool.join()
+        self._store_tool_checks(cache_path, tools_to_check, results)
+
+    def _store_tool_checks(self, cache_path, tools_to_check, results):
+        '''
+        Records the *results* of the checks of *tools_to_check* and adds
+        them to the cache with one atomic write. The cache is read again
+        first to keep the entries other processes wrote in the meantime.
+        '''
+        cache = read_tool_check_cache(cache_path)
+        for tool_id, tool_check_info in results:
+            self.tool_versions[tool_id] = tool_check_info
+            if tool_check_info['used_path'] is None:
+                continue
+            info = tools_to_check[tool_id]
+            cache[tool_id] = {
+                'config': info,
+                'files': get_tool_files(info, tool_check_info),
+                'info': tool_check_info}
+
+        temp_path = '%s.%d' % (cache_path, os.getpid())
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(yaml.dump(cache, default_flow_style=False))
+            os.rename(temp_path, cache_path)
+        except OSError as e:
+            logger.warning('Could not write tool check cache %s: %s' %
+                           (cache_path, e))
 
     def has_interactive_shell(self):
         return os.isatty(sys.stdout.fileno())
@@ -813,7 +1071,8 @@ class Pipeline(object):
             try:
                 with open(queued_ping_file, 'r') as fl:
                     info = yaml.load(fl, Loader=yaml.FullLoader)
-                ids.add(info['cluster job id'])
+                if 'cluster job id' in info:
+                    ids.add(info['cluster job id'])
             except (IOError, TypeError) as e:
                 if os.path.exists(queued_ping_file):
                     raise UAPError('Could not read ping file %s: %s' %
@@ -822,7 +1081,8 @@ class Pipeline(object):
                     try:
                         with open(failed_qpf, 'r') as fl:
                             info = yaml.load(fl, Loader=yaml.FullLoader)
-                        ids.add(info['cluster job id'])
+                        if 'cluster job id' in info:
+                            ids.add(info['cluster job id'])
                     except (IOError, TypeError) as e:
                         if os.path.exists(failed_qpf):
                             raise UAPError('Could not read ping file %s: %s' %
@@ -914,18 +1174,24 @@ class Pipeline(object):
                         task.get_run().fsc.getmtime(exec_ping_file))
                     run_problems.append((task, exec_ping_file, stale,
                                          last_activity - start_time))
-            if check_queue:
-                try:
-                    info = yaml.load(open(queued_ping_file, 'r'),
-                                     Loader=yaml.FullLoader)
-                except IOError as e:
-                    if os.path.exists(queued_ping_file):
-                        raise e
-                else:
-                    if not str(info['cluster job id']) in running_jids:
+            try:
+                info = yaml.load(open(queued_ping_file, 'r'),
+                                 Loader=yaml.FullLoader)
+            except IOError as e:
+                if os.path.exists(queued_ping_file):
+                    raise e
+            else:
+                if 'worker' in info:
+                    # claims of workers are renewed while they are alive
+                    if task.get_run().is_stale_claim():
                         queue_problems.append((task, queued_ping_file,
                                                info['submit_time'],
-                                               info['cluster job id']))
+                                               info['worker']))
+                elif check_queue and \
+                        not str(info['cluster job id']) in running_jids:
+                    queue_problems.append((task, queued_ping_file,
+                                           info['submit_time'],
+                                           info['cluster job id']))
             try:
                 info = yaml.load(open(bad_queued_ping_file, 'r'),
                                  Loader=yaml.FullLoader)
@@ -934,7 +1200,9 @@ class Pipeline(object):
                     raise e
             else:
                 bad_problems.append((task, bad_queued_ping_file,
-                                     info['submit_time'], info['cluster job id']))
+                                     info['submit_time'],
+                                     info.get('cluster job id',
+                                              info.get('worker'))))
 
         show_hint = False
 
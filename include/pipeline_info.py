@@ -1,13 +1,41 @@
 """
 
 """
+import os
+
 import command as command_info
 
+# dd operands which only set block sizes
+DD_BLOCK_SIZE_OPERANDS = ('bs=', 'ibs=', 'obs=')
+
+
+def get_dd_input_path(command):
+    '''
+    Returns the input file of *command* if it is a ``dd`` call that just
+    copies the file to stdout, None otherwise.
+    '''
+    if command.get_stdout_path() is not None \
+            or command.get_stderr_path() is not None:
+        return None
+    args = command.get_command()
+    tool = args[0][-1] if isinstance(args[0], list) else args[0]
+    if os.path.basename(tool) != 'dd':
+        return None
+    input_path = None
+    for arg in args[1:]:
+        if arg.startswith('if=') and input_path is None:
+            input_path = arg[len('if='):]
+        elif not arg.startswith(DD_BLOCK_SIZE_OPERANDS):
+            return None
+    return input_path
+
 
 class PipelineInfo(object):
-    def __init__(self, exec_group):
+    def __init__(self, exec_group, cores=None, stdin_path=None):
         self._exec_group = exec_group
         self._commands = list()
+        self._cores = cores
+        self._stdin_path = stdin_path
 
     def __enter__(self):
         return self
@@ -26,9 +54,44 @@ class PipelineInfo(object):
     def get_commands(self):
         return self._commands
 
+    def get_cores(self):
+        '''
+        Returns the number of cores the pipeline uses or None if not given.
+        '''
+        return self._cores
+
+    def get_stdin_path(self):
+        '''
+        Returns the file the first command reads from stdin or None. Unless
+        given explicitly, this is the input file of a leading ``dd`` which
+        only copies a file into the pipeline.
+        '''
+        if self._stdin_path is not None:
+            return command_info.abs2rel_path(
+                lambda pipeline: pipeline._stdin_path)(self)
+        if len(self._commands) > 1:
+            return get_dd_input_path(self._commands[0])
+        return None
+
+    def get_launch_commands(self):
+        '''
+        Returns the commands to launch. A leading ``dd`` which only copies
+        a file into the pipeline is left out, the file is opened as stdin
+        of the next command instead.
+        '''
+        if self._stdin_path is None and self.get_stdin_path() is not None:
+            return self._commands[1:]
+        return self._commands
+
     def get_command_string(self, replace_path=False):
-        return ' | '.join(c.get_command_string(replace_path=replace_path)
-                          for c in self.get_commands())
+        commands = [c.get_command_string(replace_path=replace_path)
+                    for c in self.get_commands()]
+        if self._stdin_path is not None and commands:
+            commands[0] += ' < %s' % command_info.quote(self.get_stdin_path())
+        return ' | '.join(commands)
 
     def get_exec_group(self):
         return self._exec_group
+
+    def get_run(self):
+        return self._exec_group.get_run()
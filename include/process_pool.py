@@ -6,6 +6,8 @@ import subprocess
 import signal
 import psutil
 import os
+import select
+import fscache
 import misc
 from logging import getLogger
 import hashlib
@@ -56,6 +58,14 @@ class ProcessPool(object):
     have finished. You cannot launch a process pool within another process pool,
     but you can launch multiple pipeline and independent processes within a
     single process pool. Also, you can launch several process pools sequentially.
+
+    Commands and pipelines are launched in order as long as their core hints
+    (1 by default) fit into the cores of the step, the others wait until
+    enough cores are released. If a command of the pool creates a FIFO, all
+    are launched at once since they might depend on each other.
+
+    Commands and pipelines can be assigned to groups. A group declared with
+    *add_group()* is only launched after the groups it depends on finished.
     '''
 
     TAIL_LENGTH = 1024
@@ -64,12 +74,30 @@ class ProcessPool(object):
     of every process launched with this class, in bytes.
     '''
 
+    STDIN_PREFETCH_SIZE = 16 * 1024 * 1024
+    '''
+    Size of the beginning of a file opened as *stdin* of a pipeline which is
+    read ahead, in bytes.
+    '''
+
     COPY_BLOCK_SIZE = 4194304
     '''
     When *stdout* or *stderr* streams should be written to output files, this is
     the buffer size which is used for writing.
     '''
 
+    PIPE_SIZE = 1048576
+    '''
+    Requested kernel buffer size of the pipes between processes of a pipeline,
+    in bytes (Linux only).
+    '''
+
+    POLL_TIMEOUT = 0.1
+    '''
+    While streams are open, the process pool checks for exited child processes
+    at least this often, in seconds.
+    '''
+
     SIGTERM_TIMEOUT = 10
     '''
     After a SIGTERM signal is issued, wait this many seconds before going postal.
@@ -93,11 +121,18 @@ class ProcessPool(object):
 
             with pool.Pipeline(pool) as pipeline:
                 # append processes to the pipeline here
+
+        If *stdin_path* is given, the file is opened as stdin of the first
+        process.
         '''
 
-        def __init__(self, pool):
+        def __init__(self, pool, cores=None, group=None, stdin_path=None):
             pool.launch_calls.append(self)
+            pool._count_call(group)
             self.append_calls = []
+            self.cores = cores
+            self.group = group
+            self.stdin_path = copy.copy(stdin_path)
 
         def __enter__(self):
             return self
@@ -105,7 +140,8 @@ class ProcessPool(object):
         def __exit__(self, type, value, traceback):
             pass
 
-        def append(self, args, stdout_path=None, stderr_path=None, hints={}):
+        def append(self, args, stdout_path=None, stderr_path=None, hints={},
+                   hashing=None):
             '''
             Append a process to the pipeline. Parameters get stored and are passed
             to *ProcessPool.launch()* later, so the same behaviour applies.
@@ -114,7 +150,8 @@ class ProcessPool(object):
                 'args': copy.deepcopy(args),
                 'stdout_path': copy.copy(stdout_path),
                 'stderr_path': copy.copy(stderr_path),
-                'hints': copy.deepcopy(hints)
+                'hints': copy.deepcopy(hints),
+                'hashing': copy.deepcopy(hashing)
             }
             self.append_calls.append(call)
 
@@ -128,8 +165,8 @@ class ProcessPool(object):
         # log entries
         self.log_entries = []
 
-        # dict of PID -> path to copy process report
-        self.copy_process_reports = {}
+        # copies stdout and stderr of all launched processes
+        self.streams = StreamMultiplexer()
 
         # set of currently running PIDs
         # whenever a child process exits, its PID will get removed from this
@@ -154,12 +191,35 @@ class ProcessPool(object):
         # list of commands to be launched
         self.launch_calls = []
 
+        # number of cores the launched processes may use at a time
+        self.cores = run.get_step().get_cores()
+
+        # number of cores of the launched commands and pipelines which are
+        # still running
+        self.used_cores = 0
+
+        # dict of PID -> cores and running PIDs of the command or pipeline
+        # it belongs to
+        self.launched_call_for_pid = dict()
+
+        # write end of a pipe which tells the process watcher about processes
+        # launched later on, it is closed once all processes are launched
+        self.launch_report_fd = None
+
+        # dict of group -> groups which have to finish before it is launched
+        self.group_dependencies = dict()
+
+        # dict of group -> number of its commands and pipelines which have
+        # not finished yet
+        self.unfinished_calls = dict()
+
         # List of processes we killed deliberately. Look: every time a
         # within a pipeline exits, we SIGTERM its predecessor. This is
         # necessary because otherwise, stuff is hanging forever.
         self.ok_to_fail = set()
 
-        self.copy_processes_for_pid = dict()
+        # error which stopped the launching of further processes
+        self.launch_error = None
 
         self.clean_up = False
 
@@ -245,8 +305,8 @@ class ProcessPool(object):
             for module_load in module_loads:
                 self.load_unload_module(module_load)
 
-        # now launch all processes...
-        self._launch_all_processes()
+        # now launch all processes that fit into the cores...
+        self._launch_queued()
 
         # ...and wait until all child processes have exited
         try:
@@ -272,7 +332,20 @@ class ProcessPool(object):
 
         ProcessPool.current_instance = None
 
-    def launch(self, args, stdout_path=None, stderr_path=None, hints={}):
+    def add_group(self, group, depends_on=()):
+        '''
+        Declare that the commands and pipelines of *group* are launched once
+        all of the groups *depends_on* finished.
+        '''
+        self.group_dependencies[group] = set(depends_on)
+
+    def _count_call(self, group):
+        if group is not None:
+            self.unfinished_calls[group] = \
+                self.unfinished_calls.get(group, 0) + 1
+
+    def launch(self, args, stdout_path=None, stderr_path=None, hints={},
+               hashing=None, cores=None, group=None):
         '''
         Launch a process. Arguments, including the program itself, are passed in
         *args*. If the program is not a binary but a script which cannot be
@@ -281,22 +354,34 @@ class ProcessPool(object):
 
         Use *stdout_path* and *stderr_path* to redirect *stdout* and *stderr*
         streams to files. In any case, the output of both streams gets watched,
-        the process pool calculates SHA256 checksums automatically and also keeps
-        the last 1024 bytes of every stream. This may be useful if a process
-        crashes and writes error messages to *stderr* in which case you can see
-        them even if you didn't redirect *stderr* to a log file.
+        the process pool counts bytes and lines and also keeps the last 1024
+        bytes of every stream. This may be useful if a process crashes and
+        writes error messages to *stderr* in which case you can see them even if
+        you didn't redirect *stderr* to a log file.
+
+        SHA256 checksums are calculated for streams which are written to a file.
+        Pass *hashing* as a boolean to switch them on or off for both streams or
+        as a dict like *{'stdout': False}* to decide per stream.
 
         Hints can be specified but are not essential. They help to determine the
         direction of arrows for the run annotation graphs rendered by GraphViz
         (sometimes, it's not clear from the command line whether a certain file
         is an input or output file to a given process).
+
+        *cores* is the number of cores the process uses, 1 if not given. It is
+        only launched once that many cores of the step are free. See
+        *add_group()* for *group*.
         '''
         call = {
             'args': copy.deepcopy(args),
             'stdout_path': copy.copy(stdout_path),
             'stderr_path': copy.copy(stderr_path),
-            'hints': copy.deepcopy(hints)
+            'hints': copy.deepcopy(hints),
+            'hashing': copy.deepcopy(hashing),
+            'cores': cores,
+            'group': group
         }
+        self._count_call(group)
 
         self.launch_calls.append(call)
 
@@ -315,20 +400,13 @@ class ProcessPool(object):
         '''
         log = dict()
         log['processes'] = []
-        proc_details_copy = dict()
         for pid in self.proc_order:
-            if 'listener_for' in self.proc_details[pid]:
-                attach_info = self.proc_details[pid]['listener_for']
-                proc_details_copy[attach_info[0]][attach_info[1] + \
-                    '_copy'] = copy.deepcopy(self.proc_details[pid])
-                del proc_details_copy[attach_info[0]
-                                      ][attach_info[1] + '_copy']['listener_for']
-            else:
-                proc_details_copy[pid] = copy.deepcopy(self.proc_details[pid])
-
-        for pid in self.proc_order:
-            if pid in proc_details_copy:
-                log['processes'].append(proc_details_copy[pid])
+            proc_details = copy.deepcopy(self.proc_details[pid])
+            for which in ['stdout', 'stderr']:
+                report = self.streams.get_report(pid, which)
+                if report is not None:
+                    proc_details[which + '_copy'] = copy.deepcopy(report)
+            log['processes'].append(proc_details)
 
         log['log'] = copy.deepcopy(self.log_entries)
         log['process_watcher'] = copy.deepcopy(self.process_watcher_report)
@@ -336,30 +414,176 @@ class ProcessPool(object):
 
         return log
 
-    def _launch_all_processes(self):
+    def _get_launch_cores(self, info):
+        if info.__class__ == ProcessPool.Pipeline:
+            cores = info.cores
+        else:
+            cores = info.get('cores')
+        return 1 if cores is None else cores
+
+    def _get_launch_group(self, info):
+        if info.__class__ == ProcessPool.Pipeline:
+            return info.group
+        return info.get('group')
+
+    def _may_launch(self, info):
+        group = self._get_launch_group(info)
+        return all(self.unfinished_calls.get(dependency, 0) == 0
+                   for dependency in self.group_dependencies.get(group, ()))
+
+    def _creates_fifo(self):
         for info in self.launch_calls:
+            if info.__class__ == ProcessPool.Pipeline:
+                calls = info.append_calls
+            else:
+                calls = [info]
+            for call in calls:
+                program = call['args'][0]
+                if program.__class__ == list:
+                    program = program[-1]
+                if os.path.basename(program) == 'mkfifo':
+                    return True
+        return False
+
+    def _launch_queued(self):
+        '''
+        Launch the waiting commands and pipelines whose groups may start in
+        order while their cores fit into the cores of the step. If nothing
+        is running, the next one is launched regardless of its cores.
+        '''
+        if self.used_cores == 0 and self.cores is not None \
+                and self._creates_fifo():
+            self.log("Launching all processes at once since they use FIFOs.")
+            self.cores = None
+        index = 0
+        while index < len(self.launch_calls) \
+                and not ProcessPool.process_pool_is_dead:
+            info = self.launch_calls[index]
+            if not self._may_launch(info):
+                index += 1
+                continue
+            cores = self._get_launch_cores(info)
+            if self.cores is not None and self.used_cores > 0 \
+                    and self.used_cores + cores > self.cores:
+                break
+            self.launch_calls.pop(index)
+            self.used_cores += cores
+            launched_call = {
+                'cores': cores,
+                'group': self._get_launch_group(info),
+                'pids': set()}
             if info.__class__ == ProcessPool.Pipeline:
                 pipeline = info
                 use_stdin = None
+                if pipeline.stdin_path is not None:
+                    try:
+                        use_stdin = self._open_stdin(pipeline.stdin_path)
+                    except UAPError as e:
+                        self.used_cores -= cores
+                        self._abort_launching(str(e))
+                        break
                 last_pid = None
-                for index, info in enumerate(pipeline.append_calls):
+                for position, info in enumerate(pipeline.append_calls):
                     use_stdin, pid = self._do_launch(
-                        info, index < len(pipeline.append_calls) - 1, use_stdin)
+                        info, position < len(pipeline.append_calls) - 1,
+                        use_stdin)
                     if last_pid is not None:
                         self.proc_details[pid]['use_stdin_of'] = last_pid
                     last_pid = pid
+                    launched_call['pids'].add(pid)
             else:
-                self._do_launch(info)
+                use_stdin, pid = self._do_launch(info)
+                launched_call['pids'].add(pid)
+            for pid in launched_call['pids']:
+                self.launched_call_for_pid[pid] = launched_call
+                self._report_launch(pid)
+        if not self.launch_calls:
+            self._stop_launching()
+
+    def _abort_launching(self, error):
+        '''
+        Stop launching and terminate the running processes because of
+        *error*, which is raised once *_wait()* reaped them.
+        '''
+        self.launch_error = error
+        self.log(error)
+        self._stop_launching()
+        for pid in self.running_procs:
+            self.ok_to_fail.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def _open_stdin(self, path):
+        '''
+        Open *path* for reading and tell the kernel that it is read
+        sequentially from the start.
+        '''
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            raise UAPError("Could not open %s as stdin of a pipeline: %s" %
+                           (path, e.strerror))
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(fd, 0, ProcessPool.STDIN_PREFETCH_SIZE,
+                                 os.POSIX_FADV_WILLNEED)
+            except OSError:
+                # only a hint, e.g. not supported for pipes
+                pass
+        self.log("Reading stdin of pipeline from %s." % path)
+        return fd
+
+    def _release_cores(self, pid):
+        '''
+        Release the cores of a command or pipeline once all its processes
+        have exited.
+        '''
+        launched_call = self.launched_call_for_pid.pop(pid, None)
+        if launched_call is None:
+            return
+        launched_call['pids'].discard(pid)
+        if not launched_call['pids']:
+            self.used_cores -= launched_call['cores']
+            if launched_call['group'] is not None:
+                self.unfinished_calls[launched_call['group']] -= 1
+
+    def _report_launch(self, pid):
+        if self.launch_report_fd is None:
+            return
+        try:
+            os.write(self.launch_report_fd, ('%d %s\n' % (
+                pid, self.proc_details[pid]['name'])).encode())
+        except OSError:
+            # the process is not watched then
+            pass
+
+    def _stop_launching(self):
+        '''
+        Drop the commands and pipelines which are not launched yet and tell
+        the process watcher that no more processes are coming.
+        '''
+        if self.launch_calls:
+            self.log("Not launching %d waiting command(s) or pipeline(s)." %
+                     len(self.launch_calls))
+            self.launch_calls = []
+        if self.launch_report_fd is not None:
+            os.close(self.launch_report_fd)
+            self.launch_report_fd = None
 
     def _do_launch(self, info, keep_stdout_open=False, use_stdin=None):
         '''
-        Launch a process and after that, launch a copy process for *stdout* and
-        *stderr* each.
+        Launch a process and after that, register its *stdout* and *stderr*
+        streams with the stream multiplexer.
         '''
         args = copy.deepcopy(info['args'])
         stdout_path = copy.copy(info['stdout_path'])
         stderr_path = copy.copy(info['stderr_path'])
         hints = copy.deepcopy(info['hints'])
+        hashing = info.get('hashing')
 
         program_name = copy.deepcopy(args[0])
         if program_name.__class__ == list:
@@ -380,6 +604,10 @@ class ProcessPool(object):
             preexec_fn=restore_sigpipe_handler,
             close_fds=True
         )
+        if use_stdin is not None:
+            # the child has its own copy now, and only if we drop ours
+            # writing to a pipe of an exited reader fails with EPIPE
+            os.close(use_stdin)
         pid = proc.pid
         self.popen_procs[pid] = proc
 
@@ -402,154 +630,36 @@ class ProcessPool(object):
         pipe = None
         if keep_stdout_open:
             pipe = os.pipe()
-
-        self.copy_processes_for_pid[pid] = list()
+            if hasattr(fcntl, 'F_SETPIPE_SZ'):
+                try:
+                    fcntl.fcntl(pipe[1], fcntl.F_SETPIPE_SZ,
+                                ProcessPool.PIPE_SIZE)
+                except OSError:
+                    # the size is limited by /proc/sys/fs/pipe-max-size
+                    pass
 
         for which in ['stdout', 'stderr']:
-            report_path = self.get_run().add_temporary_file("%s-report" % which, '.txt')
             sink_path = stdout_path if which == 'stdout' else stderr_path
-            listener_pid = self._do_launch_copy_process(
+            if isinstance(hashing, dict):
+                do_hash = hashing.get(which, sink_path is not None)
+            elif hashing is None:
+                do_hash = sink_path is not None
+            else:
+                do_hash = bool(hashing)
+            self.streams.add_stream(
                 proc.stdout if which == 'stdout' else proc.stderr,
-                sink_path,
-                report_path, pid, which,
-                pipe if which == 'stdout' else None)
-
-            self.copy_processes_for_pid[pid].append(listener_pid)
-            self.copy_process_reports[listener_pid] = report_path
-
+                pid, which, sink_path,
+                pipe[1] if pipe is not None and which == 'stdout' else None,
+                do_hash)
+            self.log("Capturing %s of PID %d." % (which, pid))
             if sink_path is not None:
-                self.proc_details[listener_pid]['sink'] = os.path.basename(
-                    sink_path)
-                self.proc_details[listener_pid]['sink_full_path'] = os.path.abspath(
-                    sink_path)
+                self.log("...which gets also redirected to %s" % sink_path)
 
         if keep_stdout_open:
-            os.close(pipe[1])
             return pipe[0], pid
         else:
             return None, pid
 
-    def _do_launch_copy_process(
-            self,
-            fin,
-            fout_path,
-            report_path,
-            parent_pid,
-            which,
-            pipe):
-        pid = os.fork()
-        if pid == 0:
-
-            def write_report_and_exit(signum=None, frame=None):
-                try:
-                    # write report
-                    with open(report_path, 'w') as freport:
-                        report = dict()
-                        report['sha256'] = checksum.hexdigest()
-                        report['tail'] = tail.decode('utf-8', errors='ignore')
-                        report['length'] = length
-                        report['lines'] = newline_count
-                        freport.write(yaml.dump(report))
-                except (IOError, LookupError) as e:
-                    logger.error("Eror while writing %s (%s): %s" %
-                                 (report_path, type(e).__name__, e))
-                    logger.debug(traceback.format_exc())
-                finally:
-                    os._exit(0)
-
-            signal.signal(signal.SIGTERM, write_report_and_exit)
-            signal.signal(signal.SIGINT, write_report_and_exit)
-            signal.signal(signal.SIGPIPE, write_report_and_exit)
-            os.setsid()
-            if pipe is not None:
-                os.close(pipe[0])
-            fdout = None
-            if fout_path is not None:
-                fdout = os.open(fout_path, os.O_WRONLY |
-                                os.O_CREAT | os.O_TRUNC)
-
-            checksum = hashlib.sha256()
-            tail = b''
-            length = 0
-            newline_count = 0
-
-            while True:
-                block = fin.read(ProcessPool.COPY_BLOCK_SIZE)
-                if len(block) == 0:
-                    # fin reports EOF, let's call it a day
-                    break
-
-                # update checksum
-                checksum.update(block)
-
-                # update tail
-                if len(block) >= ProcessPool.TAIL_LENGTH:
-                    tail = block[-ProcessPool.TAIL_LENGTH:]
-                else:
-                    keep_length = ProcessPool.TAIL_LENGTH - len(block)
-                    tail = tail[-keep_length:] + block
-
-                # update length
-                length += len(block)
-
-                # update newline_count
-                newline_count += block.count(b'\n')
-
-                # write block to output file
-                if fdout is not None:
-                    tries = 0
-                    bytes_written = None
-                    while not bytes_written:
-                        try:
-                            bytes_written = os.write(fdout, block)
-                        except OSError:
-                            tries += 1
-                            if tries == 5:
-                                raise
-                            time.sleep(.1)
-                    if bytes_written != len(block):
-                        os._exit(1)
-
-                # write block to pipe
-                if pipe is not None:
-                    tries = 0
-                    bytes_written = None
-                    while not bytes_written:
-                        try:
-                            bytes_written = os.write(pipe[1], block)
-                        except OSError:
-                            tries += 1
-                            if tries == 5:
-                                raise
-                            time.sleep(.1)
-                    if bytes_written != len(block):
-                        os._exit(2)
-
-            # we're finished, close everything
-            fin.close()
-            if fdout is not None:
-                os.close(fdout)
-            if pipe is not None:
-                os.close(pipe[1])
-
-            write_report_and_exit()
-        else:
-            self.running_procs.add(pid)
-            self.proc_order.append(pid)
-            self.proc_details[pid] = {
-                'name': '[stream listener for %s of PID %d]' % (which, parent_pid),
-                'start_time': datetime.datetime.now(),
-                'pid': pid,
-                'listener_for': [parent_pid, which],
-                'report_path': report_path
-            }
-            self.log(
-                "Launched a copy process with PID %d to capture %s of PID %d." %
-                (pid, which, parent_pid))
-            if fout_path is not None:
-                self.log("...which gets also redirected to %s" % fout_path)
-            return pid
-
     def _wait(self):
         '''
         Wait for all processes to exit.
@@ -558,18 +668,36 @@ class ProcessPool(object):
                  "processes to exit.")
         watcher_report_path = \
             self.get_run().add_temporary_file('watcher-report', suffix='.yaml')
-        watcher_pid = self._launch_process_watcher(watcher_report_path)
+        launch_report = None
+        if self.launch_calls:
+            # the watcher learns about processes launched later on
+            launch_report = os.pipe()
+            os.set_blocking(launch_report[1], False)
+            self.launch_report_fd = launch_report[1]
+        watcher_pid = self._launch_process_watcher(
+            watcher_report_path,
+            launch_report[0] if launch_report is not None else None)
+        if launch_report is not None:
+            os.close(launch_report[0])
         ProcessPool.process_watcher_pid = watcher_pid
         pid = None
         first_failed_pid = None
-        was_reporter = None
         failed_pids = set()
-        while True:
-            if len(self.running_procs) == 0:
-                break
+        timeout = 0
+        while len(self.running_procs) > 0 or self.streams.is_active():
             try:
-                # wait for the next child process to exit
-                pid, exit_code_with_signal = os.wait()
+                if self.streams.is_active():
+                    # copy what the processes wrote so far and see
+                    # whether one of them has exited
+                    self.streams.poll(timeout)
+                    pid, exit_code_with_signal = os.waitpid(-1, os.WNOHANG)
+                    if pid == 0:
+                        timeout = ProcessPool.POLL_TIMEOUT
+                        continue
+                    timeout = 0
+                else:
+                    # wait for the next child process to exit
+                    pid, exit_code_with_signal = os.wait()
                 signal_number = exit_code_with_signal & 255
                 exit_code = exit_code_with_signal >> 8
                 name = 'unkown name'
@@ -647,27 +775,18 @@ class ProcessPool(object):
                             else:
                                 raise
 
-                    if pid in self.copy_process_reports:
-                        if first_failed_pid is None:
-                            was_reporter = True
-                        report_path = self.copy_process_reports[pid]
-                        report = None
-                        if os.path.exists(report_path):
-                            with open(report_path, 'r') as f:
-                                report = yaml.load(f, Loader=yaml.FullLoader)
-
-                            if report is not None:
-                                self.proc_details[pid].update(report)
-                    elif first_failed_pid is None:
-                        was_reporter = False
-
             except TimeoutException as e:
                 error = traceback.format_exception(*sys.exc_info())[-1]
                 logger.error(error)
                 self.log("Timeout, killing all child processes now.")
+                self._stop_launching()
                 ProcessPool.kill_all_child_processes()
             except OSError as e:
-                if e.errno == errno.ECHILD:
+                if e.errno == errno.ECHILD and self.streams.is_active():
+                    # all children are gone but not everything they
+                    # wrote has been copied yet
+                    self.streams.poll(ProcessPool.POLL_TIMEOUT)
+                elif e.errno == errno.ECHILD:
                     # no more children running, we are done
                     logger.debug("ProcessPool: There are no child "
                                  "processes left, exiting.\n")
@@ -702,20 +821,18 @@ class ProcessPool(object):
                             name = self.proc_details[pid]['name']
                         logger.debug('PID %s (%s) was expected to fail '
                                      'because the kill signal was send. '
-                                     'Now killing its copy processes.' %
+                                     'Now closing its streams.' %
                                      (pid, name))
-                        for kpid in self.copy_processes_for_pid[pid]:
-                            try:
-                                os.kill(kpid, signal.SIGTERM)
-                            except OSError as e:
-                                if e.errno == errno.ESRCH:
-                                    # the copy process already exited
-                                    pass
-                                else:
-                                    raise
-                            else:
-                                logger.debug("Killed copy process of %d (%s): %d" %
-                                             (pid, name, kpid))
+                        # its streams might be held open by its own children
+                        self.streams.close_streams(pid)
+                self._release_cores(pid)
+                if first_failed_pid is None:
+                    self._launch_queued()
+                else:
+                    self._stop_launching()
+
+        # nothing is launched anymore after a failure or kill
+        self._stop_launching()
 
         # now wait for the watcher process, if it still exists
         try:
@@ -739,33 +856,38 @@ class ProcessPool(object):
         logger.debug('Watcher report:\n%s' %
                      yaml.dump(self.process_watcher_report))
 
+        if self.launch_error is not None:
+            raise UAPError(self.launch_error)
+
         if first_failed_pid:
-            if was_reporter:
-                log = 'Reporter crashed %s exit with code %s' % \
-                    (first_failed_pid, exit_code_with_signal)
-                if report is not None:
-                    log += ' while writing into "%s".' % \
-                        self.proc_details[first_failed_pid]['report_path']
-            else:
-                for pid in failed_pids:
-                    name = 'unkown name'
-                    if pid in self.proc_details.keys():
-                        name = self.proc_details[pid]['name']
-                    stderr_listener = self.copy_processes_for_pid[pid][1]
-                    report = self.proc_details[stderr_listener]['tail']
-                    if report and report != '':
-                        logger.error('stderr tail of %s (%s):\n%s' %
-                                     (pid, name, report))
-                log = "Pipeline crashed while working in %s" % \
-                    self.get_run().get_temp_output_directory()
+            for pid in failed_pids:
+                name = 'unkown name'
+                if pid in self.proc_details.keys():
+                    name = self.proc_details[pid]['name']
+                report = self.streams.get_report(pid, 'stderr')
+                if report and report['tail'] != '':
+                    logger.error('stderr tail of %s (%s):\n%s' %
+                                 (pid, name, report['tail']))
+            log = "Pipeline crashed while working in %s" % \
+                self.get_run().get_temp_output_directory()
             self.log(log)
             raise UAPError(log)
 
-    def _launch_process_watcher(self, watcher_report_path):
+        failed_streams = self.streams.get_failed_streams()
+        if failed_streams:
+            log = 'Copying %s failed.' % ', '.join(
+                '%s of PID %d (%s)' % (which, pid, error)
+                for pid, which, error in failed_streams)
+            self.log(log)
+            raise UAPError(log)
+
+    def _launch_process_watcher(self, watcher_report_path,
+                                launch_report_fd=None):
         '''
         Launch the process watcher via fork. The process watcher repeatedly
         determines all child processes of the main process and determines their
-        current and maximum CPU and RAM usage.
+        current and maximum CPU and RAM usage. PIDs of processes launched later
+        on are read from *launch_report_fd* until it is closed.
         Initially, this is done in short intervals (0.1 seconds), so that very
         short-lived processes can be watched but the frequency drops quickly so
         that after a while, child processes are only examined every 10 seconds.
@@ -781,6 +903,11 @@ class ProcessPool(object):
 
         watcher_pid = os.fork()
         if watcher_pid == 0:
+            # the ends of the pipes belong to the stream multiplexer
+            self.streams.close_fds()
+            if self.launch_report_fd is not None:
+                os.close(self.launch_report_fd)
+            launch_report = b''
             os.nice(10)
             try:
                 signal.signal(signal.SIGTERM, signal.SIG_DFL)
@@ -825,6 +952,24 @@ class ProcessPool(object):
                 max_data = dict()
                 first_call = None
                 while True:
+                    while launch_report_fd is not None and \
+                            select.select([launch_report_fd], [], [], 0)[0]:
+                        block = os.read(launch_report_fd, 4096)
+                        if not block:
+                            # all processes are launched
+                            os.close(launch_report_fd)
+                            launch_report_fd = None
+                            break
+                        launch_report += block
+                        *lines, launch_report = launch_report.split(b'\n')
+                        for line in lines:
+                            pid, name = line.decode().split(' ', 1)
+                            pid = int(pid)
+                            names[pid] = '%d (%s)' % (pid, name)
+                            try:
+                                procs[pid] = psutil.Process(pid)
+                            except psutil.NoSuchProcess:
+                                pass
                     pid_list = copy.deepcopy(list(procs.keys()))
                     sum_data = dict()
                     if first_call is None:
@@ -897,7 +1042,8 @@ class ProcessPool(object):
                             max_data['host cpu percentages'][k] = max(
                                 max_data['host cpu percentages'][k], v / total)
 
-                    if len(procs) <= 2 and not first_call:
+                    if len(procs) <= 2 and not first_call \
+                            and launch_report_fd is None:
                         # there's nothing more to watch, write report and exit
                         # (now there's only the controlling python process and
                         # the process watcher itself
@@ -960,15 +1106,15 @@ class ProcessPool(object):
         signal.alarm(ProcessPool.SIGTERM_TIMEOUT)
         if ProcessPool.current_instance is not None:
             self = ProcessPool.current_instance
-            for pid in self.copy_processes_for_pid.keys():
-                logger.debug("Killing %s.")
+            for pid in list(self.running_procs):
+                logger.debug("Killing %s." % pid)
                 try:
                     os.kill(pid, signal.SIGTERM)
                 except Exception as e:
                     if isinstance(e, OSError) and e.errno == errno.ESRCH:
                         logger.debug('Trying to kill already dead process %s.'
                                      % pid)
-                        return
+                        continue
                     name = 'unkown name'
                     if pid in self.proc_details.keys():
                         name = self.proc_details[pid]['name']
@@ -990,3 +1136,238 @@ class ProcessPool(object):
                 p.terminate()
             except psutil.NoSuchProcess:
                 pass
+
+
+class StreamMultiplexer(object):
+    '''
+    Copies the *stdout* and *stderr* streams of all processes of a process pool
+    from within the calling process. Every stream can be written to a file
+    and/or passed on to the next process of a pipeline. Its tail, length and
+    number of lines get recorded and, if requested, its SHA256 checksum.
+
+    Pipes to other processes are written without blocking, so a slow reader
+    only holds back the stream it reads from.
+    '''
+
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self._poller = select.epoll()
+            self._timeout_scale = 1
+        else:
+            self._poller = select.poll()
+            self._timeout_scale = 1000
+
+        # dict of file descriptor -> stream, for sources and pipes
+        self._streams_for_fd = dict()
+
+        # dict of (PID, which) -> stream, stays filled after streams closed
+        self._streams = dict()
+
+        # number of streams which have not reached their end yet
+        self._open_streams = 0
+
+    def add_stream(self, fin, pid, which, sink_path=None, pipe=None,
+                   hashing=True):
+        '''
+        Start copying *fin*, the *which* stream of process *pid*, to the file
+        *sink_path* and/or the file descriptor *pipe*.
+        '''
+        fd = fin.fileno()
+        os.set_blocking(fd, False)
+        report = {
+            'name': '[stream listener for %s of PID %d]' % (which, pid),
+            'start_time': datetime.datetime.now(),
+            'pid': os.getpid(),
+            'length': 0,
+            'lines': 0,
+        }
+        sink = None
+        if sink_path is not None:
+            sink = os.open(sink_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            report['sink'] = os.path.basename(sink_path)
+            report['sink_full_path'] = os.path.abspath(sink_path)
+        if pipe is not None:
+            os.set_blocking(pipe, False)
+        stream = {
+            'fin': fin,
+            'fd': fd,
+            'sink': sink,
+            'pipe': pipe,
+            'pending': None,
+            'eof': False,
+            'closed': False,
+            'error': None,
+            'checksum': hashlib.sha256() if hashing else None,
+            'gzipped': False,
+            'tail': b'',
+            'report': report,
+        }
+        self._streams[(pid, which)] = stream
+        self._streams_for_fd[fd] = stream
+        if pipe is not None:
+            self._streams_for_fd[pipe] = stream
+        self._open_streams += 1
+        self._poller.register(fd, select.POLLIN)
+
+    def is_active(self):
+        return self._open_streams > 0
+
+    def poll(self, timeout):
+        '''
+        Copy all data which is available within *timeout* seconds.
+        '''
+        for fd, event in self._poller.poll(timeout * self._timeout_scale):
+            stream = self._streams_for_fd.get(fd)
+            if stream is None or stream['closed']:
+                continue
+            try:
+                if fd == stream['pipe']:
+                    self._flush(stream)
+                else:
+                    self._read(stream)
+            except OSError as e:
+                stream['error'] = '%s: %s' % (type(e).__name__, e)
+                logger.error("Error while copying %s." %
+                             stream['report']['name'])
+                self._close(stream)
+
+    def _read(self, stream):
+        try:
+            block = os.read(stream['fd'], ProcessPool.COPY_BLOCK_SIZE)
+        except BlockingIOError:
+            return
+        if len(block) == 0:
+            # fin reports EOF, let's call it a day
+            stream['eof'] = True
+            self._close(stream)
+            return
+
+        report = stream['report']
+        if stream['checksum'] is not None:
+            stream['checksum'].update(block)
+        if len(block) >= ProcessPool.TAIL_LENGTH:
+            stream['tail'] = block[-ProcessPool.TAIL_LENGTH:]
+        else:
+            keep_length = ProcessPool.TAIL_LENGTH - len(block)
+            stream['tail'] = stream['tail'][-keep_length:] + block
+        if report['length'] == 0:
+            stream['gzipped'] = block[:2] == b'\x1f\x8b'
+        report['length'] += len(block)
+        report['lines'] += block.count(b'\n')
+
+        if stream['sink'] is not None:
+            view = memoryview(block)
+            while len(view) > 0:
+                view = view[os.write(stream['sink'], view):]
+
+        if stream['pipe'] is not None:
+            stream['pending'] = memoryview(block)
+            self._flush(stream)
+
+    def _flush(self, stream):
+        '''
+        Write as much pending data to the pipe as it takes without blocking.
+        While data is pending, the source is not read any further.
+        '''
+        try:
+            written = os.write(stream['pipe'], stream['pending'])
+        except BlockingIOError:
+            written = 0
+        except BrokenPipeError:
+            # the reader has gone, the writer gets SIGPIPE once we close
+            self._close(stream)
+            return
+        stream['pending'] = stream['pending'][written:]
+        if len(stream['pending']) > 0:
+            self._watch(stream, stream['pipe'], select.POLLOUT)
+        else:
+            stream['pending'] = None
+            self._watch(stream, stream['fd'], select.POLLIN)
+
+    def _watch(self, stream, fd, event):
+        '''
+        Make the poller watch either the source or the pipe of *stream*.
+        '''
+        if stream.get('watched') == fd:
+            return
+        self._poller.unregister(stream.get('watched', stream['fd']))
+        self._poller.register(fd, event)
+        stream['watched'] = fd
+
+    def _close(self, stream):
+        if stream['closed']:
+            return
+        stream['closed'] = True
+        self._open_streams -= 1
+        self._poller.unregister(stream.get('watched', stream['fd']))
+        del self._streams_for_fd[stream['fd']]
+        stream['fin'].close()
+        if stream['sink'] is not None:
+            if stream['checksum'] is not None and stream['error'] is None \
+                    and fscache.FSCache.hash_index is not None:
+                # the output file need not be read again to hash it
+                lines = None if stream['gzipped'] \
+                    else stream['report']['lines']
+                fscache.FSCache.hash_index.set_sha256(
+                    os.fstat(stream['sink']), stream['checksum'].hexdigest(),
+                    lines)
+            os.close(stream['sink'])
+        if stream['pipe'] is not None:
+            del self._streams_for_fd[stream['pipe']]
+            os.close(stream['pipe'])
+        stream['pending'] = None
+
+        report = stream['report']
+        report['end_time'] = datetime.datetime.now()
+        report['exit_code'] = 0 if stream['error'] is None else 1
+        report['tail'] = stream['tail'].decode('utf-8', errors='ignore')
+        if stream['checksum'] is not None:
+            report['sha256'] = stream['checksum'].hexdigest()
+
+    def close_streams(self, pid):
+        '''
+        Stop copying the streams of process *pid*, after reading what is
+        available right now.
+        '''
+        for which in ['stdout', 'stderr']:
+            stream = self._streams.get((pid, which))
+            if stream is None or stream['closed']:
+                continue
+            try:
+                while not stream['closed'] and stream['pending'] is None:
+                    before = stream['report']['length']
+                    self._read(stream)
+                    if stream['report']['length'] == before:
+                        break
+            except OSError:
+                pass
+            self._close(stream)
+
+    def close_fds(self):
+        '''
+        Close all file descriptors without finishing the streams. This is
+        meant for forked child processes.
+        '''
+        for fd in list(self._streams_for_fd.keys()):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        for stream in self._streams.values():
+            if stream['sink'] is not None and not stream['closed']:
+                try:
+                    os.close(stream['sink'])
+                except OSError:
+                    pass
+        self._poller.close()
+
+    def get_report(self, pid, which):
+        stream = self._streams.get((pid, which))
+        if stream is None:
+            return None
+        return stream['report']
+
+    def get_failed_streams(self):
+        return [(pid, which, stream['error'])
+                for (pid, which), stream in self._streams.items()
+                if stream['error'] is not None]
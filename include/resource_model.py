@@ -0,0 +1,260 @@
+import glob
+import json
+import math
+import os
+from logging import getLogger
+
+import yaml
+
+import state_index
+
+logger = getLogger("uap_logger")
+'''
+This module predicts the walltime, memory and cores of runs from the
+annotations of finished runs of the same step type, so cluster jobs can
+request the resources they need instead of fixed values per step. The
+estimated walltimes also weight the task graph to find its critical path.
+'''
+
+
+class ResourceModel(object):
+    '''
+    Predicts the resources of runs from the annotation files found in the
+    destination path. Walltime and memory are fitted linearly to the input
+    size of the past runs. The line is raised to cover the largest
+    underestimate of a past run and multiplied with *margin*.
+    '''
+
+    MIN_WALLTIME = 600
+    '''
+    Least walltime in seconds that is predicted.
+    '''
+
+    MIN_MEMORY = 256 * 1024 * 1024
+    '''
+    Least memory in bytes that is predicted.
+    '''
+
+    def __init__(self, pipeline, margin=1.5):
+        self._destination_path = pipeline.config['destination_path']
+        self._margin = margin
+        self._records = None
+        self._index = None
+
+    def _get_annotation_pattern(self):
+        return os.path.join(self._destination_path, '*', '*',
+                            '*-annotation.yaml')
+
+    def has_history(self):
+        '''
+        Returns whether any run in the destination path has an annotation
+        to learn from.
+        '''
+        return next(glob.iglob(self._get_annotation_pattern()), None) \
+            is not None
+
+    def _read_records(self):
+        '''
+        Returns the records of all successful runs in the destination path
+        by step type.
+        '''
+        records = dict()
+        if self._index is None:
+            self._index = state_index.ResourceIndex(
+                state_index.get_index_path(
+                    self._destination_path, '.resource-index.sqlite'))
+        for path in glob.glob(self._get_annotation_pattern()):
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            signature = '%d:%d' % (stat_result.st_size,
+                                   stat_result.st_mtime_ns)
+            value = self._index.get(path, signature)
+            if value is None:
+                value = json.dumps(self.read_annotation(path))
+                self._index.set(path, signature, value)
+            record = json.loads(value)
+            if record:
+                records.setdefault(record['step type'], list()).append(record)
+        logger.info('Read the resources of %d runs for the prediction.' %
+                    sum(len(r) for r in records.values()))
+        return records
+
+    @staticmethod
+    def read_annotation(path):
+        '''
+        Returns the step type, input size, walltime, peak memory and peak
+        cores used by the run annotated in *path* or None if the run failed
+        or the annotation lacks the information.
+        '''
+        try:
+            with open(path, 'r') as fl:
+                anno = yaml.load(fl, Loader=yaml.FullLoader)
+        except (IOError, yaml.YAMLError):
+            return None
+        try:
+            if anno['run'].get('error'):
+                return None
+            usage = anno['pipeline_log']['process_watcher']['max']['sum']
+            return {
+                'step type': anno['step']['type'],
+                'input size': anno['run'].get('input size'),
+                'walltime': (anno['end_time'] -
+                             anno['start_time']).total_seconds(),
+                'memory': usage['rss'],
+                'cores': usage['cpu_percent'] / 100.0}
+        except (KeyError, TypeError, AttributeError):
+            return None
+
+    @staticmethod
+    def _fit(points, size):
+        '''
+        Returns the value predicted for *size* from the (size, value)
+        *points*. Without a usable size, the largest value is returned.
+        '''
+        if size is not None:
+            sized = [(x, y) for x, y in points if x is not None]
+            if len(set(x for x, _ in sized)) > 1:
+                mean_x = sum(x for x, _ in sized) / len(sized)
+                mean_y = sum(y for _, y in sized) / len(sized)
+                slope = sum((x - mean_x) * (y - mean_y) for x, y in sized) / \
+                    sum((x - mean_x) ** 2 for x, _ in sized)
+                if slope >= 0:
+                    intercept = mean_y - slope * mean_x
+                    # no past run may have needed more than predicted
+                    intercept += max(y - intercept - slope * x
+                                     for x, y in sized)
+                    return intercept + slope * size
+        return max(y for _, y in points)
+
+    def _get_records(self, step):
+        if self._records is None:
+            self._records = self._read_records()
+        return self._records.get(step.get_step_type())
+
+    def estimate_walltime(self, run):
+        '''
+        Returns the expected walltime of *run* in seconds without margin or
+        None if no run of its step type has finished yet.
+        '''
+        records = self._get_records(run.get_step())
+        if not records:
+            return None
+        points = [(r['input size'], r['walltime']) for r in records]
+        if run.get_input_size() is None:
+            # the typical rather than the largest past run
+            walltimes = sorted(y for _, y in points)
+            return walltimes[len(walltimes) // 2]
+        return self._fit(points, run.get_input_size())
+
+    def get_critical_path_lengths(self, p, tasks=None):
+        '''
+        Returns the length in seconds of the longest path through each task
+        of the pipeline *p*, weighted by the estimated walltimes of the
+        unfinished tasks. Tasks on the critical path have the largest value
+        and all tasks of a chain have the same. Only *tasks* (default: all)
+        and their descendants are weighted and get a length.
+        '''
+        if tasks is None:
+            tasks = p.all_tasks_topologically_sorted
+        else:
+            tasks = get_descendants(p, tasks)
+        weights = dict()
+        estimates = list()
+        for task in tasks:
+            if task.get_task_state() == p.states.FINISHED:
+                weights[str(task)] = 0.0
+                continue
+            weights[str(task)] = self.estimate_walltime(task.get_run())
+            if weights[str(task)] is not None:
+                estimates.append(weights[str(task)])
+        # tasks without history weigh as much as an average task
+        default = sum(estimates) / len(estimates) if estimates else 1.0
+        for key, weight in weights.items():
+            if weight is None:
+                weights[key] = default
+
+        parents = dict()
+        children = dict((str(task), list()) for task in tasks)
+        for task in tasks:
+            parents[str(task)] = [str(parent) for parent in
+                                  task.get_parent_tasks()
+                                  if str(parent) in children]
+            for parent in parents[str(task)]:
+                children[parent].append(str(task))
+        # longest paths ending at and starting from each task
+        head = dict()
+        for task in tasks:
+            key = str(task)
+            head[key] = weights[key] + max(
+                [head[parent] for parent in parents[key]] or [0.0])
+        tail = dict()
+        for task in reversed(tasks):
+            key = str(task)
+            tail[key] = weights[key] + max(
+                [tail[child] for child in children[key]] or [0.0])
+        return dict((key, head[key] + tail[key] - weights[key])
+                    for key in weights.keys())
+
+    def predict(self, run):
+        '''
+        Returns a dictionary with the predicted walltime in seconds, memory
+        in bytes and useful cores of *run* or None if no run of its step
+        type has finished yet.
+        '''
+        step = run.get_step()
+        records = self._get_records(step)
+        if not records:
+            return None
+        size = run.get_input_size()
+        walltime = self._fit(
+            [(r['input size'], r['walltime']) for r in records], size)
+        memory = self._fit(
+            [(r['input size'], r['memory']) for r in records], size)
+        cores = max(math.ceil(r['cores']) for r in records)
+        return {
+            'walltime': max(walltime * self._margin, self.MIN_WALLTIME),
+            'memory': max(memory * self._margin, self.MIN_MEMORY),
+            'cores': min(max(cores, 1), step.get_cores())}
+
+    @staticmethod
+    def format_walltime(seconds):
+        '''
+        Returns *seconds* as hours:minutes:seconds.
+        '''
+        seconds = int(math.ceil(seconds))
+        return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                                 seconds % 60)
+
+
+def get_descendants(p, tasks):
+    '''
+    Returns *tasks* and all tasks of the pipeline *p* which depend on them,
+    in topological order.
+    '''
+    keys = set(str(task) for task in tasks)
+    descendants = list()
+    for task in p.all_tasks_topologically_sorted:
+        if str(task) not in keys and not any(
+                str(parent) in keys for parent in task.get_parent_tasks()
+                if parent is not None):
+            continue
+        keys.add(str(task))
+        descendants.append(task)
+    return descendants
+
+
+def sort_by_critical_path(p, tasks):
+    '''
+    Returns *tasks* with those on the longest paths through them and their
+    descendants first, weighted by the walltimes of past runs. Without any
+    past run they keep the topological order of the pipeline *p*.
+    '''
+    order = p.all_tasks_topologically_sorted
+    model = ResourceModel(p)
+    if not model.has_history():
+        return sorted(tasks, key=order.index)
+    path_lengths = model.get_critical_path_lengths(p, tasks)
+    return sorted(tasks, key=lambda task: (-path_lengths[str(task)],
+                                           order.index(task)))
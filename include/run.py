@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta
 import json
 import fscache
+import tempfile
 from logging import getLogger
 import os
 import pwd
 import stat
 import platform
+import socket
 from deepdiff import DeepDiff
 from collections import OrderedDict
 import inspect
@@ -78,6 +80,15 @@ class Run(object):
         self._public_info = dict()
         self._input_files = set()
         self._output_files = dict()
+        self._child_run_ids = dict()
+        '''
+        Run IDs under which output files are passed to child steps, if they
+        differ from the ID of this run.
+        '''
+        self._copy_sources = dict()
+        '''
+        Input files which output files are exact copies of.
+        '''
         out_conns = self._step.get_out_connections(with_optional=False)
         for out_connection in out_conns:
             self.add_out_connection(out_connection)
@@ -106,6 +117,11 @@ class Run(object):
         '''
         Contains path to currently used temporary directory if set.
         '''
+        self._scratch_directory = None
+        '''
+        Directory in the scratch path the temporary directory links to, if
+        the run uses one.
+        '''
         self._known_paths = dict()
 
     def __enter__(self):
@@ -116,6 +132,9 @@ class Run(object):
 
     def reset_fsc(self):
         self.fsc.clear()
+        fscache.FSCache.invalidate(self.get_output_directory())
+        if self._temp_directory is not None:
+            fscache.FSCache.invalidate(self._temp_directory)
 
     def new_exec_group(self):
         eg = exec_group.ExecGroup(self)
@@ -125,6 +144,21 @@ class Run(object):
     def get_exec_groups(self):
         return self._exec_groups
 
+    def get_exec_group_dependencies(self):
+        '''
+        Returns for each exec group the indices of the earlier exec groups it
+        has to wait for, because they mention a path that is the same as or
+        a prefix of one of its paths, or the other way round.
+        '''
+        paths = [group.get_paths() for group in self._exec_groups]
+        dependencies = list()
+        for index, group_paths in enumerate(paths):
+            dependencies.append(set(
+                earlier for earlier in range(index)
+                if any(a.startswith(b) or b.startswith(a)
+                       for a in paths[earlier] for b in group_paths)))
+        return dependencies
+
     def get_step(self):
         return self._step
 
@@ -179,6 +213,23 @@ class Run(object):
     def add_known_paths(self, known_paths_dict):
         self._known_paths.update(known_paths_dict)
 
+    def get_line_count(self, path):
+        '''
+        Returns the number of lines of the file *path*, as recorded when it
+        was written or hashed, or None if it is unknown or the file changed
+        since.
+        '''
+        anno_data = self.written_anno_data()
+        if anno_data:
+            new_dest = self.get_step().get_pipeline().config['destination_path']
+            old_dest = anno_data['config']['destination_path']
+            meta_data = anno_data['run']['known_paths'].get(
+                path.replace(new_dest, old_dest), dict())
+            if 'lines' in meta_data and self.fsc.exists(path) \
+                    and self.fsc.getsize(path) == meta_data.get('size'):
+                return meta_data['lines']
+        return self.fsc.line_count_of(path)
+
     def get_temp_paths(self):
         '''
         Returns a set of all temporary paths which belong to this run.
@@ -212,6 +263,76 @@ class Run(object):
 
         return self._temp_directory
 
+    def get_scratch_directory(self):
+        '''
+        Returns the directory in the configured *scratch_path* which the
+        temporary output directory links to or None if the run writes to
+        the destination path.
+        '''
+        return self._scratch_directory
+
+    def create_temp_output_directory(self):
+        '''
+        Creates the temporary output directory. If a *scratch_path* is
+        configured, the directory is a link to a new directory there.
+        '''
+        temp_directory = self.get_temp_output_directory()
+        scratch_path = self.get_step().get_pipeline().config.get(
+            'scratch_path')
+        if scratch_path:
+            # variables such as $TMPDIR are set on the executing host
+            scratch_path = os.path.expandvars(
+                os.path.expanduser(scratch_path))
+            try:
+                if '$' in scratch_path:
+                    raise OSError('undefined variable')
+                self._scratch_directory = self._create_scratch_directory(
+                    scratch_path)
+            except OSError as e:
+                logger.warning('Cannot use scratch path %s, writing to the '
+                               'destination path instead: %s' %
+                               (scratch_path, e))
+        if self._scratch_directory is None:
+            os.makedirs(temp_directory)
+        else:
+            os.makedirs(os.path.dirname(temp_directory), exist_ok=True)
+            os.symlink(self._scratch_directory, temp_directory)
+            logger.info('Writing temporary files of %s/%s to %s.' %
+                        (self.get_step(), self.get_run_id(),
+                         self._scratch_directory))
+
+    def _create_scratch_directory(self, scratch_path):
+        destination = self.get_step().get_pipeline().config[
+            'destination_path']
+        base = tempfile.mkdtemp(prefix='uap-', dir=scratch_path)
+        # relative paths from the temporary output directory lead through
+        # here to the destination path
+        for name in os.listdir(destination):
+            if name != 'temp':
+                os.symlink(os.path.join(destination, name),
+                           os.path.join(base, name))
+        path = os.path.join(base, 'temp',
+                            os.path.basename(self.get_temp_output_directory()))
+        os.makedirs(path)
+        return path
+
+    def remove_temp_output_directory(self):
+        '''
+        Removes the temporary output directory if it is empty, and with it
+        the directory in the scratch path if the run used one.
+        '''
+        if self._scratch_directory is None:
+            os.rmdir(self.get_temp_output_directory())
+            return
+        os.rmdir(self._scratch_directory)
+        base = os.path.dirname(os.path.dirname(self._scratch_directory))
+        for name in os.listdir(base):
+            if os.path.islink(os.path.join(base, name)):
+                os.unlink(os.path.join(base, name))
+        os.rmdir(os.path.join(base, 'temp'))
+        os.rmdir(base)
+        os.unlink(self.get_temp_output_directory())
+
     @cache
     def get_run_structure(self, commands=True):
         '''
@@ -241,7 +362,7 @@ class Run(object):
         for tool in tools:
             if not tool_conf[tool]['ignore_version'] \
                     and not p.args.no_tool_checks:
-                tool_info = p.tool_versions[tool]
+                tool_info = p.get_tool_version(tool)
                 real_tool_path = tool_info['used_path']
                 response = tool_info['response'].replace(real_tool_path, tool)
                 cmd_by_eg['tool_versions'][tool] = response
@@ -260,12 +381,8 @@ class Run(object):
                 continue
             task_id = '%s/%s' % (prun.get_step().get_step_name(),
                                  prun.get_run_id())
-            hashsum = misc.str_to_sha256(
-                json.dumps(
-                    prun.get_run_structure(),
-                    sort_keys=True,
-                    ensure_ascii=False).encode('utf8'))
-            cmd_by_eg['parent hashes'][task_id] = hashsum
+            cmd_by_eg['parent hashes'][task_id] = \
+                prun.get_run_structure_hash()
 
         if not commands:
             return cmd_by_eg
@@ -288,6 +405,17 @@ class Run(object):
 
         return cmd_by_eg
 
+    @cache
+    def get_run_structure_hash(self):
+        '''
+        Returns the sha256 hash of the run structure.
+        '''
+        return misc.str_to_sha256(
+            json.dumps(
+                self.get_run_structure(),
+                sort_keys=True,
+                ensure_ascii=False).encode('utf8'))
+
     def get_changes(self):
         anno_data = self.written_anno_data()
         if not anno_data:
@@ -297,6 +425,21 @@ class Run(object):
         new_struct = self.get_run_structure()
         return DeepDiff(old_struct, new_struct)
 
+    def has_changed_structure(self, anno_data=None):
+        '''
+        Returns True if the run structure differs from the one in the
+        annotation file. Only annotations without a structure hash are
+        compared with DeepDiff, use *get_changes()* to see what changed.
+        '''
+        if anno_data is None:
+            anno_data = self.written_anno_data()
+        if not anno_data:
+            return True
+        old_hash = anno_data['run'].get('structure hash')
+        if old_hash is None:
+            return bool(self.get_changes())
+        return old_hash != self.get_run_structure_hash()
+
     def dependencies(self):
         """
         Returns a dict with a set of input files for each output file.
@@ -311,6 +454,24 @@ class Run(object):
                 dependencies[out_file].update(set(input_files))
         return dependencies
 
+    def get_input_size(self):
+        '''
+        Returns the total size of the input files of the run in bytes or
+        None if an input file does not exist (yet).
+        '''
+        input_files = set()
+        for files in self.dependencies().values():
+            input_files.update(files)
+        size = 0
+        for path in input_files:
+            if path is None:
+                continue
+            try:
+                size += self.fsc.getsize(path)
+            except OSError:
+                return None
+        return size
+
     def file_changes(self, do_hash=False, report_correct=False):
         anno_data = self.written_anno_data()
         if not anno_data:
@@ -433,11 +594,64 @@ class Run(object):
         if self.fsc.exists(self.get_queued_ping_file() + '.bad'):
             return states.BAD
 
+        if do_hash:
+            # checksums are always computed
+            return self._evaluate_state(do_hash=True)
+        p = self.get_step().get_pipeline()
+        task_id = '%s/%s' % (self.get_step(), self.get_run_id())
+        signature = self.get_state_signature()
+        state = p.state_index.get(task_id, signature)
+        if state is None:
+            state = self._evaluate_state()
+            p.state_index.set(task_id, signature, state)
+        return state
+
+    def get_state_signature(self):
+        '''
+        Returns a hash of everything the state of this run is computed from,
+        apart from ping files: its run structure, its annotation file, its
+        output and input files and the states of its parent runs.
+        '''
+        def file_signature(path):
+            try:
+                stat_result = self.fsc.stat(path)
+            except OSError:
+                return None
+            return [stat_result.st_size, stat_result.st_mtime_ns]
+
+        p = self.get_step().get_pipeline()
+        signature = {
+            'uap version': p.args.uap_version,
+            'structure': self.get_run_structure_hash(),
+            'annotation': file_signature(self.get_annotation_path()),
+            'files': dict(),
+            'parents': sorted(
+                '%s/%s %s' % (parent.get_step(), parent.get_run_id(),
+                              parent.get_state())
+                for parent in self.get_parent_runs())
+        }
+        paths = set()
+        for out_file, input_files in self.dependencies().items():
+            paths.add(out_file)
+            paths.add(out_file + abst.AbstractStep.VOLATILE_SUFFIX)
+            paths.update(input_files)
+        for files in self.get_output_files_abspath().values():
+            for out_file in files.keys():
+                paths.add(out_file)
+                paths.add(out_file + abst.AbstractStep.VOLATILE_SUFFIX)
+        for path in paths:
+            if path:
+                signature['files'][path] = file_signature(path)
+        return misc.str_to_sha256(json.dumps(
+            signature, sort_keys=True, ensure_ascii=False).encode('utf8'))
+
+    def _evaluate_state(self, do_hash=False):
+        states = self.get_step().get_pipeline().states
         anno_data = self.written_anno_data()
         if anno_data:
             if anno_data.get('run', dict()).get('error'):
                 return states.BAD
-            if self.get_changes():
+            if self.has_changed_structure(anno_data):
                 return states.CHANGED
 
         has_volitile_parent = False
@@ -550,7 +764,7 @@ class Run(object):
         else:
             self._public_info[key] = value
 
-    def add_output_file(self, tag, out_path, in_paths):
+    def add_output_file(self, tag, out_path, in_paths, child_run_id=None):
         '''
         Add an output file to this run. Output file names must be unique across
         all runs defined by a step, so it may be a good idea to include the
@@ -571,6 +785,10 @@ class Run(object):
                        directory, and you can obtain them via
                        *AbstractStep.run_ids_and_input_files_for_connection*
                        and related functions.
+          - *child_run_id*: The run ID under which child steps receive this
+                           output file. Defaults to the ID of this run. This
+                           lets a single task produce the files of several
+                           runs downstream.
 
         '''
         head, tail = os.path.split(out_path)
@@ -614,6 +832,11 @@ class Run(object):
         logger.debug('Adding files %s as for connection %s in %s for run %s.' % (
             out_path, out_connection, str(self.get_step()), self.get_run_id()))
         self._output_files[out_connection][out_path] = in_paths
+        if child_run_id is not None and child_run_id != self.get_run_id():
+            if '/' in child_run_id:
+                raise UAPError("Error: A run ID must not contain a slash: "
+                               "%s." % child_run_id)
+            self._child_run_ids[out_path] = child_run_id
         return out_path
 
     def add_temporary_file(self, prefix='temp', suffix='', designation=None):
@@ -771,6 +994,36 @@ class Run(object):
     def get_output_files(self):
         return self._output_files
 
+    def get_child_run_id(self, out_path):
+        '''
+        Returns the run ID under which child steps receive the output file
+        *out_path*, which may be given with or without the output directory.
+        '''
+        if out_path is None:
+            return self.get_run_id()
+        return self._child_run_ids.get(
+            os.path.basename(out_path), self.get_run_id())
+
+    def has_child_run_ids(self):
+        '''
+        Returns True if output files of this run are passed to child steps
+        under other run IDs.
+        '''
+        return bool(self._child_run_ids)
+
+    def set_copy_source(self, out_path, in_path):
+        '''
+        Declare that the output file *out_path* is an exact copy of *in_path*,
+        so it gets the known checksum of *in_path* instead of being read.
+        '''
+        self._copy_sources[os.path.basename(out_path)] = in_path
+
+    def get_copy_source(self, out_path):
+        '''
+        Returns the input file that *out_path* is a copy of or None.
+        '''
+        return self._copy_sources.get(os.path.basename(out_path))
+
     def get_output_files_abspath(self):
         '''
         Return a dictionary of all defined output files, grouped by connection
@@ -922,6 +1175,7 @@ class Run(object):
         log['run']['private_info'] = self._private_info
         log['run']['public_info'] = self._public_info
         log['run']['temp_directory'] = self.get_temp_output_directory()
+        log['run']['scratch_directory'] = self.get_scratch_directory()
         # if a run submit script was used ...
         if os.path.exists(self.get_submit_script_file()):
             # ... read it and store it ...
@@ -930,7 +1184,9 @@ class Run(object):
             # ... finally delete it
             os.unlink(self.get_submit_script_file())
         log['run']['known_paths'] = self.get_known_paths()
+        log['run']['input size'] = self.get_input_size()
         log['run']['structure'] = self.get_run_structure()
+        log['run']['structure hash'] = self.get_run_structure_hash()
         log['run']['hostname'] = platform.node()
         log['run']['platform'] = platform.platform()
         log['run']['user'] = pwd.getpwuid(os.getuid())[0]
@@ -954,7 +1210,7 @@ class Run(object):
         else:
             log['tool_versions'] = {}
             for tool in self.get_step()._tools.keys():
-                log['tool_versions'][tool] = p.tool_versions[tool]
+                log['tool_versions'][tool] = p.get_tool_version(tool)
         log['pipeline_log'] = self.get_step()._pipeline_log
         log['start_time'] = self.get_step().start_time
         log['end_time'] = self.get_step().end_time
@@ -1003,3 +1259,94 @@ class Run(object):
                     abst.AbstractStep.PING_TIMEOUT:
                 return inactivity
         return False
+
+    def claim(self, worker, states):
+        '''
+        Claims the run for *worker* by creating its queued ping file
+        exclusively, so only one of many workers sharing the destination
+        path gets it. Returns False and releases the claim again if the run
+        is queued, executing or its state is not in *states* anymore.
+        '''
+        queued_ping_file = self.get_queued_ping_file()
+        os.makedirs(self.get_output_directory(), exist_ok=True)
+        try:
+            fd = os.open(queued_ping_file,
+                         os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        claim_info = dict()
+        claim_info['step'] = str(self.get_step())
+        claim_info['run_id'] = self.get_run_id()
+        claim_info['worker'] = worker
+        claim_info['submit_time'] = datetime.now()
+        with os.fdopen(fd, 'w') as f:
+            f.write(yaml.dump(claim_info, default_flow_style=False))
+        self.reset_fsc()
+        # another worker may have finished the run since its state was read
+        if os.path.exists(self.get_executing_ping_file()) or \
+                self._evaluate_state() not in states:
+            os.unlink(queued_ping_file)
+            self.reset_fsc()
+            return False
+        return True
+
+    def get_claim(self):
+        '''
+        Returns the content of the queued ping file if a worker claimed the
+        run and None otherwise.
+        '''
+        try:
+            with open(self.get_queued_ping_file(), 'r') as buff:
+                info = yaml.load(buff, Loader=yaml.FullLoader)
+        except IOError:
+            return None
+        if isinstance(info, dict) and 'worker' in info:
+            return info
+        return None
+
+    def is_stale_claim(self):
+        '''
+        Returns time of inactivity if a worker claimed the run and did not
+        renew its claim within the ping timeout.
+        '''
+        try:
+            last_activity = datetime.fromtimestamp(
+                os.path.getmtime(self.get_queued_ping_file()))
+        except OSError:
+            return False
+        inactivity = datetime.now() - last_activity
+        if inactivity.total_seconds() > abst.AbstractStep.PING_TIMEOUT and \
+                self.get_claim() is not None:
+            return inactivity
+        return False
+
+    def release_stale_claim(self):
+        '''
+        Removes the stale claim of a worker and the execution ping file it
+        left behind so the run can be claimed again. Returns True if the
+        claim was released by this process.
+        '''
+        queued_ping_file = self.get_queued_ping_file()
+        moved = '%s.stale-%s-%d' % (queued_ping_file, socket.gethostname(),
+                                    os.getpid())
+        try:
+            os.rename(queued_ping_file, moved)
+        except OSError:
+            # released by another worker
+            return False
+        last_activity = datetime.fromtimestamp(os.path.getmtime(moved))
+        if (datetime.now() - last_activity).total_seconds() <= \
+                abst.AbstractStep.PING_TIMEOUT:
+            # another worker released and claimed the run in the meantime
+            try:
+                os.link(moved, queued_ping_file)
+            except OSError:
+                pass
+            os.unlink(moved)
+            return False
+        os.unlink(moved)
+        self.reset_fsc()
+        if self.is_stale():
+            self.get_step().remove_ping_file(self.get_executing_ping_file())
+        self.reset_fsc()
+        return True
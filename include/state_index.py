@@ -0,0 +1,208 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import tempfile
+from logging import getLogger
+
+logger = getLogger("uap_logger")
+'''
+This module stores values which are expensive to compute, like task states
+and file checksums, together with a signature of everything they were
+computed from. As long as the signature is unchanged, a stored value can be
+reused.
+'''
+
+NETWORK_FILE_SYSTEMS = {'nfs', 'nfs4', 'lustre', 'gpfs', 'beegfs', 'cifs',
+                        'smb3', 'smbfs', 'ceph', 'glusterfs',
+                        'fuse.glusterfs', 'fuse.sshfs', 'panfs', 'afs'}
+'''
+File system types on which SQLite cannot lock its databases reliably.
+'''
+
+
+def get_file_system_type(path):
+    '''
+    Returns the type of the file system *path* is on as listed in
+    /proc/mounts or None if it is unknown.
+    '''
+    path = os.path.realpath(path)
+    fs_type = None
+    mount_point = ''
+    try:
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # spaces in mount points are escaped as \040
+                point = fields[1].replace('\\040', ' ')
+                if len(point) > len(mount_point) and (
+                        path == point or
+                        path.startswith(point.rstrip('/') + '/')):
+                    mount_point = point
+                    fs_type = fields[2]
+    except IOError:
+        return None
+    return fs_type
+
+
+def get_index_path(destination_path, name):
+    '''
+    Returns the path of the index file *name* of *destination_path*.
+    Processes on different hosts cannot share an SQLite database on a
+    network file system, so the indexes of a destination path on one are
+    kept per host in the temporary directory. Returns None, which disables
+    the index, if that is on a network file system, too.
+    '''
+    if get_file_system_type(destination_path) not in NETWORK_FILE_SYSTEMS:
+        return os.path.join(destination_path, name)
+    temp_dir = tempfile.gettempdir()
+    if get_file_system_type(temp_dir) in NETWORK_FILE_SYSTEMS:
+        logger.info('Not using %s, %s is on a network file system.' %
+                    (name, destination_path))
+        return None
+    key = hashlib.sha256(
+        os.path.realpath(destination_path).encode()).hexdigest()[:16]
+    index_dir = os.path.join(temp_dir, 'uap-%d' % os.getuid(), key)
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+    except OSError as e:
+        logger.warning('Not using %s: %s' % (name, e))
+        return None
+    return os.path.join(index_dir, name)
+
+
+class StateIndex(object):
+    '''
+    A persistent index of task states backed by an SQLite database. Errors
+    with the database only disable the index, they never fail a command.
+    Without a *path*, see *get_index_path()*, the index stores nothing.
+    '''
+
+    TABLE = 'task_states'
+
+    def __init__(self, path):
+        self._path = path
+        self._connection = None
+        self._pid = None
+        self._pending = dict()
+        self._disabled = path is None
+        atexit.register(self.flush)
+
+    def __reduce__(self):
+        # a connection is only valid for the process it was opened in
+        return (type(self), (self._path,))
+
+    def _connect(self):
+        if self._disabled:
+            return None
+        if self._pid != os.getpid():
+            # forked processes must not use the connection of their parent
+            self._pending = dict()
+            try:
+                self._connection = sqlite3.connect(self._path, timeout=10)
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS %s ('
+                    'key TEXT PRIMARY KEY, '
+                    'signature TEXT NOT NULL, '
+                    'value TEXT NOT NULL)' % self.TABLE)
+            except sqlite3.Error as e:
+                self._disable(e)
+                return None
+            self._pid = os.getpid()
+        return self._connection
+
+    def _disable(self, error):
+        logger.warning('Not using the index %s: %s' %
+                       (self._path, error))
+        self._disabled = True
+        self._connection = None
+
+    def get(self, key, signature):
+        '''
+        Returns the value stored for *key* if it was stored with the same
+        *signature* and None otherwise.
+        '''
+        if key in self._pending:
+            stored_signature, value = self._pending[key]
+            return value if stored_signature == signature else None
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                'SELECT signature, value FROM %s WHERE key = ?' % self.TABLE,
+                (key,)).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+        if row is None or row[0] != signature:
+            return None
+        return row[1]
+
+    def set(self, key, signature, value):
+        '''
+        Store the *value* of *key*. Entries are written by *flush()*, which
+        is called at exit.
+        '''
+        if self._connect() is None:
+            return
+        self._pending[key] = (signature, value)
+
+    def flush(self):
+        if not self._pending or self._pid != os.getpid() or self._disabled:
+            return
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO %s VALUES (?, ?, ?)' % self.TABLE,
+                    [(key, signature, value) for key,
+                     (signature, value) in self._pending.items()])
+        except sqlite3.Error as e:
+            self._disable(e)
+        self._pending = dict()
+
+
+class HashIndex(StateIndex):
+    '''
+    A persistent index of SHA256 checksums and line counts of files.
+    Entries are stored by device and inode and are valid as long as size
+    and modification time of the file are unchanged.
+    '''
+
+    TABLE = 'file_hashes'
+
+    def _get_entry(self, stat_result):
+        value = self.get(
+            '%d:%d' % (stat_result.st_dev, stat_result.st_ino),
+            '%d:%d' % (stat_result.st_size, stat_result.st_mtime_ns))
+        return value.split() if value else None
+
+    def get_sha256(self, stat_result):
+        entry = self._get_entry(stat_result)
+        return entry[0] if entry else None
+
+    def get_line_count(self, stat_result):
+        '''
+        Returns the number of lines of the file or None if it is unknown.
+        '''
+        entry = self._get_entry(stat_result)
+        return int(entry[1]) if entry and len(entry) > 1 else None
+
+    def set_sha256(self, stat_result, sha256, lines=None):
+        value = sha256 if lines is None else '%s %d' % (sha256, lines)
+        self.set(
+            '%d:%d' % (stat_result.st_dev, stat_result.st_ino),
+            '%d:%d' % (stat_result.st_size, stat_result.st_mtime_ns),
+            value)
+
+
+class ResourceIndex(StateIndex):
+    '''
+    A persistent index of the resources used by finished runs as read from
+    their annotation files. Entries are stored by the path of the annotation
+    and are valid as long as its size and modification time are unchanged.
+    '''
+
+    TABLE = 'run_resources'
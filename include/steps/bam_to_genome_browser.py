@@ -132,10 +132,10 @@ class BamToBedgraph(AbstractStep):
 
                             if is_gzipped:
                                 # 1.1 command: Uncompress file to fifo
-                                pigz = [self.get_tool('pigz'),
-                                        '--decompress',
-                                        '--processes', '1',
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    cores=1,
+                                    format=self.get_compression_format(
+                                        input_paths[0]))
                                 pipe.add_command(pigz)
 
                             output_file = str()
@@ -60,6 +60,7 @@ class Bowtie2(AbstractStep):
         self.require_tool('mkfifo')
         # Step was tested for pigz release 2.3.1
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         # Step was tested for bowtie2 release 2.2.9
         self.require_tool('bowtie2')
 
@@ -431,6 +432,12 @@ class Bowtie2(AbstractStep):
                         description='Use pigz to compress bowtie2 results.')
         self.add_option('dd-blocksize', str, optional=True, default="2M")
         self.add_option('pigz-blocksize', str, optional=True, default="2048")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, cc):
 
@@ -538,13 +545,11 @@ class Bowtie2(AbstractStep):
                                 ]
                                 unzip_pipe.add_command(dd_in)
                                 # 2.2 command: Uncompress data
-                                pigz = [self.get_tool('pigz'),
-                                        '--processes',
-                                        str(self.get_cores()),
-                                        '--decompress',
-                                        '--blocksize',
-                                        self.get_option('pigz-blocksize'),
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    format=self.get_compression_format(
+                                        input_path),
+                                    blocksize=self.get_option(
+                                        'pigz-blocksize'))
                                 unzip_pipe.add_command(pigz)
                                 # 2.3 Write file in 'dd-blocksize' chunks to
                                 # fifo
@@ -635,12 +640,10 @@ class Bowtie2(AbstractStep):
                             bowtie2_pipe.add_command(
                                 bowtie2, stderr_path=log_stderr)
                             # Compress bowtie2 output
-                            pigz = [self.get_tool('pigz'),
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--stdout']
+                            pigz = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'),
+                                blocksize=self.get_option('pigz-blocksize'))
                             if not self.get_option('fifo'):
                                 bowtie2_pipe.add_command(
                                     pigz, stdout_path=out_file)
@@ -224,12 +224,11 @@ class Bowtie2GenerateIndex(AbstractStep):
                                     'if=%s' %
                                     input_path]
                                 # 2.2 command: Uncompress data
-                                pigz = [self.get_tool('pigz'),
-                                        '--processes', str(self.get_cores()),
-                                        '--blocksize',
-                                        self.get_option('pigz-blocksize'),
-                                        '--decompress',
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    format=self.get_compression_format(
+                                        input_path),
+                                    blocksize=self.get_option(
+                                        'pigz-blocksize'))
                                 # 2.3 Write file chunks to fifo
                                 dd_out = [
                                     self.get_tool('dd'),
@@ -47,6 +47,7 @@ class BwaBacktrack(AbstractStep):
         self.require_tool('mkfifo')
         # Step was tested for pigz release 2.3.1
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         # Step was tested for bwa release 0.7.15-r1140
         self.require_tool('bwa')
 
@@ -207,6 +208,12 @@ class BwaBacktrack(AbstractStep):
         # [Options for 'pigz':]
         self.add_option('pigz-blocksize', str, optional=True,
                         default="2048")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, cc):
 
@@ -406,12 +413,10 @@ class BwaBacktrack(AbstractStep):
                             bwa_sampe_pipe.add_command(bwa_sampe)
 
                             # 2. Compress 'bwa sampe' output
-                            pigz = [self.get_tool('pigz'),
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--stdout']
+                            pigz = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'),
+                                blocksize=self.get_option('pigz-blocksize'))
                             bwa_sampe_pipe.add_command(pigz)
                             # 3. Write 'bwa sampe' output to file
                             dd = [
@@ -440,12 +445,10 @@ class BwaBacktrack(AbstractStep):
                             bwa_samse_pipe.add_command(bwa_samse)
 
                             # 2. Compress 'bwa samse' output
-                            pigz = [self.get_tool('pigz'),
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--stdout']
+                            pigz = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'),
+                                blocksize=self.get_option('pigz-blocksize'))
                             bwa_samse_pipe.add_command(pigz)
                             # 3. Write 'bwa samse' output to file
                             dd = [
@@ -32,6 +32,7 @@ class BwaMem(AbstractStep):
         self.require_tool('dd')
         self.require_tool('mkfifo')
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         self.require_tool('bwa')
 
         # Options to set bwa mem flags
@@ -134,6 +135,12 @@ class BwaMem(AbstractStep):
 
         # Options for dd
         self.add_option('dd-blocksize', str, optional=True, default="256k")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, run_ids_connections_files):
 
@@ -242,8 +249,9 @@ class BwaMem(AbstractStep):
 
                         bwa_mem_pipe.add_command(bwa_mem)
                         # Compress bwa mem output
-                        pigz = [self.get_tool('pigz'),
-                                '--stdout']
+                        pigz = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'))
                         bwa_mem_pipe.add_command(pigz)
                         # Write bowtie2 output to file
                         dd = [
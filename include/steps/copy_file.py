@@ -9,6 +9,9 @@ class CopyFile(AbstractStep):
     '''
     copies a file or a list of files defined by there
     dependencies and filenames
+
+    By default, a copy is a reflink if the file system supports it, a
+    hardlink if the input file is read-only and an in-kernel copy otherwise.
     '''
 
     def __init__(self, pipeline):
@@ -20,6 +23,14 @@ class CopyFile(AbstractStep):
         self.add_connection('out/copied')
 
         self.require_tool('cp')
+        self.require_tool('clone_file')
+
+        self.add_option('mode', str, optional=True, default='auto',
+                        choices=['auto', 'reflink', 'hardlink', 'copy', 'cp'],
+                        description="How files are copied. auto tries "
+                        "reflink, hardlink for read-only input files and "
+                        "copy in this order. copy lets the kernel copy the "
+                        "data and cp calls the cp tool.")
 
     def runs(self, run_ids_connections_files):
         for run_id in run_ids_connections_files.keys():
@@ -32,6 +43,12 @@ class CopyFile(AbstractStep):
                         out_file = run.add_output_file('copied',
                                                        file_name,
                                                        input_paths)
-                        cp = [self.get_tool('cp'),
-                              input_file, out_file]
+                        if self.get_option('mode') == 'cp':
+                            cp = [self.get_tool('cp'),
+                                  input_file, out_file]
+                        else:
+                            cp = [self.get_tool('clone_file'),
+                                  '--mode', self.get_option('mode'),
+                                  input_file, out_file]
                         cp_exec_group.add_command(cp)
+                        run.set_copy_source(out_file, input_file)
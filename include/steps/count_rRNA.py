@@ -52,11 +52,8 @@ class SamToFastq(AbstractStep):
                     with exec_group.add_pipeline() as pipe:
                         # 1.1 command: Uncompress file to no fucking fifo
                         if is_gzipped:
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--processes', '1',
-                                    '--stdout']
-                            pigz.extend(input_paths)
+                            pigz = self.get_decompress_command(
+                                input_paths[0], cores=1)
                             pipe.add_command(pigz)
 
                             # 2. command: Convert to fastq
@@ -42,6 +42,7 @@ class Cutadapt(AbstractStep):
         self.require_tool('mkfifo')
         # Step was tested for pigz release 2.3.1
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
 
         # Options for cutadapt
         # 1. cutadapt Options that influence how the adapters are found:
@@ -278,6 +279,12 @@ class Cutadapt(AbstractStep):
 
         self.add_option('dd-blocksize', str, optional=True, default="2M")
         self.add_option('pigz-blocksize', str, optional=True, default="2048")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, cc):
 
@@ -390,13 +397,10 @@ class Cutadapt(AbstractStep):
                                 'if=%s' % input_path
                             ]
                             # 2.2 command: Uncompress file to fifo
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--stdout']
+                            pigz = self.get_decompress_command(
+                                format=self.get_compression_format(
+                                    input_path),
+                                blocksize=self.get_option('pigz-blocksize'))
                             # 2.3 command: Write file in 4MB chunks to
                             #              fifo
                             dd_out = [
@@ -487,10 +491,10 @@ class Cutadapt(AbstractStep):
                         input_paths)
 
                     # 3.4 command: Compress output
-                    pigz = [self.get_tool('pigz'),
-                            '--processes', str(self.get_cores()),
-                            '--blocksize', self.get_option('pigz-blocksize'),
-                            '--stdout']
+                    pigz = self.get_compress_command(
+                        self.get_option('compression-format'),
+                        self.get_option('compression-level'),
+                        blocksize=self.get_option('pigz-blocksize'))
                     # 3.5 command: Write to output file in 4MB chunks
                     clipped_fastq_file = run.add_output_file(
                         "%s" % read,
@@ -30,6 +30,7 @@ class FastqSample(AbstractStep):
 
         self.require_tool('fastq-sample')
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         self.require_tool('mv')
         self.require_tool('rm')
 
@@ -57,6 +58,11 @@ class FastqSample(AbstractStep):
                         description="Seed the random number generator. "
                         "Using the same seed on the same data set will "
                         "produce the same random sample.")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True, default=9,
+                        description="Compression level of the output files.")
 
         self.possible_options = ['n', 'p', 'o', 'r', 'c', 's']
 
@@ -105,10 +111,8 @@ class FastqSample(AbstractStep):
                                 # Unzip fastq
                                 temp_file = run.add_temporary_file()
                                 pigz_decompress_eg = run.new_exec_group()
-                                pigz = [self.get_tool('pigz'),
-                                        '--processes', str(self.get_cores()),
-                                        '--decompress', '--keep',
-                                        '--stdout', input_path]
+                                pigz = self.get_decompress_command(
+                                    input_path)
 
                                 pigz_decompress_eg.add_command(
                                     pigz, stdout_path=temp_file)
@@ -143,11 +147,10 @@ class FastqSample(AbstractStep):
                                 [input_path])
 
                             pigz_compress_eg = run.new_exec_group()
-                            pigz_compress = [self.get_tool('pigz'),
-                                             '--processes',
-                                             str(self.get_cores()),
-                                             '--best', '--stdout',
-                                             outfile + '.fastq']
+                            pigz_compress = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'),
+                                path=outfile + '.fastq')
                             pigz_compress_eg.add_command(
                                 pigz_compress, stdout_path=subsample_file)
 
@@ -109,13 +109,11 @@ class FastxQualityStats(AbstractStep):
                                         'if=%s' % input_path
                                     ]
                                     # 2.2 command: Uncompress file to fifo
-                                    pigz = [self.get_tool('pigz'),
-                                            '--decompress',
-                                            '--processes',
-                                            str(self.get_cores()),
-                                            '--blocksize',
-                                            self.get_option('pigz-blocksize'),
-                                            '--stdout']
+                                    pigz = self.get_decompress_command(
+                                        format=self.get_compression_format(
+                                            input_path),
+                                        blocksize=self.get_option(
+                                            'pigz-blocksize'))
                                     # 2.3 Write file in 'dd-blocksize' chunks
                                     # to fifo
                                     dd_out = [
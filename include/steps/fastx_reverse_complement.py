@@ -1,7 +1,6 @@
 from uaperrors import StepError
 import logging
 from abstract_step import AbstractStep
-import os
 
 logger = logging.getLogger('uap_logger')
 
@@ -56,9 +55,6 @@ class FastxReverseComplement(AbstractStep):
                 elif len(input_paths) != 1:
                     raise StepError(
                         self, "Expected exactly one alignments file.")
-                else:
-                    is_gzipped = True if os.path.splitext(input_paths[0])[1]\
-                        in ['.gz', '.gzip'] else False
 
                 out = run.add_output_file(
                     "fastx",
@@ -68,17 +64,8 @@ class FastxReverseComplement(AbstractStep):
                 with run.new_exec_group() as exec_group:
                     with exec_group.add_pipeline() as pipe:
                         # 1.1 command: Uncompress file
-                        if is_gzipped:
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--processes', '1',
-                                    '--stdout']
-                            pigz.extend(input_paths)
-                            pipe.add_command(pigz)
-                        else:
-                            cat = [self.get_tool('cat')]
-                            cat.extend(input_paths)
-                            pipe.add_command(cat)
+                        pipe.add_command(
+                            self.get_decompress_command(input_paths[0]))
 
                         # 1. Run  fastx  for input file
                         fastx_revcom = [
@@ -30,6 +30,12 @@ class FixCutadapt(AbstractStep):
         # [Options for 'dd':]
         self.add_option('dd-blocksize', str, optional=True, default="2M")
         self.add_option('pigz-blocksize', str, optional=True, default="2048")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
         # Step was tested for cat (GNU coreutils) release 8.25
         self.require_tool('cat')
@@ -40,6 +46,7 @@ class FixCutadapt(AbstractStep):
         self.require_tool('mkfifo')
         # Step was tested for pigz release 2.3.1
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
 
     def runs(self, cc):
 
@@ -91,13 +98,11 @@ class FixCutadapt(AbstractStep):
                                     'if=%s' % input_paths[0]
                                 ]
                                 # 2.2 command: Uncompress file to fifo
-                                pigz = [self.get_tool('pigz'),
-                                        '--processes',
-                                        str(self.get_cores()),
-                                        '--decompress',
-                                        '--blocksize',
-                                        self.get_option('pigz-blocksize'),
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    format=self.get_compression_format(
+                                        input_paths[0]),
+                                    blocksize=self.get_option(
+                                        'pigz-blocksize'))
                                 # 2.3 Write file in 'dd-blocksize' chunks to
                                 # fifo
                                 dd_out = [
@@ -143,10 +148,10 @@ class FixCutadapt(AbstractStep):
                     cat = [self.get_tool('cat'),
                            temp_fifos["first_read_out"]]
                     # 4.2 Gzip output file
-                    pigz = [self.get_tool('pigz'),
-                            '--processes', str(self.get_cores()),
-                            '--blocksize', self.get_option('pigz-blocksize'),
-                            '--stdout']
+                    pigz = self.get_compress_command(
+                        self.get_option('compression-format'),
+                        self.get_option('compression-level'),
+                        blocksize=self.get_option('pigz-blocksize'))
                     # 4.3 command: Write to output file in 'dd-blocksize'
                     # chunks
                     fr_stdout_path = run.add_output_file(
@@ -169,12 +174,10 @@ class FixCutadapt(AbstractStep):
                         cat = [self.get_tool('cat'),
                                temp_fifos["second_read_out"]]
                         # 4.2 Gzip output file
-                        pigz = [self.get_tool('pigz'),
-                                '--processes',
-                                str(self.get_cores()),
-                                '--blocksize',
-                                self.get_option('pigz-blocksize'),
-                                '--stdout']
+                        pigz = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'),
+                            blocksize=self.get_option('pigz-blocksize'))
                         # 4.3 command: Write to output file in 'dd-blocksize'
                         # chunks
                         sr_stdout_path = run.add_output_file(
@@ -34,6 +34,7 @@ class Hisat2(AbstractStep):
                             description='Unpaired reads that aligned.')
 
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         self.require_tool('hisat2')
 
         self.add_option('index', str, optional=False,
@@ -350,6 +351,12 @@ class Hisat2(AbstractStep):
             optional=True,
             description="seed rand. gen. arbitrarily instead of \
                         using read attributes")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, cc):
         flags = [
@@ -523,6 +530,7 @@ class Hisat2(AbstractStep):
                             input_paths)
 
                         # Compress hisat2 output
-                        pigz = [self.get_tool('pigz'),
-                                '--stdout']
+                        pigz = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'))
                         hisat2_pipe.add_command(pigz, stdout_path=res)
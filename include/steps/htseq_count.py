@@ -137,13 +137,10 @@ class HtSeqCount(AbstractStep):
 
                         if is_gzipped:
                             # 2. Uncompress file to STDOUT
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--stdout']
+                            pigz = self.get_decompress_command(
+                                format=self.get_compression_format(
+                                    alignments_path),
+                                blocksize=self.get_option('pigz-blocksize'))
                             pipe.add_command(pigz)
 
                         # 3. Use samtools to generate SAM output
@@ -27,6 +27,7 @@ class MergeFastaFiles(AbstractStep):
         self.require_tool('dd')
         self.require_tool('mkfifo')
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
 
         # [Options for the merging:]
         self.add_option('compress-output', bool, optional=True, default=True,
@@ -44,6 +45,12 @@ class MergeFastaFiles(AbstractStep):
         # [Options for 'dd':]
         self.add_option('dd-blocksize', str, optional=True, default="2M")
         self.add_option('pigz-blocksize', str, optional=True, default="2048")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, run_ids_connections_files):
         run_ids = set(run_ids_connections_files.keys())
@@ -98,13 +105,11 @@ class MergeFastaFiles(AbstractStep):
                                 unzip_pipe.add_command(dd_in)
 
                                 # 2.2 command: Uncompress file to fifo
-                                pigz = [self.get_tool('pigz'),
-                                        '--decompress',
-                                        '--processes',
-                                        str(self.get_cores()),
-                                        '--blocksize',
-                                        self.get_option('pigz-blocksize'),
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    format=self.get_compression_format(
+                                        input_path),
+                                    blocksize=self.get_option(
+                                        'pigz-blocksize'))
                                 unzip_pipe.add_command(pigz)
 
                                 # 2.3 Write file in 4MB chunks to fifo
@@ -143,12 +148,10 @@ class MergeFastaFiles(AbstractStep):
                         out_file = "%s.fasta" % fasta_basename
                         if self.get_option('compress-output'):
                             out_file = "%s.fasta.gz" % fasta_basename
-                            pigz = [self.get_tool('pigz'),
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--stdout']
+                            pigz = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'),
+                                blocksize=self.get_option('pigz-blocksize'))
                             pigz_pipe.add_command(pigz)
 
                         # 3.3 command: Write to output file in 'dd-blocksize'
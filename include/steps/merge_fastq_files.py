@@ -11,7 +11,8 @@ class MergeFastqFiles(AbstractStep):
     '''
     This step concatenates all .fastq(.gz) files belonging to a certain sample.
     First and second read files are merged separately. The output files are
-    gzipped.
+    gzipped. If all input files are gzipped, they are concatenated without
+    recompressing them, unless the output is requested in BGZF.
     '''
 
     def __init__(self, pipeline):
@@ -36,10 +37,17 @@ class MergeFastqFiles(AbstractStep):
         self.require_tool('mkfifo')
         # Step was tested for pigz release 2.3.1
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
 
         # [Options for 'dd':]
         self.add_option('dd-blocksize', str, optional=True, default="2M")
         self.add_option('pigz-blocksize', str, optional=True, default="2048")
+        self.add_option('bgzf', bool, optional=True, default=False,
+                        description="Write BGZF output files. Gzipped input "
+                        "files which are not BGZF are recompressed.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, cc):
 
@@ -55,6 +63,26 @@ class MergeFastqFiles(AbstractStep):
 
                     if input_paths == [None]:
                         run.add_empty_output_connection("%s" % read)
+                    elif all(os.path.splitext(input_path)[1] in
+                             ['.gz', '.gzip'] for input_path in input_paths):
+                        # gzip members can be concatenated as they are
+                        out_path = run.add_output_file(
+                            "%s" % read,
+                            "%s%s.fastq.gz" %
+                            (run_id, read_types[read]),
+                            input_paths)
+                        concat = [self.get_tool('concat_gzip'),
+                                  '--threads', str(self.get_cores()),
+                                  '--output', out_path]
+                        if self.get_option('bgzf'):
+                            concat.append('--bgzf')
+                        if self.get_option('compression-level') is not None:
+                            concat.extend(
+                                ['--level',
+                                 str(self.get_option('compression-level'))])
+                        concat.extend(input_paths)
+                        exec_group = run.new_exec_group()
+                        exec_group.add_command(concat)
                     else:
                         temp_fifos = list()
                         exec_group = run.new_exec_group()
@@ -85,13 +113,11 @@ class MergeFastqFiles(AbstractStep):
                                         'if=%s' % input_path
                                     ]
                                     # 2.2 command: Uncompress file to fifo
-                                    pigz = [self.get_tool('pigz'),
-                                            '--processes',
-                                            str(self.get_cores()),
-                                            '--decompress',
-                                            '--blocksize',
-                                            self.get_option('pigz-blocksize'),
-                                            '--stdout']
+                                    pigz = self.get_decompress_command(
+                                        format=self.get_compression_format(
+                                            input_path),
+                                        blocksize=self.get_option(
+                                            'pigz-blocksize'))
                                     # 2.3 Write file in 'dd-blocksize' chunks
                                     # to fifo
                                     dd_out = [
@@ -131,12 +157,11 @@ class MergeFastqFiles(AbstractStep):
 
                             # 3.2 Gzip output file
                             # if self.get_option('compress-output'):
-                            pigz = [self.get_tool('pigz'),
-                                    '--processes',
-                                    str(self.get_cores()),
-                                    '--blocksize',
-                                    self.get_option('pigz-blocksize'),
-                                    '--stdout']
+                            pigz = self.get_compress_command(
+                                'bgzf' if self.get_option('bgzf')
+                                else 'gzip',
+                                self.get_option('compression-level'),
+                                blocksize=self.get_option('pigz-blocksize'))
                             pigz_pipe.add_command(pigz)
 
                             # 3.3 command: Write to output file in
@@ -12,7 +12,8 @@ class MergeFastxFiles(AbstractStep):
     '''
     This step merges all .fastq/a(.gz) files belonging to a certain sample.
     First and second read files are merged separately. The output files are
-    gzipped.
+    gzipped. Gzipped input files are concatenated without recompressing
+    them, unless the output is requested in BGZF.
     '''
 
     def __init__(self, pipeline):
@@ -28,6 +29,11 @@ class MergeFastxFiles(AbstractStep):
 
         self.require_tool('pigz')
         self.require_tool('echo')
+        self.require_tool('concat_gzip')
+
+        self.add_option('bgzf', bool, optional=True, default=False,
+                        description="Write BGZF output files. Gzipped input "
+                        "files which are not BGZF are recompressed.")
 
     def _getFastFormat(self, fast_file, is_gzipped):
 
@@ -97,38 +103,33 @@ class MergeFastxFiles(AbstractStep):
                     else:
                         exec_group = run.new_exec_group()
 
-                        # todo: outsource this as function
-                        is_gzipped = False
-                        for input_path in input_paths:
-                            file_extension = os.path.splitext(input_path)[1]
-                            is_gzipped = True if file_extension\
-                                in ['.gz', '.gzip'] else False
+                        gzipped = [os.path.splitext(input_path)[1] in
+                                   ['.gz', '.gzip']
+                                   for input_path in input_paths]
 
                         # get fast-Format from inputfile for outputfile
                         fast_format = self._getFastFormat(input_paths[0],
-                                                          is_gzipped)
+                                                          gzipped[0])
                         p_out = run.add_output_file(
                             '%s' % read,
                             "%s%s.fast%s.gz" %
                             (run_id, read_types[read], fast_format),
                             input_paths)
 
-                        if is_gzipped:
-                            with exec_group.add_pipeline() as unzip_pipe:
-                                pigz_input = [self.get_tool('pigz'),
-                                              '--decompress', '--stdout']
-                                pigz_input.extend(input_paths)
-
-                                pigz_output = [self.get_tool('pigz'),
-                                               '--stdout', '/dev/stdin']
-
-                                unzip_pipe.add_command(pigz_input)
-                                unzip_pipe.add_command(pigz_output,
-                                                       stdout_path=p_out)
+                        if any(gzipped) or self.get_option('bgzf'):
+                            # gzip members can be concatenated as they are,
+                            # uncompressed input is compressed on the way,
+                            # pigz would compress gzipped input a second time
+                            concat = [self.get_tool('concat_gzip'),
+                                      '--threads', str(self.get_cores()),
+                                      '--output', p_out]
+                            if self.get_option('bgzf'):
+                                concat.append('--bgzf')
+                            concat.extend(input_paths)
+                            exec_group.add_command(concat)
                         else:
 
-                            pigz_output = [self.get_tool('pigz'),
-                                           '--stdout']
+                            pigz_output = self.get_compress_command('gzip')
                             pigz_output.extend(input_paths)
                             exec_group.add_command(pigz_output,
                                                    stdout_path=p_out)
@@ -35,6 +35,7 @@ class Reformatcigar(AbstractStep):
         self.require_tool('pigz')
         self.require_tool('cat')
         # internal tools
+        self.require_tool('concat_gzip')
         self.require_tool('segemehl_2017_reformatCigar')
 
         # step options
@@ -51,6 +52,12 @@ class Reformatcigar(AbstractStep):
             optional=True,
             description='Blocksize to read the input file, in Megabytes.'
             'Default: 2 (2,000,000 bytes)')
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, run_ids_connections_files):
 
@@ -74,9 +81,7 @@ class Reformatcigar(AbstractStep):
                 alignments_path = input_paths[0]
 
                 #cat = [self.get_tool('cat'), alignments_path]
-                pigzD = [self.get_tool('pigz'), '--decompress',
-                         '--processes', str(self.get_cores()),
-                         '--stdout', alignments_path]
+                pigzD = self.get_decompress_command(alignments_path)
                 reformatcigar = [self.get_tool('segemehl_2017_reformatCigar'),
                                  '--in-file', '/dev/stdin']
 
@@ -88,9 +93,9 @@ class Reformatcigar(AbstractStep):
                     reformatcigar.extend(
                         ['--blocksize', str(self.get_option('blocksize'))])
 
-                pigzC = [self.get_tool('pigz'),
-                         '--processes', str(self.get_cores()),
-                         '--stdout']
+                pigzC = self.get_compress_command(
+                    self.get_option('compression-format'),
+                    self.get_option('compression-level'))
 
                 out_file = run.add_output_file(
                     'alignments', '%s-reformatCigar.sam.gz' %
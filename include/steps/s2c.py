@@ -35,6 +35,7 @@ class S2C(AbstractStep):
         self.require_tool('pigz')
         self.require_tool('cat')
         self.require_tool('dd')
+        self.require_tool('concat_gzip')
 
         self.add_option('tmp_dir', str, optional=False,
                         description="Temp directory for 's2c.py'. This can be "
@@ -47,6 +48,12 @@ class S2C(AbstractStep):
             description="specifies the maximal distance of a splice junction. "
             "junctions with disctance higher than this value are classified as "
             "fusions (default is 200.000nt)")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     def runs(self, run_ids_connections_files):
 
@@ -75,11 +82,8 @@ class S2C(AbstractStep):
                 alignments_path = input_paths[0]
                 cat = [self.get_tool('cat'), alignments_path]
 #                pigz = [self.get_tool('pigz'), '--decompress', '--processes', '1', '--stdout']
-                pigz = [self.get_tool('pigz'),
-                        '--decompress',
-                        '--processes',
-                        str(self.get_cores()),
-                        '--stdout']
+                pigz = self.get_decompress_command(
+                    format=self.get_compression_format(alignments_path))
                 s2c = [
                     self.get_tool('s2c'),
                     '-s',
@@ -92,10 +96,9 @@ class S2C(AbstractStep):
                 # schreibt .sam nach stdout
                 fix_s2c = [self.get_tool('fix_s2c')]
 #                pigz2 = [self.get_tool('pigz'), '--processes', '2', '--stdout']
-                pigz2 = [self.get_tool('pigz'),
-                         '--processes',
-                         str(self.get_cores()),
-                         '--stdout']
+                pigz2 = self.get_compress_command(
+                    self.get_option('compression-format'),
+                    self.get_option('compression-level'))
 
                 with run.new_exec_group() as exec_group:
                     with exec_group.add_pipeline() as s2c_pipe:
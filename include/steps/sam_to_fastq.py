@@ -22,10 +22,16 @@ class SamToFastq(AbstractStep):
 
         self.require_tool('samtools')
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
 
         self.add_option('F', int, optional=True)
         self.add_option('addF', int, optional=True)
         self.add_option('f', int, optional=True)
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True, default=1,
+                        description="Compression level of the output files.")
 
     def runs(self, run_ids_connections_files):
 
@@ -51,11 +57,8 @@ class SamToFastq(AbstractStep):
                     with exec_group.add_pipeline() as pipe:
                         # 1.1 command: Uncompress file to no fucking fifo
                         if is_gzipped:
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--processes', '1',
-                                    '--stdout']
-                            pigz.extend(input_paths)
+                            pigz = self.get_decompress_command(
+                                input_paths[0], cores=1)
                             pipe.add_command(pigz)
 
                             # 2. command: Convert to fastq
@@ -78,7 +81,9 @@ class SamToFastq(AbstractStep):
 
                             # 3 save fastq file
 
-                            pigzc = [self.get_tool('pigz'), '--processes', '2',
-                                     '--fast', '-']
+                            pigzc = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'),
+                                cores=2)
 
                             pipe.add_command(pigzc, stdout_path=out)
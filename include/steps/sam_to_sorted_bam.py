@@ -87,10 +87,10 @@ class SamToSortedBam(AbstractStep):
 
                         # 1.1 command: Uncompress file to fifo
                         if is_gzipped:
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--processes', '1',
-                                    '--stdout']
+                            pigz = self.get_decompress_command(
+                                cores=1,
+                                format=self.get_compression_format(
+                                    input_paths[0]))
                             pipe.add_command(pigz)
 
                         # 2. command: Convert sam to bam
@@ -127,13 +127,10 @@ class Samtools(AbstractStep):
 
                             # 1.1 command: Uncompress file to fifo
                             if is_gzipped:
-                                pigz = [self.get_tool('pigz'),
-                                        '--decompress',
-                                        '--processes',
-                                        str(self.get_cores()),
-                                        '--blocksize',
-                                        self.get_option('dd-blocksize'),
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    format=self.get_compression_format(
+                                        input_paths[0]),
+                                    blocksize=self.get_option('dd-blocksize'))
                                 pipe.add_command(pigz)
 
                             # 2. command: Convert sam to bam
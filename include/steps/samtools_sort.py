@@ -33,6 +33,7 @@ class SamtoolsSort(AbstractStep):
         self.require_tool('samtools')
         # in case of sam output to compress
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
 
         self.add_option(
             'l',
@@ -98,6 +99,13 @@ class SamtoolsSort(AbstractStep):
             optional=True,
             default='4096k',
             description='Read data with ``dd`` and set the blocksize.')
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed SAM output "
+                        "files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the SAM output "
+                        "files, the default of the tool if not set.")
 
     def runs(self, run_ids_connections_files):
         self.set_cores(self.get_option('cores'))
@@ -148,10 +156,10 @@ class SamtoolsSort(AbstractStep):
 
                             # 0.1 command: Uncompress file to fifo
                             if is_gzipped:
-                                pigz = [self.get_tool('pigz'),
-                                        '--decompress',
-                                        '--processes', '1',
-                                        '--stdout']
+                                pigz = self.get_decompress_command(
+                                    cores=1,
+                                    format=self.get_compression_format(
+                                        input_paths[0]))
                                 pipe.add_command(pigz)
                         # 1 command: Sort BAM input
                         samtools_sort = [
@@ -207,6 +215,7 @@ class SamtoolsSort(AbstractStep):
                             # output is sam needs to be compressed
                             pipe.add_command(samtools_sort)
 
-                            pigz = [self.get_tool('pigz'),
-                                    '--stdout']
+                            pigz = self.get_compress_command(
+                                self.get_option('compression-format'),
+                                self.get_option('compression-level'))
                             pipe.add_command(pigz, stdout_path=out_path)
@@ -57,6 +57,7 @@ class Segemehl(AbstractStep):
         self.require_tool('fix_qnames')
         self.require_tool('mkfifo')
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         self.require_tool('segemehl')
 
         # Options for additional programs
@@ -243,6 +244,12 @@ class Segemehl(AbstractStep):
         # [Options for 'dd':]
         self.add_option('dd-blocksize', str, optional=True, default="2M")
         self.add_option('pigz-blocksize', str, optional=True, default="2048")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     # self - macht class-funktion draus.
     # run_ids_connections_files - hash : run id -> n connections -> m files
@@ -403,12 +410,10 @@ class Segemehl(AbstractStep):
                             segemehl_pipe.add_command(fix_qnames)
 
                         # 5. Compress segemehl mapped reads
-                        pigz_mapped_reads = [
-                            self.get_tool('pigz'),
-                            '--stdout',
-                            '--blocksize', self.get_option('pigz-blocksize'),
-                            '--processes', str(self.get_cores())
-                        ]
+                        pigz_mapped_reads = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'),
+                            blocksize=self.get_option('pigz-blocksize'))
 
                         segemehl_pipe.add_command(
                             pigz_mapped_reads,
@@ -434,12 +439,10 @@ class Segemehl(AbstractStep):
                             compress_unmapped_pipe.add_command(fix_qnames)
 
                         # 7. Compress unmapped reads
-                        pigz_unmapped_reads = [
-                            self.get_tool('pigz'),
-                            '--stdout',
-                            '--blocksize', self.get_option('pigz-blocksize'),
-                            '--processes', str(self.get_cores())
-                        ]
+                        pigz_unmapped_reads = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'),
+                            blocksize=self.get_option('pigz-blocksize'))
                         compress_unmapped_pipe.add_command(
                             pigz_unmapped_reads,
                             stdout_path=run.add_output_file(
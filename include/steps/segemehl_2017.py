@@ -68,6 +68,7 @@ class Segemehl2017(AbstractStep):
         self.require_tool('fix_qnames')
         self.require_tool('mkfifo')
         self.require_tool('pigz')
+        self.require_tool('concat_gzip')
         self.require_tool('segemehl')
 
         # Options for additional programs
@@ -266,6 +267,12 @@ class Segemehl2017(AbstractStep):
 
         # [Options for 'dd':]
         self.add_option('dd-blocksize', str, optional=True, default="1M")
+        self.add_option('compression-format', str, optional=True,
+                        default='gzip', choices=['gzip', 'bgzf'],
+                        description="Format of the compressed output files.")
+        self.add_option('compression-level', int, optional=True,
+                        description="Compression level of the output files, "
+                        "the default of the tool if not set.")
 
     # self - macht class-funktion draus.
     # run_ids_connections_files - hash : run id -> n connections -> m files
@@ -440,12 +447,10 @@ class Segemehl2017(AbstractStep):
                             segemehl_pipe.add_command(fix_qnames)
 
                         # 5. Compress segemehl mapped reads
-                        pigz_mapped_reads = [
-                            self.get_tool('pigz'),
-                            '--stdout',
-                            '--blocksize', self.get_option('dd-blocksize'),
-                            '--processes', str(self.get_cores())
-                        ]
+                        pigz_mapped_reads = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'),
+                            blocksize=self.get_option('dd-blocksize'))
 
                         segemehl_pipe.add_command(
                             pigz_mapped_reads,
@@ -471,12 +476,10 @@ class Segemehl2017(AbstractStep):
                             compress_unmapped_pipe.add_command(fix_qnames)
 
                         # 7. Compress unmapped reads
-                        pigz_unmapped_reads = [
-                            self.get_tool('pigz'),
-                            '--stdout',
-                            '--blocksize', self.get_option('dd-blocksize'),
-                            '--processes', str(self.get_cores())
-                        ]
+                        pigz_unmapped_reads = self.get_compress_command(
+                            self.get_option('compression-format'),
+                            self.get_option('compression-level'),
+                            blocksize=self.get_option('dd-blocksize'))
                         compress_unmapped_pipe.add_command(
                             pigz_unmapped_reads,
                             stdout_path=run.add_output_file(
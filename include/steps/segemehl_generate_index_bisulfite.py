@@ -146,10 +146,9 @@ class SegemehlGenerateIndexBisulfite(AbstractStep):
                         if is_gzipped:
                             with exec_group.add_pipeline() as pipe:
 
-                                pigz = [
-                                    self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--stdout']
+                                pigz = self.get_decompress_command(
+                                    format=self.get_compression_format(
+                                        seq_file))
 
                                 dd_out = [
                                     self.get_tool('dd'),
@@ -1,15 +1,19 @@
-from itertools import (takewhile, repeat)
 import math
+import os
 
 from logging import getLogger
-from abstract_step import AbstractStep
+from abstract_step import AbstractStep, AbstractSourceStep
+from uaperrors import StepError
 
 logger = getLogger('uap_logger')
 
 
 class SplitFastq(AbstractStep):
     '''
-
+    Splits fastq files into files of a fixed number of reads. By default
+    every split is a run of its own. With ``single_pass`` one task per input
+    run reads the (optionally gzip or BGZF compressed) input once and writes
+    all splits, which child steps still receive as one run per split.
     '''
 
     def __init__(self, pipeline):
@@ -33,27 +37,133 @@ class SplitFastq(AbstractStep):
         self.add_option('readcount', int, optional=False,
                         description="Number of reads per targetfile")
 
-        self.add_option('outfile_count', int, optional=False,
-                        description="Number of outfiles")
+        self.add_option('outfile_count', int, optional=True,
+                        description="Number of outfiles. If not set, it is "
+                        "computed from the line count of the first read, "
+                        "which is known once its step finished or it was "
+                        "hashed. Until then no splits are declared.")
+
+        self.add_option('single_pass', bool, optional=True, default=False,
+                        description="Write all splits of a run in one task "
+                        "that reads the input only once. Child steps still "
+                        "receive one run per split.")
+
+        self.add_option('compression', int, optional=True, default=0,
+                        description="gzip level of the splits written with "
+                        "single_pass, 0 writes uncompressed files. The "
+                        "splits are compressed with all cores.")
 
         # required tools
         self.require_tool('split_fastqn')
 
-    def get_line_count(self, filename):
-        # TODO: if file is gzipped, first unzip!
-        f = open(filename, 'rb')
-        bufgen = takewhile(lambda x: x, (f.read(1024 * 1024)
-                                         for _ in repeat(None)))
-        return sum(buf.count(b'\n') for buf in bufgen)
+    def get_input_line_count(self, path):
+        '''
+        Returns the number of lines of the input *path*, recorded when it
+        was written or hashed, or None if it is not known.
+        '''
+        task = self.get_pipeline().get_task_for_file(path)
+        return task.get_run().get_line_count(path) if task else None
+
+    def get_outfile_count(self, r1):
+        '''
+        Returns the number of splits of the first read *r1* or None if it
+        depends on a line count that is known once the step which writes
+        *r1* finished.
+        '''
+        if self.is_option_set_in_config('outfile_count'):
+            return self.get_option('outfile_count')
+        lines = self.get_input_line_count(r1)
+        if lines is None:
+            task = self.get_pipeline().get_task_for_file(r1)
+            if task is not None and not os.path.exists(r1) and \
+                    not isinstance(task.step, AbstractSourceStep):
+                logger.warning(
+                    '[%s] The line count of %s is not known yet, its splits '
+                    'are declared once %s finished.' % (self, r1, task))
+                return None
+            raise StepError(
+                self, 'The line count of %s is not known. Set the option '
+                'outfile_count.' % r1)
+        reads = lines / 4.0
+        return max(1, int(math.ceil(reads / self.get_option('readcount'))))
+
+    def get_split_reads(self, r1, outfile_count):
+        '''
+        Returns the number of reads of each split of the first read *r1* or
+        None if its line count is not known.
+        '''
+        lines = self.get_input_line_count(r1)
+        if lines is None:
+            return None
+        readcount = self.get_option('readcount')
+        return [min(readcount, max(0, lines // 4 - i * readcount))
+                for i in range(outfile_count)]
+
+    @staticmethod
+    def add_read_counts(run, reads):
+        '''
+        Records the number of reads of the splits of *run*, given by output
+        file name in *reads*, as public info ``reads`` keyed by the output
+        path. Unknown counts are taken from the line counts recorded once
+        the run finished.
+        '''
+        counts = dict()
+        for file_name, count in reads.items():
+            path = os.path.join(run.get_output_directory(), file_name)
+            if count is None:
+                lines = run.get_line_count(path)
+                count = None if lines is None else lines // 4
+            if count is not None:
+                counts[path] = count
+        if counts:
+            run.add_public_info('reads', counts)
+
+    @staticmethod
+    def read_split_log(path):
+        '''
+        Returns the number of reads by split index and mate from the log
+        *path* written by a single pass or an empty dictionary if the log
+        does not exist yet.
+        '''
+        reads = dict()
+        try:
+            with open(path) as log:
+                for line in log:
+                    fields = line.split()
+                    if len(fields) == 3 and fields[0].isdigit():
+                        reads[(int(fields[0]), fields[1])] = int(fields[2])
+        except IOError:
+            pass
+        return reads
 
     def runs(self, run_ids_connections_files):
 
         self.set_cores(self.get_option('cores'))
-        outfile_count = self.get_option('outfile_count')
         readcount = self.get_option('readcount')
 
+        if self.get_option('single_pass'):
+            self.single_pass_runs(run_ids_connections_files)
+            return
+
+        # all splits of an input share the offsets of its reads, the first
+        # split builds the index in this cache, which the tool finds through
+        # the temporary output directory
+        index_dir = os.path.join(
+            self.get_pipeline().config['destination_path'], '.fastq-index')
+        if not os.path.isdir(index_dir):
+            try:
+                os.makedirs(index_dir)
+            except OSError as e:
+                logger.warning('Cannot create %s, splits read their input '
+                               'from the start: %s' % (index_dir, e))
+
         for run_id in run_ids_connections_files.keys():
 
+            r1 = run_ids_connections_files[run_id]['in/first_read'][0]
+            outfile_count = self.get_outfile_count(r1)
+            if outfile_count is None:
+                continue
+            split_reads = self.get_split_reads(r1, outfile_count)
             index_list = list(range(1, outfile_count + 1))
 
             for index in index_list:
@@ -70,22 +180,23 @@ class SplitFastq(AbstractStep):
                         input_fileset.append(r2)
                         paired_end = True
 
-                    # get lines to calculate output count
-                    # TODO: temporary take outfile count from yaml param (file_count)
-                    #line_count = self.get_line_count(r1)
-                    #outfile_count = int(math.ceil(float(line_count/4)/readcount))
-
                     # register output files
+                    reads = dict()
                     for i in range(1, outfile_count + 1):
                         if i == index:
                             file_name = '%s_%s_r1.fastq' % (new_run_id, i)
                             run.add_output_file(
                                 'first_read', file_name, input_fileset)
+                            reads[file_name] = split_reads[i - 1] \
+                                if split_reads else None
 
                             if paired_end:
                                 file_name = '%s_%s_r2.fastq' % (new_run_id, i)
                                 run.add_output_file(
                                     'second_read', file_name, input_fileset)
+                                reads[file_name] = split_reads[i - 1] \
+                                    if split_reads else None
+                    self.add_read_counts(run, reads)
 
                     stderr_file = "%s-split-log_stderr.txt" % (new_run_id)
                     log_stderr = run.add_output_file("log_stderr",
@@ -123,3 +234,62 @@ class SplitFastq(AbstractStep):
                         sf_exec_group.add_command(split_fastq_r2,
                                                   stdout_path=log_stdout,
                                                   stderr_path=log_stderr)
+
+    def single_pass_runs(self, run_ids_connections_files):
+        readcount = self.get_option('readcount')
+        compression = self.get_option('compression')
+        suffix = 'fastq.gz' if compression else 'fastq'
+
+        for run_id in run_ids_connections_files.keys():
+            r1 = run_ids_connections_files[run_id]['in/first_read'][0]
+            outfile_count = self.get_outfile_count(r1)
+            if outfile_count is None:
+                continue
+            split_reads = self.get_split_reads(r1, outfile_count)
+            with self.declare_run(run_id) as run:
+                r2 = run_ids_connections_files[run_id]['in/second_read'][0]
+                input_fileset = [r1] if r2 is None else [r1, r2]
+
+                log_stderr = run.add_output_file(
+                    "log_stderr", "%s-split-log_stderr.txt" % run_id,
+                    input_fileset)
+                # the read counts of all splits
+                log_stdout = run.add_output_file(
+                    "log_stdout", "%s-split-log_stdout.txt" % run_id,
+                    input_fileset)
+                logged_reads = dict() if split_reads else \
+                    self.read_split_log(os.path.join(
+                        run.get_output_directory(), log_stdout))
+
+                # each split is passed on as a run of its own
+                reads = dict()
+                for index in range(1, outfile_count + 1):
+                    new_run_id = '%s_%s' % (run_id, str(index))
+                    mates = ['r1'] if r2 is None else ['r1', 'r2']
+                    for mate, tag in zip(mates, ['first_read',
+                                                 'second_read']):
+                        file_name = '%s_%s_%s.%s' % (run_id, index, mate,
+                                                     suffix)
+                        run.add_output_file(tag, file_name, input_fileset,
+                                            child_run_id=new_run_id)
+                        reads[file_name] = split_reads[index - 1] \
+                            if split_reads else \
+                            logged_reads.get((index, mate))
+                self.add_read_counts(run, reads)
+
+                split_fastq = [
+                    self.get_tool('split_fastqn'),
+                    '-i', r1,
+                    '-n', str(readcount),
+                    '-c', str(outfile_count),
+                    '-o', '.',
+                    '-p', run_id,
+                    '--compress', str(compression),
+                    '-t', str(self.get_cores())
+                ]
+                if r2 is not None:
+                    split_fastq.extend(['-j', r2])
+                sf_exec_group = run.new_exec_group()
+                sf_exec_group.add_command(split_fastq,
+                                          stdout_path=log_stdout,
+                                          stderr_path=log_stderr)
@@ -77,11 +77,9 @@ class subsetMappedReads(AbstractStep):
 
                         # 1.1 command: Uncompress file to fifo
                         if is_gzipped:
-                            pigz = [self.get_tool('pigz'),
-                                    '--decompress',
-                                    '--processes', str(self.get_cores()),
-                                    '--stdout'
-                                    ]
+                            pigz = self.get_decompress_command(
+                                format=self.get_compression_format(
+                                    input_paths[0]))
                             pipe.add_command(pigz)
 
                         # 2. command: Read sam file
@@ -6,5 +6,6 @@ from . import steps
 from . import submit_to_cluster
 from . import run_info
 from . import volatilize
+from . import worker
 __all__ = ['fix_problems', 'render', 'run_locally', 'status', 'steps',
-           'submit_to_cluster', 'run_info', 'volatilize']
+           'submit_to_cluster', 'run_info', 'volatilize', 'worker']
@@ -13,25 +13,24 @@ import traceback
 import misc
 import pipeline
 import process_pool
+import resource_model
 from uaperrors import UAPError
 
 logger = logging.getLogger("uap_logger")
 
 
 def main(args):
-    p = pipeline.Pipeline(arguments=args)
+    p = None
+    if args.snapshot:
+        p = pipeline.load_snapshot(args)
+    if p is None:
+        p = pipeline.Pipeline(arguments=args)
 
     task = None
     def handle_signal(signum, frame):
         logger.warning("Catching %s!" %
                        process_pool.ProcessPool.SIGNAL_NAMES[signum])
-        p.caught_signal = signum
-        process_pool.ProcessPool.kill()
-        if task:
-            signame = process_pool.ProcessPool.SIGNAL_NAMES[signum]
-            error = 'UAP stopped because it caught signal %d - %s' % \
-                        (signum, signame)
-            log_task_error(task, error, True, True)
+        stop_task(p, task, signum)
     signal.signal(signal.SIGTERM, handle_signal)
     signal.signal(signal.SIGINT, handle_signal)
 
@@ -40,39 +39,227 @@ def main(args):
     if args.ignore:
         finished_states += [p.states.CHANGED]
 
-    accepted_states = [p.states.BAD, p.states.READY, p.states.QUEUED,
-                       p.states.VOLATILIZED]
+    if args.cores is not None:
+        if args.cores < 1:
+            raise UAPError('The number of cores needs to be a positive '
+                           'integer, not %s.' % args.cores)
+        run_in_parallel(p, p.get_task_with_list(), finished_states, args)
+        return
+
+    failed = list()
     for task in p.get_task_with_list():
-        task_state = task.get_task_state()
-        if task_state in finished_states:
-            task.move_ping_file()
-            sys.stderr.write("Skipping %s because it's already %s.\n" %
-                             (task, task_state))
-        elif task_state == p.states.VOLATILIZED and not args.run:
-            task.move_ping_file()
-            sys.stderr.write("Skipping %s because it's already %s and not "
-                             "specified as argument.\n" %
-                             (task, task_state))
-        elif task_state == p.states.CHANGED:
-            if not args.force:
-                task.move_ping_file()
-                raise UAPError(
-                    "Task %s has changed. "
-                    "Run 'uap %s status --details' to see what changed or "
-                    "'uap %s run-locally --force' to force overwrite "
-                    "of the results." %
-                    (task, args.config.name, args.config.name))
-            else:
+        try:
+            if is_task_to_run(p, task, finished_states, args):
                 check_parents_and_run(task, finished_states, args.debugging)
-        elif task_state in accepted_states:
-            check_parents_and_run(task, finished_states, args.debugging)
-        else:
+        except UAPError as e:
+            if not args.keep_going:
+                raise
+            logger.error('%s failed: %s' % (task, e))
+            failed.append(task)
+    if failed:
+        raise UAPError('%d task(s) failed: %s' %
+                       (len(failed), ', '.join(str(t) for t in failed)))
+
+
+def is_task_to_run(p, task, finished_states, args):
+    '''
+    Returns True if the task needs to be executed and False if it can be
+    skipped. Raises an UAPError if the task cannot be executed.
+    '''
+    accepted_states = [p.states.BAD, p.states.READY, p.states.QUEUED,
+                       p.states.VOLATILIZED]
+    task_state = task.get_task_state()
+    if task_state in finished_states:
+        task.move_ping_file()
+        sys.stderr.write("Skipping %s because it's already %s.\n" %
+                         (task, task_state))
+        return False
+    elif task_state == p.states.VOLATILIZED and not args.run:
+        task.move_ping_file()
+        sys.stderr.write("Skipping %s because it's already %s and not "
+                         "specified as argument.\n" %
+                         (task, task_state))
+        return False
+    elif task_state == p.states.CHANGED:
+        if not args.force:
             task.move_ping_file()
             raise UAPError(
-                "Unexpected task state for %s: %s\n"
-                "Expected state to be 'READY'. Probably an upstream "
-                "run crashed." %
-                (task, task_state))
+                "Task %s has changed. "
+                "Run 'uap %s status --details' to see what changed or "
+                "'uap %s run-locally --force' to force overwrite "
+                "of the results." %
+                (task, args.config.name, args.config.name))
+        return True
+    elif task_state in accepted_states:
+        return True
+    task.move_ping_file()
+    raise UAPError(
+        "Unexpected task state for %s: %s\n"
+        "Expected state to be 'READY'. Probably an upstream "
+        "run crashed." %
+        (task, task_state))
+
+
+def run_in_parallel(p, tasks, finished_states, args):
+    '''
+    Executes the tasks concurrently as a DAG. Each task runs in a forked
+    process as soon as all of its parent tasks in *tasks* are done and
+    enough of the core budget *args.cores* is free. Tasks on longer paths of
+    the graph, weighted by the walltimes of past runs, are started first.
+    The state of a task is determined right before it is started, just like
+    in the sequential mode.
+    After the first failure no further tasks are started and the running
+    ones are waited for, unless *args.keep_going* is set. Then only the
+    tasks that depend on a failed task are skipped.
+    '''
+    budget = args.cores
+    # tasks on the critical path first
+    pending = resource_model.sort_by_critical_path(p, tasks)
+    task_ids = set(str(task) for task in pending)
+    parents_of = dict()
+    for task in pending:
+        parents_of[str(task)] = set(
+            str(parent) for parent in task.get_parent_tasks()
+            if parent is not None and str(parent) in task_ids)
+    unfinished = set(task_ids)
+    running = dict()
+    failed = list()
+    failed_ids = set()
+    used_cores = 0
+
+    def forward_signal(signum, frame):
+        logger.warning("Catching %s! Passing it to %d running task(s)." %
+                       (process_pool.ProcessPool.SIGNAL_NAMES[signum],
+                        len(running)))
+        p.caught_signal = signum
+        for pid in running.keys():
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                # the task has just exited
+                pass
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+
+    while pending or running:
+        stop = (failed and not args.keep_going) or \
+            p.caught_signal is not None
+        for task in list(pending):
+            if stop:
+                break
+            if parents_of[str(task)] & failed_ids:
+                pending.remove(task)
+                unfinished.discard(str(task))
+                failed_ids.add(str(task))
+                failed.append((task, 'A parent task failed.'))
+                continue
+            if parents_of[str(task)] & unfinished:
+                continue
+            cores = task.get_step().get_cores()
+            if cores > budget:
+                if running:
+                    continue
+                logger.warning('%s requires %d cores but only %d are '
+                               'available. Running it exclusively.' %
+                               (task, cores, budget))
+                cores = budget
+            elif used_cores + cores > budget:
+                continue
+            pending.remove(task)
+            # drop cached states since other processes ran the parents
+            task.get_run().reset_fsc()
+            for parent in task.get_parent_tasks():
+                if parent is not None:
+                    parent.get_run().reset_fsc()
+            try:
+                start = is_task_to_run(p, task, finished_states, args)
+            except UAPError as e:
+                unfinished.discard(str(task))
+                failed_ids.add(str(task))
+                failed.append((task, str(e)))
+                if args.keep_going:
+                    continue
+                break
+            if not start:
+                unfinished.discard(str(task))
+                continue
+            pid = fork_task(p, task, finished_states, args.debugging)
+            running[pid] = (task, cores)
+            used_cores += cores
+            logger.info('Started %s as PID %d using %d of %d cores.' %
+                        (task, pid, used_cores, budget))
+
+        if not running:
+            if (failed and not args.keep_going) or \
+                    p.caught_signal is not None:
+                break
+            continue
+
+        pid, exit_status = os.wait()
+        if pid not in running:
+            continue
+        task, cores = running.pop(pid)
+        used_cores -= cores
+        unfinished.discard(str(task))
+        task.get_run().reset_fsc()
+        if os.WIFSIGNALED(exit_status):
+            failed_ids.add(str(task))
+            failed.append((task, 'Task received signal %d.' %
+                           os.WTERMSIG(exit_status)))
+        elif os.WEXITSTATUS(exit_status) != 0:
+            failed_ids.add(str(task))
+            failed.append((task, 'Task exited with code %d.' %
+                           os.WEXITSTATUS(exit_status)))
+
+    if p.caught_signal is not None:
+        signame = process_pool.ProcessPool.SIGNAL_NAMES[p.caught_signal]
+        raise UAPError('UAP stopped because it caught signal %d - %s' %
+                       (p.caught_signal, signame))
+    if failed:
+        for task, error in failed:
+            logger.error('%s failed: %s' % (task, error))
+        raise UAPError('%d task(s) failed: %s' %
+                       (len(failed), ', '.join(str(t) for t, _ in failed)))
+
+
+def fork_task(p, task, finished_states, turn_bad):
+    '''
+    Runs a task in a child process and returns its PID.
+    '''
+    pid = os.fork()
+    if pid != 0:
+        return pid
+    exit_code = 1
+    try:
+        # signals are forwarded by the scheduling process
+        os.setpgid(0, 0)
+
+        def handle_signal(signum, frame):
+            stop_task(p, task, signum)
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+        check_parents_and_run(task, finished_states, turn_bad)
+        exit_code = 0
+    except BaseException:
+        logger.debug(traceback.format_exc())
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def stop_task(p, task, signum):
+    '''
+    Kills the processes of the currently executed task after a signal was
+    caught and marks the task as bad.
+    '''
+    p.caught_signal = signum
+    process_pool.ProcessPool.kill()
+    if task:
+        signame = process_pool.ProcessPool.SIGNAL_NAMES[signum]
+        error = 'UAP stopped because it caught signal %d - %s' % \
+                    (signum, signame)
+        log_task_error(task, error, True, True)
 
 
 def check_parents_and_run(task, states, turn_bad):
@@ -152,8 +152,13 @@ def main(args):
                         raise e
                     print('%s is queued but seems to stop just now' % task)
                 else:
-                    print('%s is queued with id %s since %s' %
-                          (task, info['cluster job id'], info['submit_time']))
+                    if 'worker' in info:
+                        print('%s is claimed by worker %s since %s' %
+                              (task, info['worker'], info['submit_time']))
+                    else:
+                        print('%s is queued with id %s since %s' %
+                              (task, info['cluster job id'],
+                               info['submit_time']))
 
             elif state == p.states.VOLATILIZED:
                 print('%s was volatilized and must be re-run if the data is '
@@ -176,7 +181,9 @@ def main(args):
                     has_only_date_change = False
                     print('No annotation file.')
                 else:
-                    changes = run.get_changes()
+                    changes = None
+                    if run.has_changed_structure(anno_data):
+                        changes = run.get_changes()
                     if changes:
                         has_only_date_change = False
                         print(yaml.dump(dict(changes), Dumper=misc.UAPDumper,
@@ -6,6 +6,7 @@ import copy
 import logging
 import os
 import errno
+import math
 import re
 import subprocess
 import yaml
@@ -14,6 +15,7 @@ from tqdm import tqdm
 import abstract_step
 import fscache
 import pipeline
+import resource_model
 import submit_to_cluster_legacy
 from uaperrors import UAPError
 '''
@@ -37,6 +39,28 @@ This task wish list is now processed one by one (in topological order):
     made and there are unfinished, non-running, unqueued dependencies)
   - now add all these collected job_ids to the submission via -hold_jid
     (or whatever the argument is for the cluster used)
+
+Dependencies are resolved per task. If the queued or running parents of
+every array element are exactly the tasks of the element at the same index
+of the parent array jobs, the array elements wait for their corresponding
+parent elements (hold_jid_corresponding). Otherwise, if the cluster supports
+dependencies on single array elements (hold_jid_array_element), each task
+is submitted as its own job, but only for steps without a job quota and up
+to cluster.max_element_jobs jobs. In all other cases the whole array job
+waits for all parent jobs.
+
+With the step option _cluster_tasks_per_job, each array element executes a
+bundle of tasks with run-locally, _cluster_parallel_tasks of them at a time.
+Each task keeps its own ping files and annotation and the dependencies are
+resolved per bundle.
+
+With --predict-resources, the walltime, memory and cores of each job are
+predicted from the annotations of finished runs of the same step type and
+passed to the submit command.
+
+Steps and their tasks are submitted in the order of the longest path
+through them in the task graph, weighted by the walltimes of past runs, and
+jobs off the critical path get a lower priority (set_priority).
 '''
 
 logger = logging.getLogger("uap_logger")
@@ -109,6 +133,29 @@ def main(args):
                             "submit-to-cluster <step name>'." %
                             p.args.config.name)
 
+    model = resource_model.ResourceModel(
+        p, p.config['cluster']['resource_margin'])
+
+    # tasks on the critical path first, steps as far as their parents allow
+    path_lengths = model.get_critical_path_lengths(
+        p, [task for step_name in steps_left
+            for task in tasks_left[step_name]]) if steps_left else {}
+    for step_name in steps_left:
+        tasks_left[step_name].sort(key=lambda t: -path_lengths[str(t)])
+    step_lengths = dict((step_name, path_lengths[str(tasks[0])])
+                        for step_name, tasks in tasks_left.items() if tasks)
+    unordered_steps = list(steps_left)
+    steps_left = list()
+    while unordered_steps:
+        ready_steps = [
+            step_name for step_name in unordered_steps
+            if not any(parent.get_step_name() in unordered_steps
+                       for parent in p.get_step(step_name).dependencies)]
+        step_name = max(ready_steps, key=lambda s: step_lengths[s])
+        steps_left.append(step_name)
+        unordered_steps.remove(step_name)
+    max_length = max(step_lengths.values()) if step_lengths else 0
+
     quotas = dict()
     for line in skip_message:
         print(line)
@@ -123,12 +170,20 @@ def main(args):
     # -> during submission, there is a list of N previous job ids in
     #    which every item holds one of the previously submitted tasks
 
-    def submit_step(step_name, dependent_steps=[]):
+    def submit_step(step_name, bundles, dependent_steps=[],
+                    hold_jid='hold_jid'):
         '''
-        This method reads and modifies the necessary submit script for a given
-        step. It applies job quotas. Finally, it starts the submit command.
+        This method reads and modifies the necessary submit script for the
+        given bundles of tasks of a step, one array element per bundle. It
+        applies job quotas. Finally, it starts the submit command, which
+        makes the job wait for *dependent_steps* with the cluster option
+        *hold_jid*.
         '''
         step = p.get_step(step_name)
+        tasks = [task for bundle in bundles for task in bundle]
+        parallel_tasks = min(step._options['_cluster_parallel_tasks'],
+                             max(len(bundle) for bundle in bundles))
+        cores = step._cores * parallel_tasks
 
         ##########################
         # Assemble submit script #
@@ -164,28 +219,46 @@ def main(args):
         for placeholder, value in placeholder_values.items():
             submit_script = submit_script.replace(placeholder, value)
 
-        task_names = [str(task) for task in tasks_left[step_name]]
+        # run IDs contain no whitespace, so the tasks of a bundle are split
+        # into arguments by the shell
+        bundle_names = [' '.join(str(task) for task in bundle)
+                        for bundle in bundles]
         submit_script = submit_script.replace(
             "#{ARRAY_JOBS}", " ".join(
-                "'" + task + "'" for task in task_names))
-        submit_script = submit_script.replace("#{CORES}", str(step._cores))
+                "'" + bundle + "'" for bundle in bundle_names))
+        prediction = predict_resources(step, bundles, parallel_tasks)
+        if prediction:
+            submit_script = submit_script.replace(
+                "#{CORES}", str(prediction['cores']))
+        else:
+            submit_script = submit_script.replace("#{CORES}", str(cores))
         submit_script = submit_script.replace(
             "#{UAP_CONFIG}", yaml.dump(p.config))
 
-        command = ['exec', os.path.join(p.get_uap_path(), 'uap'), '-vv']
+        bundled = len(tasks) > len(bundles)
+        command = list()
+        if bundled:
+            # no globbing of run IDs when splitting the bundle
+            command.append('set -f;')
+        command.extend(['exec', os.path.join(p.get_uap_path(), 'uap'), '-vv'])
         if p.args.debugging:
             command.append('--debugging')
         command.extend(['<(cat <&123)', 'run-locally'])
+        command.extend(['--snapshot', "'%s'" % snapshot_path])
         if p.args.force:
             command.append('--force')
+        if bundled:
+            command.extend(['--cores', str(cores), '--keep-going'])
 
         task_id = p.get_cluster_command('array_task_id')
-        command.append('"${array_jobs[$' + task_id + ']}"')
+        if bundled:
+            command.append('${array_jobs[$' + task_id + ']}')
+        else:
+            command.append('"${array_jobs[$' + task_id + ']}"')
 
         submit_script = submit_script.replace("#{COMMAND}", ' '.join(command))
 
         # create the output directory if it doesn't exist yet
-        tasks = tasks_left[step_name]
         for task in tasks:
             run_output_dir = task.get_run().get_output_directory()
             if not os.path.isdir(run_output_dir):
@@ -203,7 +276,7 @@ def main(args):
 
         submit_script_args = [p.get_cluster_command('submit')]
         start_index = int(p.get_cluster_command('array_start_index', 0))
-        size = len(tasks) - 1 + start_index
+        size = len(bundles) - 1 + start_index
         if quotas[step_name] == 0:
             submit_script_args += p.get_cluster_command_cli_option(
                 'array_job', str(size))
@@ -221,21 +294,53 @@ def main(args):
         submit_script_args.append(p.get_cluster_command('set_stdout'))
         submit_script_args.append(out_file)
 
+        if prediction:
+            if p.get_cluster_command('set_walltime', ''):
+                submit_script_args += p.get_cluster_command_cli_option(
+                    'set_walltime', resource_model.ResourceModel.
+                    format_walltime(prediction['walltime']))
+            if p.get_cluster_command('set_memory', ''):
+                submit_script_args += p.get_cluster_command_cli_option(
+                    'set_memory',
+                    str(int(math.ceil(prediction['memory'] / 1024 ** 2))))
+
+        priority = None
+        if p.get_cluster_command('set_priority', '') and max_length > 0:
+            length = max(path_lengths[str(task)] for task in tasks)
+            priority = int(round(p.get_cluster_command('priority_lowest') *
+                                 (1 - length / max_length)))
+            submit_script_args += p.get_cluster_command_cli_option(
+                'set_priority', str(priority))
+
         if len(dependent_steps) > 0:
             submit_script_args += p.get_cluster_command_cli_option(
-                'hold_jid',
-                p.get_cluster_command('hold_jid_separator').join(dependent_steps))
+                hold_jid,
+                p.get_cluster_command('hold_jid_separator').join(
+                    sorted(dependent_steps)))
 
         ##################
         # Submit the run #
         ##################
-        sys.stdout.write(" with %s cores per job" % str(step._cores))
+        if bundled:
+            sys.stdout.write(" of %d tasks in %d bundles" %
+                             (len(tasks), len(bundles)))
+        if prediction:
+            sys.stdout.write(
+                " with %s cores, %s walltime and %d MB per job (predicted)" %
+                (prediction['cores'], resource_model.ResourceModel.
+                 format_walltime(prediction['walltime']),
+                 math.ceil(prediction['memory'] / 1024 ** 2)))
+        else:
+            sys.stdout.write(" with %s cores per job" % str(cores))
+        if priority is not None:
+            sys.stdout.write(", priority %s" % priority)
         if quotas[step_name] != 0:
             sys.stdout.write(", quota %s" % quotas[step_name])
         else:
             sys.stdout.write(", no quota")
         if dependent_steps:
-            sys.stdout.write(", dependencies %s" % ', '.join(dependent_steps))
+            sys.stdout.write(", dependencies %s" %
+                             ', '.join(sorted(dependent_steps)))
         else:
             sys.stdout.write(", no dependencies")
         # Store submit script in the run_output_dir
@@ -278,57 +383,155 @@ def main(args):
         queued_ping_info['step'] = step_name
         queued_ping_info['cluster job id'] = job_id
         queued_ping_info['submit_time'] = datetime.datetime.now()
-        for task in tasks:
-            queued_ping_info['run_id'] = task.run_id
-            ping_file = step.get_run(task.run_id).get_queued_ping_file()
-            if os.path.exists(ping_file + '.bad'):
-                os.unlink(ping_file + '.bad')
-            with open(ping_file, 'w') as f:
-                f.write(yaml.dump(queued_ping_info, default_flow_style=False))
-
-        task.get_run().reset_fsc()
+        for index, bundle in enumerate(bundles):
+            for task in bundle:
+                queued_ping_info['run_id'] = task.run_id
+                queued_ping_info['cluster array index'] = start_index + index
+                queued_ping_info['cluster array size'] = len(bundles)
+                queued_ping_info['cluster array tasks'] = \
+                    [str(t) for t in bundle]
+                ping_file = step.get_run(task.run_id).get_queued_ping_file()
+                if os.path.exists(ping_file + '.bad'):
+                    os.unlink(ping_file + '.bad')
+                with open(ping_file, 'w') as f:
+                    f.write(yaml.dump(queued_ping_info,
+                                      default_flow_style=False))
+                task.get_run().reset_fsc()
+
+    def predict_resources(step, bundles, parallel_tasks):
+        '''
+        Returns the resources predicted for an array element running the
+        largest of the *bundles*, *parallel_tasks* tasks at a time, or None
+        if they are not predicted or no prediction is possible for a task.
+        '''
+        if not args.predict_resources:
+            return None
+        predictions = list()
+        for bundle in bundles:
+            for task in bundle:
+                prediction = model.predict(task.get_run())
+                if prediction is None:
+                    return None
+                predictions.append(prediction)
+        rounds = max(math.ceil(len(bundle) / parallel_tasks)
+                     for bundle in bundles)
+        # the commands start as many threads as the step has cores, so the
+        # job must not get fewer
+        return {
+            'walltime': rounds * max(pr['walltime'] for pr in predictions),
+            'memory': parallel_tasks * max(pr['memory']
+                                           for pr in predictions),
+            'cores': parallel_tasks * max(
+                [step.get_cores()] + [pr['cores'] for pr in predictions])}
+
+    # The jobs load the pipeline from a snapshot instead of building it again
+    snapshot_path = p.write_snapshot(
+        [task for step_name in steps_left
+         for task in tasks_left[step_name]]) if steps_left else None
 
     # After defining submit_task() let's walk through steps_left
 
+    def get_parent_jobs(task):
+        '''
+        Returns the queued or running parent tasks of *task* by (job id,
+        array index, array size, tasks of the array element). Index, size
+        and tasks are None if they are unknown.
+        '''
+        parent_jobs = dict()
+        for parent_task in task.get_parent_tasks():
+            if parent_task is None:
+                continue
+            parent_state = parent_task.get_task_state()
+            if parent_state in [p.states.EXECUTING, p.states.QUEUED]:
+                # determine job_id from YAML queued ping file
+                parent_queued_ping_path = \
+                    parent_task.get_run().get_queued_ping_file()
+                try:
+                    parent_info = yaml.load(
+                        open(parent_queued_ping_path), Loader=yaml.FullLoader)
+                    element_tasks = parent_info.get('cluster array tasks')
+                    if element_tasks is not None:
+                        element_tasks = frozenset(element_tasks)
+                    parent_jobs.setdefault(
+                        (parent_info['cluster job id'],
+                         parent_info.get('cluster array index'),
+                         parent_info.get('cluster array size'),
+                         element_tasks), set()).add(str(parent_task))
+                except BaseException:
+                    print(
+                        "Couldn't determine job_id of %s while trying to load %s." %
+                        (parent_task, parent_queued_ping_path))
+                    raise
+            elif parent_state in [p.states.READY, p.states.WAITING, p.states.BAD, p.states.CHANGED]:
+                print(
+                    "Cannot submit %s because its "
+                    "parent %s is %s when it should be queued, running, "
+                    "or finished." %
+                    (task, parent_task, parent_state.lower()))
+        return parent_jobs
+
+    start_index = int(p.get_cluster_command('array_start_index', 0))
     for step_num, step_name in enumerate(steps_left):
         step = p.get_step(step_name)
         if step_name not in quotas.keys():
             quotas[step_name] = quotas['default']
             if step._options['_cluster_job_quota']:
                 quotas[step_name] = step._options['_cluster_job_quota']
-        parents = step.get_dependencies()
-        parent_job_ids = set()
-        for parent in parents:
-            for parent_task in p.tasks_in_step[parent.get_step_name()]:
-                parent_state = parent_task.get_task_state()
-                if parent_state in [p.states.EXECUTING, p.states.QUEUED]:
-                    # determine job_id from YAML queued ping file
-                    parent_job_id = None
-                    parent_queued_ping_path = parent.get_run(
-                        parent_task.run_id).get_queued_ping_file()
-                    try:
-                        parent_info = yaml.load(
-                            open(parent_queued_ping_path), Loader=yaml.FullLoader)
-                        parent_job_ids.add(parent_info['cluster job id'])
-                    except BaseException:
-                        print(
-                            "Couldn't determine job_id of %s while trying to load %s." %
-                            (parent_task, parent_queued_ping_path))
-                        raise
-                elif parent_state in [p.states.READY, p.states.WAITING, p.states.BAD, p.states.CHANGED]:
-                    print(
-                        "Cannot submit %s because its "
-                        "parent %s is %s when it should be queued, running, "
-                        "or finished." %
-                        (task, parent_task, parent_state.lower()))
-                    continue
-        sys.stdout.write(
-            "[%d/%d][%s] %s job" %
-            (step_num +
-             1,
-             len(steps_left),
-                step_name,
-                p.get_cluster_type()))
-        submit_step(step_name, parent_job_ids)
+        for option in ['_cluster_tasks_per_job', '_cluster_parallel_tasks']:
+            value = step._options[option]
+            if not isinstance(value, int) or value < 1:
+                raise UAPError('%s of %s needs to be a positive integer, '
+                               'not %s.' % (option, step_name, value))
+        tasks = tasks_left[step_name]
+        tasks_per_job = step._options['_cluster_tasks_per_job']
+        bundles = [tasks[i:i + tasks_per_job]
+                   for i in range(0, len(tasks), tasks_per_job)]
+        parent_jobs = list()
+        for bundle in bundles:
+            jobs = dict()
+            for task in bundle:
+                for job, parents in get_parent_jobs(task).items():
+                    jobs.setdefault(job, set()).update(parents)
+            parent_jobs.append(jobs)
+        parent_job_ids = set(job[0] for jobs in parent_jobs for job in jobs)
+        # do all bundles wait for exactly the tasks at their own array index
+        # of parent arrays of the same size?
+        aligned = all(index == start_index + position and
+                      size == len(bundles) and
+                      element_tasks == parents
+                      for position, jobs in enumerate(parent_jobs)
+                      for (job_id, index, size, element_tasks), parents
+                      in jobs.items())
+        per_task = any(job[1] is not None
+                       for jobs in parent_jobs for job in jobs)
+        # a job per bundle would bypass the quota of the array job
+        fan_out = quotas[step_name] == 0 and \
+            len(bundles) <= p.config['cluster']['max_element_jobs']
+        if parent_job_ids and aligned and \
+                p.get_cluster_command('hold_jid_corresponding', ''):
+            submissions = [(bundles, parent_job_ids,
+                            'hold_jid_corresponding')]
+        elif per_task and fan_out and \
+                p.get_cluster_command('hold_jid_array_element', ''):
+            element = p.get_cluster_command('hold_jid_array_element')
+            submissions = list()
+            for bundle, jobs in zip(bundles, parent_jobs):
+                job_ids = set(job_id if index is None
+                              else element % (job_id, index)
+                              for job_id, index, size, _ in jobs)
+                submissions.append(([bundle], job_ids, 'hold_jid'))
+        else:
+            submissions = [(bundles, parent_job_ids, 'hold_jid')]
+        for submission_bundles, job_ids, hold_jid in submissions:
+            sys.stdout.write(
+                "[%d/%d][%s] %s job" %
+                (step_num +
+                 1,
+                 len(steps_left),
+                    step_name,
+                    p.get_cluster_type()))
+            if len(submissions) > 1:
+                sys.stdout.write(" for %s" % submission_bundles[0][0].run_id)
+            submit_step(step_name, submission_bundles, job_ids, hold_jid)
+            sys.stdout.flush()
         step.reset_run_caches()
-        sys.stdout.flush()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import abstract_step
+import pipeline
+import process_pool
+import resource_model
+import run_locally
+from uaperrors import UAPError
+'''
+A worker executes ready tasks one after another until none is left. Any
+number of workers on any number of hosts that share the destination path
+can work on the same pipeline:
+
+- a task is claimed by creating its queued ping file exclusively
+- the claimed task is executed in a child process while the worker renews
+  the claim every PING_RENEW seconds
+- claims that have not been renewed for PING_TIMEOUT seconds are left by
+  a dead worker and are released, so the task can be claimed again
+- if no task is ready, the worker polls until the queued and executing
+  tasks it waits for are done
+- ready tasks on the critical path of the task graph are claimed first
+'''
+
+logger = logging.getLogger("uap_logger")
+
+
+def main(args):
+    p = pipeline.Pipeline(arguments=args)
+    if args.poll <= 0:
+        raise UAPError('The poll interval needs to be positive, not %s.' %
+                       args.poll)
+    worker = '%s:%d' % (socket.gethostname(), os.getpid())
+
+    finished_states = [p.states.FINISHED]
+    if args.ignore:
+        finished_states += [p.states.CHANGED]
+    claimable_states = [p.states.READY]
+    if args.force:
+        claimable_states += [p.states.CHANGED]
+
+    child = dict()
+
+    def forward_signal(signum, frame):
+        logger.warning("Catching %s!" %
+                       process_pool.ProcessPool.SIGNAL_NAMES[signum])
+        p.caught_signal = signum
+        if child.get('pid'):
+            try:
+                os.kill(child['pid'], signum)
+            except OSError:
+                # the task has just exited
+                pass
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+
+    tasks = resource_model.sort_by_critical_path(p, p.get_task_with_list())
+    failed = list()
+    while p.caught_signal is None:
+        # other workers change the files between the rounds
+        for step_name in p.topological_step_order:
+            p.get_step(step_name).reset_run_caches()
+        task, busy = claim_next_task(p, tasks, worker, claimable_states)
+        if task is None:
+            if not busy:
+                break
+            time.sleep(args.poll)
+            continue
+        logger.info('%s claimed %s.' % (worker, task))
+        if not run_claimed_task(p, task, finished_states, args, child):
+            failed.append(task)
+
+    if p.caught_signal is not None:
+        signame = process_pool.ProcessPool.SIGNAL_NAMES[p.caught_signal]
+        raise UAPError('UAP stopped because it caught signal %d - %s' %
+                       (p.caught_signal, signame))
+    if failed:
+        raise UAPError('%d task(s) failed: %s' %
+                       (len(failed), ', '.join(str(t) for t in failed)))
+    sys.stderr.write('No task left to claim for worker %s.\n' % worker)
+
+
+def claim_next_task(p, tasks, worker, claimable_states):
+    '''
+    Claims the first task of *tasks* in a claimable state and releases
+    stale claims on the way. Returns the claimed task or None and whether
+    there are queued or executing tasks that may make further tasks ready.
+    '''
+    pending = dict()
+
+    def is_pending(task):
+        # queued or executing, or waiting for such a task
+        key = str(task)
+        if key not in pending:
+            pending[key] = False
+            state = task.get_task_state()
+            if state in [p.states.QUEUED, p.states.EXECUTING]:
+                pending[key] = True
+            elif state == p.states.WAITING:
+                pending[key] = any(is_pending(parent)
+                                   for parent in task.get_parent_tasks()
+                                   if parent is not None)
+        return pending[key]
+
+    for task in tasks:
+        run = task.get_run()
+        state = task.get_task_state()
+        # a dead worker also leaves a stale execution ping file, which makes
+        # the task bad
+        if state in [p.states.QUEUED, p.states.BAD]:
+            inactivity = run.is_stale_claim()
+            claim = run.get_claim()
+            if inactivity and run.release_stale_claim():
+                logger.warning('Released the claim of %s by %s which is '
+                               'inactive since %s.' %
+                               (task, claim['worker'] if claim else
+                                'a dead worker', inactivity))
+                state = task.get_task_state()
+        if state in claimable_states and run.claim(worker, claimable_states):
+            return task, True
+    return None, any(is_pending(task) for task in tasks)
+
+
+def run_claimed_task(p, task, finished_states, args, child):
+    '''
+    Executes the claimed *task* in a child process and renews the claim
+    until it exits. Returns True if the task succeeded.
+    '''
+    queued_ping_file = task.get_run().get_queued_ping_file()
+    child['pid'] = run_locally.fork_task(p, task, finished_states,
+                                         args.debugging)
+    last_renewal = time.time()
+    while True:
+        pid, exit_status = os.waitpid(child['pid'], os.WNOHANG)
+        if pid != 0:
+            break
+        if time.time() - last_renewal >= abstract_step.AbstractStep.PING_RENEW:
+            try:
+                os.utime(queued_ping_file, None)
+            except OSError:
+                # the task has removed its claim
+                pass
+            last_renewal = time.time()
+        time.sleep(1)
+    child['pid'] = None
+    task.get_run().reset_fsc()
+    if os.WIFSIGNALED(exit_status) or os.WEXITSTATUS(exit_status) != 0:
+        logger.error('%s failed.' % task)
+        # marks the task as bad if the child did not get to do it
+        task.move_ping_file()
+        return False
+    return True
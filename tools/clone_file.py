@@ -0,0 +1,115 @@
+import argparse
+import fcntl
+import os
+import shutil
+import stat
+import sys
+seq_pipeline_path = os.path.dirname(os.path.realpath(__file__))
+activate_this_file = '%s/../python_env/bin/activate_this.py' % seq_pipeline_path
+exec(
+    compile(
+        open(activate_this_file).read(),
+        activate_this_file,
+        'exec'),
+    dict(
+        __file__=activate_this_file))
+
+'''
+Copies a file without moving its data through user space where possible.
+
+In mode auto, the output is a reflink (copy on write clone) of the input if
+the file system supports it, a hardlink if the input is read-only and an
+in-kernel copy otherwise.
+'''
+
+FICLONE = 0x40049409
+'''
+ioctl request to clone a file on Linux (Btrfs, XFS, OCFS2, ...).
+'''
+
+BLOCK_SIZE = 64 * 1024 * 1024
+'''
+Number of bytes copied per system call.
+'''
+
+MODES = ['auto', 'reflink', 'hardlink', 'copy']
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description='copies a file as reflink, hardlink or in-kernel copy'
+    )
+    parser.add_argument(
+        'infile',
+        help='file to copy'
+    )
+    parser.add_argument(
+        'outfile',
+        help='path of the copy'
+    )
+    parser.add_argument(
+        '--mode',
+        '-m',
+        choices=MODES,
+        default='auto',
+        help='auto tries reflink, hardlink for read-only input and copy in '
+        'this order (default: auto)'
+    )
+    return parser.parse_args()
+
+
+def reflink(infile, outfile):
+    with open(infile, 'rb') as fin, open(outfile, 'wb') as fout:
+        try:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        except OSError:
+            fout.close()
+            os.unlink(outfile)
+            raise
+
+
+def is_read_only(path):
+    return not os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP |
+                                        stat.S_IWOTH)
+
+
+def copy(infile, outfile):
+    with open(infile, 'rb') as fin, open(outfile, 'wb') as fout:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(fin.fileno(), fout.fileno(),
+                                         BLOCK_SIZE):
+                    pass
+                return
+            except OSError:
+                # e.g. not supported between these file systems,
+                # continue behind what has been copied already
+                pass
+        shutil.copyfileobj(fin, fout, BLOCK_SIZE)
+
+
+def main(args):
+    if os.path.lexists(args.outfile):
+        os.unlink(args.outfile)
+    if args.mode in ['auto', 'reflink']:
+        try:
+            reflink(args.infile, args.outfile)
+            return 'reflink'
+        except OSError:
+            if args.mode == 'reflink':
+                raise
+    if args.mode == 'hardlink' or \
+            (args.mode == 'auto' and is_read_only(args.infile)):
+        try:
+            os.link(args.infile, args.outfile)
+            return 'hardlink'
+        except OSError:
+            if args.mode == 'hardlink':
+                raise
+    copy(args.infile, args.outfile)
+    return 'copy'
+
+
+if __name__ == '__main__':
+    args = read_args()
+    sys.stderr.write('%s: %s\n' % (main(args), args.outfile))
@@ -0,0 +1,204 @@
+import argparse
+import concurrent.futures
+import os
+import struct
+import sys
+import zlib
+seq_pipeline_path = os.path.dirname(os.path.realpath(__file__))
+activate_this_file = '%s/../python_env/bin/activate_this.py' % seq_pipeline_path
+exec(
+    compile(
+        open(activate_this_file).read(),
+        activate_this_file,
+        'exec'),
+    dict(
+        __file__=activate_this_file))
+
+'''
+Concatenates files into one gzip file.
+
+Concatenated gzip members are a valid gzip stream, so gzip inputs are copied
+as they are without decompressing them. Uncompressed inputs are compressed.
+With --bgzf, the output is BGZF and only BGZF inputs are copied as they are.
+'''
+
+BLOCK_SIZE = 16 * 1024 * 1024
+'''
+Size of the blocks in which inputs are copied and compressed.
+'''
+
+BGZF_BLOCK_SIZE = 0xff00
+'''
+Maximal uncompressed size of a BGZF block.
+'''
+
+BGZF_HEADER = bytes.fromhex('1f8b08040000000000ff060042430200')
+'''
+Header of a BGZF block up to its size.
+'''
+
+BGZF_EOF = bytes.fromhex(
+    '1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description='concatenates files into one gzip file without '
+        'recompressing gzip input'
+    )
+    parser.add_argument(
+        'infiles',
+        nargs='+',
+        help='gzip compressed or uncompressed input files, - reads '
+        'uncompressed input from stdin'
+    )
+    parser.add_argument(
+        '--output',
+        '-o',
+        required=True,
+        help='gzip output file, - writes to stdout'
+    )
+    parser.add_argument(
+        '--bgzf',
+        '-b',
+        action='store_true',
+        help='write BGZF, gzip input which is not BGZF is recompressed'
+    )
+    parser.add_argument(
+        '--level',
+        '-l',
+        type=int,
+        default=6,
+        help='compression level for input that is compressed (default: 6)'
+    )
+    parser.add_argument(
+        '--threads',
+        '-t',
+        type=int,
+        default=1,
+        help='number of threads to compress with (default: 1)'
+    )
+    return parser.parse_args()
+
+
+def get_format(path):
+    if path == '-':
+        return 'plain'
+    with open(path, 'rb') as fin:
+        header = fin.read(14)
+    if header[:2] != b'\x1f\x8b':
+        return 'plain'
+    if len(header) == 14 and header[3] & 4 and header[12:14] == b'BC':
+        return 'bgzf'
+    return 'gzip'
+
+
+def copy_file(path, fout):
+    '''
+    Append the file at *path* to *fout* without reading it into python if
+    the kernel supports it.
+    '''
+    with open(path, 'rb') as fin:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(fin.fileno(), fout.fileno(),
+                                         BLOCK_SIZE):
+                    pass
+                return
+            except OSError:
+                # e.g. not supported between these file systems,
+                # continue behind what has been copied already
+                pass
+        while True:
+            block = fin.read(BLOCK_SIZE)
+            if not block:
+                break
+            fout.write(block)
+
+
+def compress_gzip_member(block, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+def compress_bgzf_blocks(block, level):
+    '''
+    Returns *block* compressed into BGZF blocks.
+    '''
+    out = list()
+    for start in range(0, len(block), BGZF_BLOCK_SIZE):
+        data = block[start:start + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        out.append(BGZF_HEADER)
+        out.append(struct.pack('<H', len(deflated) + 25))
+        out.append(deflated)
+        out.append(struct.pack('<II', zlib.crc32(data), len(data)))
+    return b''.join(out)
+
+
+def read_blocks(path, decompress):
+    '''
+    Yields the content of the file at *path* in blocks, decompressed if
+    *decompress* is set.
+    '''
+    with open(sys.stdin.fileno() if path == '-' else path, 'rb',
+              closefd=path != '-') as fin:
+        decompressor = zlib.decompressobj(31)
+        for block in iter(lambda: fin.read(BLOCK_SIZE), b''):
+            if not decompress:
+                yield block
+                continue
+            while block:
+                yield decompressor.decompress(block)
+                if not decompressor.eof:
+                    break
+                # the rest belongs to the next gzip member
+                block = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+
+
+def compress_file(path, fout, decompress, compress, level, executor,
+                  threads):
+    '''
+    Compress the blocks of the file at *path* on *threads* threads and
+    append them to *fout* in order.
+    '''
+    pending = list()
+    for block in read_blocks(path, decompress):
+        if not block:
+            continue
+        pending.append(executor.submit(compress, block, level))
+        if len(pending) > threads:
+            fout.write(pending.pop(0).result())
+    for future in pending:
+        fout.write(future.result())
+
+
+def main(args):
+    threads = max(args.threads, 1)
+    output = sys.stdout.fileno() if args.output == '-' else args.output
+    with open(output, 'wb', closefd=args.output != '-') as fout, \
+            concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        for path in args.infiles:
+            file_format = get_format(path)
+            if args.bgzf:
+                if file_format == 'bgzf':
+                    fout.flush()
+                    copy_file(path, fout)
+                else:
+                    compress_file(path, fout, file_format == 'gzip',
+                                  compress_bgzf_blocks, args.level,
+                                  executor, threads)
+            elif file_format == 'plain':
+                compress_file(path, fout, False, compress_gzip_member,
+                              args.level, executor, threads)
+            else:
+                fout.flush()
+                copy_file(path, fout)
+        if args.bgzf:
+            fout.write(BGZF_EOF)
+
+
+if __name__ == '__main__':
+    main(read_args())
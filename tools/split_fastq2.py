@@ -1,6 +1,12 @@
 from Bio import SeqIO
 import argparse
+import concurrent.futures
+import fcntl
+import gzip
+import hashlib
 import os
+import sys
+import zlib
 seq_pipeline_path = os.path.dirname(os.path.realpath(__file__))
 activate_this_file = '%s/../python_env/bin/activate_this.py' % seq_pipeline_path
 exec(
@@ -16,6 +22,14 @@ exec(
 '''
 
 
+BLOCK_SIZE = 16 * 1024 * 1024
+'''
+Size of the blocks in which files are scanned and copied.
+'''
+
+INDEX_MAGIC = '#uap-fastq-index'
+
+
 def read_args():
     parser = argparse.ArgumentParser(
         description='generates splits of a fastq file'
@@ -57,6 +71,52 @@ def read_args():
         nargs='?',
         help='mate1: r1, mate2: r2'
     )
+    parser.add_argument(
+        '--infile2',
+        '-j',
+        nargs='?',
+        help='second mate of the fastq input, only used without --sindex'
+    )
+    parser.add_argument(
+        '--chunks',
+        '-c',
+        type=int,
+        nargs='?',
+        help='without --sindex all splits up to this number are written '
+        'while reading the input once'
+    )
+    parser.add_argument(
+        '--compress',
+        type=int,
+        nargs='?',
+        default=0,
+        help='gzip level for the splits written without --sindex '
+        '(default: 0, uncompressed)'
+    )
+    parser.add_argument(
+        '--threads',
+        '-t',
+        type=int,
+        nargs='?',
+        default=1,
+        help='number of threads to compress with'
+    )
+    parser.add_argument(
+        '--index',
+        '-x',
+        nargs='?',
+        help='sidecar file with the byte offsets of every n-th read of the '
+        'input, it is built if missing or outdated and shared by all splits '
+        'of the same input (default: in the .fastq-index directory of the '
+        'destination path, if it exists)'
+    )
+    parser.add_argument(
+        '--index_interval',
+        type=int,
+        nargs='?',
+        help='number of reads between two offsets in the index '
+        '(default: read_count)'
+    )
 
     args = parser.parse_args()
     # TODO: catch missing args
@@ -64,6 +124,278 @@ def read_args():
     return args
 
 
+def is_gzipped(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+def get_index_header(infile, interval):
+    stat = os.stat(infile)
+    return '%s %d %d %d\n' % (INDEX_MAGIC, interval, stat.st_size,
+                              stat.st_mtime_ns)
+
+
+def read_index(f, header):
+    '''
+    Returns the offsets stored in the open index file *f* or None if the
+    index is empty or was built for another input or interval.
+    '''
+    f.seek(0)
+    try:
+        if f.readline() != header:
+            return None
+        return [int(line) for line in f]
+    except ValueError:
+        return None
+
+
+def find_newline(block, start, n):
+    '''
+    Returns the position after the *n*-th newline in *block* counted from
+    *start*. The block must contain at least *n* newlines after *start*.
+    '''
+    while True:
+        end = min(start + 65536, len(block))
+        count = block.count(b'\n', start, end)
+        if count >= n:
+            break
+        n -= count
+        start = end
+    for _ in range(n):
+        start = block.index(b'\n', start) + 1
+    return start
+
+
+def build_index(infile, interval):
+    '''
+    Scans *infile* once and returns the byte offsets of the reads
+    0, interval, 2 * interval, ...
+    '''
+    lines_per_mark = interval * 4
+    offsets = [0]
+    next_mark = lines_per_mark
+    line = 0
+    position = 0
+    with open(infile, 'rb') as fin:
+        while True:
+            block = fin.read(BLOCK_SIZE)
+            if not block:
+                break
+            start = 0
+            remaining = block.count(b'\n')
+            while line + remaining >= next_mark:
+                start = find_newline(block, start, next_mark - line)
+                remaining -= next_mark - line
+                line = next_mark
+                offsets.append(position + start)
+                next_mark += lines_per_mark
+            line += remaining
+            position += len(block)
+    return offsets
+
+
+def get_default_index_path(infile):
+    '''
+    Returns the index path of *infile* in the cache of the destination path
+    or None if there is none. uap runs the tool in its temporary output
+    directory, from which ``../..`` leads to the destination path, also if
+    the directory links to a scratch path.
+    '''
+    index_dir = os.path.join('..', '..', '.fastq-index')
+    if not os.path.isdir(index_dir):
+        return None
+    key = hashlib.sha256(os.path.realpath(infile).encode()).hexdigest()
+    return os.path.join(index_dir, key + '.idx')
+
+
+def get_index(infile, index_path, interval):
+    '''
+    Returns the offsets of *infile* from *index_path*. A missing or outdated
+    index is rebuilt by the first split that needs it while the others
+    wait for it. The index file itself is locked, so no lock file is left
+    behind.
+    '''
+    header = get_index_header(infile, interval)
+    index_dir = os.path.dirname(os.path.abspath(index_path))
+    os.makedirs(index_dir, exist_ok=True)
+    fd = os.open(index_path, os.O_RDWR | os.O_CREAT, 0o644)
+    with open(fd, 'r+') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        offsets = read_index(f, header)
+        if offsets is not None:
+            return offsets
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # another split may have built it while the lock was upgraded
+        offsets = read_index(f, header)
+        if offsets is None:
+            offsets = build_index(infile, interval)
+            f.seek(0)
+            f.truncate()
+            f.write(header)
+            f.writelines('%d\n' % offset for offset in offsets)
+            f.flush()
+            os.fsync(f.fileno())
+    return offsets
+
+
+def copy_range(fin, fout, start, end):
+    '''
+    Copies the bytes from *start* up to *end* (or up to the end of the file
+    if *end* is None) of *fin* to *fout*.
+    '''
+    fout.flush()
+    if end is None:
+        end = os.fstat(fin.fileno()).st_size
+    length = end - start
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while length > 0:
+                copied = os.copy_file_range(
+                    fin.fileno(), fout.fileno(), min(length, 1 << 30),
+                    offset_src=start)
+                if copied == 0:
+                    break
+                start += copied
+                length -= copied
+            return
+        except OSError:
+            # e.g. not supported between these file systems
+            pass
+    fin.seek(start)
+    while length > 0:
+        block = fin.read(min(length, BLOCK_SIZE))
+        if not block:
+            break
+        fout.write(block)
+        length -= len(block)
+
+
+def copy_lines(fin, fout, skip, count):
+    '''
+    Skips *skip* lines of *fin* and copies the next *count* lines to *fout*.
+    '''
+    for i, line in enumerate(fin):
+        if i >= skip + count:
+            break
+        if i >= skip:
+            fout.write(line)
+
+
+class RecordReader(object):
+    '''
+    Reads a plain or gzip (including BGZF) compressed file in blocks that
+    end at line boundaries.
+    '''
+
+    def __init__(self, path):
+        if is_gzipped(path):
+            self._file = gzip.open(path, 'rb')
+        else:
+            self._file = open(path, 'rb')
+        self._buffer = b''
+
+    def read_lines(self, n):
+        '''
+        Yields blocks which hold the next *n* lines of the file.
+        '''
+        while n > 0:
+            if not self._buffer:
+                self._buffer = self._file.read(BLOCK_SIZE)
+                if not self._buffer:
+                    return
+            count = self._buffer.count(b'\n')
+            if count < n:
+                block, self._buffer = self._buffer, b''
+                n -= count
+            else:
+                end = find_newline(self._buffer, 0, n)
+                block, self._buffer = self._buffer[:end], self._buffer[end:]
+                n = 0
+            yield block
+
+    def close(self):
+        self._file.close()
+
+
+def compress_block(block, level):
+    # every block becomes a gzip member of its own, zlib releases the GIL
+    # so blocks are compressed in parallel
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+class ChunkWriter(object):
+    '''
+    Writes blocks to a file, compressed by the *threads* of *executor* if
+    a gzip *level* is given.
+    '''
+
+    def __init__(self, path, level, executor, threads):
+        self._file = open(path, 'wb')
+        self._level = level
+        self._executor = executor
+        self._max_pending = 2 * threads
+        self._pending = list()
+        self.lines = 0
+
+    def write(self, block):
+        self.lines += block.count(b'\n')
+        if not self._level:
+            self._file.write(block)
+            return
+        self._pending.append(
+            self._executor.submit(compress_block, block, self._level))
+        # keep the order of the blocks and bound the memory in use
+        while self._pending and (self._pending[0].done() or
+                                 len(self._pending) > self._max_pending):
+            self._file.write(self._pending.pop(0).result())
+
+    def close(self):
+        for future in self._pending:
+            self._file.write(future.result())
+        self._pending = list()
+        self._file.close()
+
+
+def split_all(infiles, read_count, chunks, outpath, out_file_pattern,
+              level, threads):
+    '''
+    Reads the *infiles* (one per mate) once and writes *chunks* splits of
+    *read_count* reads of each. The read counts of the splits are printed
+    to stdout.
+    '''
+    suffix = '.fastq.gz' if level else '.fastq'
+    readers = [RecordReader(path) for path in infiles]
+    threads = max(threads, 1)
+    executor = concurrent.futures.ThreadPoolExecutor(threads)
+    print('split\tmate\treads')
+    try:
+        for index in range(1, chunks + 1):
+            reads = set()
+            for mate, reader in enumerate(readers, 1):
+                writer = ChunkWriter(
+                    '%s%s_%i_r%i%s' % (outpath, out_file_pattern, index, mate,
+                                       suffix),
+                    level, executor, threads)
+                for block in reader.read_lines(read_count * 4):
+                    writer.write(block)
+                writer.close()
+                reads.add(writer.lines // 4)
+                print('%i\tr%i\t%i' % (index, mate, writer.lines // 4))
+            if len(reads) > 1:
+                sys.exit('The mates differ in their number of reads in '
+                         'split %i.' % index)
+        for reader in readers:
+            if next(reader.read_lines(1), None) is not None:
+                sys.stderr.write('Reads after split %i are not written.\n' %
+                                 chunks)
+                break
+    finally:
+        executor.shutdown()
+        for reader in readers:
+            reader.close()
+
+
 def main(args):
     # TODO: Exception if its not a fastq
     infile = args.infile[0]
@@ -75,22 +407,47 @@ def main(args):
     if outpath != '' and outpath[-1] != '/':
         outpath += '/'
 
+    if args.sindex is None:
+        infiles = [infile]
+        if args.infile2 is not None:
+            infiles.append(args.infile2)
+        split_all(infiles, read_count, args.chunks, outpath,
+                  out_file_pattern, args.compress, args.threads)
+        return
+
     sample_index = args.sindex
     mate = args.mate
-    chunksize = read_count * 4
-
-    start = (int(sample_index) - 1) * int(chunksize)
-    with open(infile, 'r') as fin:
-        tmp_filename = outpath + \
-            "%s_%i_%s.fastq" % (out_file_pattern, int(sample_index), mate)
-        fout = open(tmp_filename, "wb")
-        for i, line in enumerate(fin):
-            if i >= start:
-                fout.write(line)
-                if (i + 1) % chunksize == 0:
-                    fout.close()
-                    break
-        fout.close()
+    interval = args.index_interval or read_count
+    index_path = args.index or get_default_index_path(infile)
+
+    first_read = (int(sample_index) - 1) * read_count
+    end_read = first_read + read_count
+    tmp_filename = outpath + \
+        "%s_%i_%s.fastq" % (out_file_pattern, int(sample_index), mate)
+    with open(tmp_filename, 'wb') as fout:
+        if is_gzipped(infile):
+            # compressed input cannot be seeked, skip to the chunk
+            with gzip.open(infile, 'rb') as fin:
+                copy_lines(fin, fout, first_read * 4, read_count * 4)
+        elif index_path is None:
+            with open(infile, 'rb') as fin:
+                copy_lines(fin, fout, first_read * 4, read_count * 4)
+        else:
+            offsets = get_index(infile, index_path, interval)
+            with open(infile, 'rb') as fin:
+                mark = first_read // interval
+                if mark < len(offsets):
+                    skip = first_read - mark * interval
+                    end_mark = end_read // interval
+                    if skip == 0 and end_mark >= len(offsets):
+                        # the chunk reaches the end of the file
+                        copy_range(fin, fout, offsets[mark], None)
+                    elif skip == 0 and end_read % interval == 0:
+                        copy_range(fin, fout, offsets[mark],
+                                   offsets[end_mark])
+                    else:
+                        fin.seek(offsets[mark])
+                        copy_lines(fin, fout, skip * 4, read_count * 4)
 
     # if last filename is empty delete
     filesize = os.path.getsize(tmp_filename)
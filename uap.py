@@ -274,6 +274,31 @@ def main():
         default=False,
         help="Ignore chages of tasks and consider them finished.")
 
+    run_locally_parser.add_argument(
+        "--cores", "--jobs",
+        dest="cores",
+        type=int,
+        default=None,
+        help="Run tasks concurrently as soon as their parent tasks have "
+        "finished,\nusing at most this many cores as requested by the steps.\n"
+        "By default all tasks are run one after another.")
+
+    run_locally_parser.add_argument(
+        "--keep-going",
+        dest="keep_going",
+        action="store_true",
+        default=False,
+        help="Continue with the tasks that do not depend on a failed task\n"
+        "instead of stopping after the first failure.")
+
+    run_locally_parser.add_argument(
+        "--snapshot",
+        dest="snapshot",
+        default=None,
+        type=str,
+        help="Load the pipeline from a snapshot written by submit-to-cluster\n"
+        "instead of building it from the configuration.")
+
     run_locally_parser.add_argument(
         "run",
         nargs='*',
@@ -430,6 +455,14 @@ def main():
         default=False,
         help="Ignore chages of tasks and consider them finished.")
 
+    submit_to_cluster_parser.add_argument(
+        "--predict-resources",
+        dest="predict_resources",
+        action="store_true",
+        default=False,
+        help="Request the walltime and memory predicted from the "
+        "annotations\nof finished runs of the same step types.")
+
     submit_to_cluster_parser.add_argument(
         "run",
         nargs='*',
@@ -494,6 +527,56 @@ def main():
 
     volatilize_parser.set_defaults(func=volatilize.main)
 
+    '''
+    The argument parser for 'worker.py' is created here."
+    '''
+
+    worker_parser = subparsers.add_parser(
+        "worker",
+        help="Executes ready tasks together with other workers.",
+        description="This command claims and executes ready tasks one after "
+        "another until no task is left.\n"
+        "Any number of workers on hosts sharing the destination path can "
+        "work on the\nsame pipeline. Claims of workers that stopped are "
+        "released after the ping\ntimeout.\n"
+        "To start a worker for the complete pipeline execute:\n"
+        "$ uap <project-config>.yaml worker\n"
+        "To work only on a specific step or run execute:\n"
+        "$ uap <project-config>.yaml worker <step_name|step/run>",
+        formatter_class=argparse.RawTextHelpFormatter,
+        parents=[common_parser])
+
+    worker_parser.add_argument(
+        "--force",
+        dest="force",
+        action="store_true",
+        default=False,
+        help="Force to overwrite changed tasks.")
+
+    worker_parser.add_argument(
+        "--ignore",
+        dest="ignore",
+        action="store_true",
+        default=False,
+        help="Ignore chages of tasks and consider them finished.")
+
+    worker_parser.add_argument(
+        "--poll",
+        dest="poll",
+        type=float,
+        default=10,
+        help="Seconds to wait before looking for ready tasks again while "
+        "other\ntasks are queued or executing (default: 10).")
+
+    worker_parser.add_argument(
+        "run",
+        nargs='*',
+        default=list(),
+        type=str,
+        help="Only these runs or the runs of these steps are claimed.")
+
+    worker_parser.set_defaults(func=worker.main)
+
     # get arguments and call the appropriate function
     args = parser.parse_args()
     # Add the path to this very file